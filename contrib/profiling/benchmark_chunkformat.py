@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+#
+# Compares the size and load time of cached diff chunks in the compact
+# chunk format against pickling the chunks as they are, using the most
+# recent files in the database. Also measures loading a 5-line excerpt,
+# as shown for a comment, through a ChunkIndex.
+#
+# Usage: benchmark_chunkformat.py [num_files] [iterations]
+
+import os
+import sys
+import time
+from cPickle import dumps, loads
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, root_dir)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'reviewboard.settings')
+
+from reviewboard.diffviewer.chunkformat import ChunkIndex, decode_chunks, \
+                                               encode_chunks
+from reviewboard.diffviewer.diffutils import get_chunks
+from reviewboard.diffviewer.models import FileDiff
+
+
+def load_chunks(num_files):
+    chunks_list = []
+
+    for filediff in FileDiff.objects.filter(binary=False) \
+                                    .select_related('diffset') \
+                                    .order_by('-pk')[:num_files]:
+        try:
+            chunks_list.append(get_chunks(filediff.diffset, filediff, None,
+                                          False, True))
+        except Exception, e:
+            sys.stderr.write("Skipping filediff %s: %s\n" % (filediff.pk, e))
+
+    return chunks_list
+
+
+def measure(name, chunks_list, encode, decode, iterations):
+    pickled = [dumps(encode(chunks)) for chunks in chunks_list]
+    size = sum([len(data) for data in pickled])
+
+    start = time.time()
+
+    for i in xrange(iterations):
+        for data in pickled:
+            decode(loads(data))
+
+    load_time = (time.time() - start) / iterations
+
+    print "%-8s %12d bytes %10.3fms to load" % (name, size,
+                                                load_time * 1000)
+
+    return size, load_time
+
+
+def measure_excerpts(chunks_list, iterations):
+    cached = []
+
+    for chunks in chunks_list:
+        index = ChunkIndex.from_chunks(chunks)
+        blocks = [dumps(index.encode_block(block))
+                  for block in xrange(index.get_num_blocks())]
+        cached.append((dumps(index.encode()), blocks, index.num_lines))
+
+    start = time.time()
+
+    for i in xrange(iterations):
+        for data, blocks, num_lines in cached:
+            index = ChunkIndex.decode(
+                loads(data),
+                lambda block_nums: [loads(blocks[block])
+                                    for block in block_nums])
+            index.get_chunks_in_range(num_lines / 2, num_lines / 2 + 5)
+
+    load_time = (time.time() - start) / iterations
+
+    print "%-8s %18s %10.3fms to load" % ("excerpt", "", load_time * 1000)
+
+
+def main():
+    if len(sys.argv) > 1:
+        num_files = int(sys.argv[1])
+    else:
+        num_files = 50
+
+    if len(sys.argv) > 2:
+        iterations = int(sys.argv[2])
+    else:
+        iterations = 10
+
+    chunks_list = load_chunks(num_files)
+
+    for chunks in chunks_list:
+        if decode_chunks(encode_chunks(chunks)) != chunks:
+            sys.stderr.write("Chunks differ after decoding\n")
+            sys.exit(1)
+
+    num_lines = sum([len(chunk['lines'])
+                     for chunks in chunks_list
+                     for chunk in chunks])
+    print "%d files, %d lines" % (len(chunks_list), num_lines)
+
+    old_size, old_time = measure("pickle", chunks_list,
+                                 lambda chunks: chunks,
+                                 lambda chunks: chunks,
+                                 iterations)
+    new_size, new_time = measure("compact", chunks_list,
+                                 encode_chunks, decode_chunks,
+                                 iterations)
+
+    measure_excerpts(chunks_list, iterations)
+
+    if new_size > 0 and new_time > 0:
+        print "%.1fx smaller, %.1fx faster to load" % \
+              (float(old_size) / new_size, old_time / new_time)
+
+
+if __name__ == '__main__':
+    main()
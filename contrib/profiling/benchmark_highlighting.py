@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+#
+# Simulates viewing every revision of a multi-revision review request, and
+# the interdiffs between them, and compares highlighting each side of each
+# diff from scratch against the lexer and highlighted file caches.
+#
+# Usage: benchmark_highlighting.py [num_revisions] [source_file ...]
+
+import os
+import random
+import sys
+import time
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, root_dir)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'reviewboard.settings')
+
+from django.conf import settings
+
+# Use a private in-memory cache, so the results don't depend on (or
+# pollute) the server's cache.
+settings.CACHE_BACKEND = 'locmem://'
+
+import pygments
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import get_lexer_for_filename
+
+from reviewboard.diffviewer import diffutils
+
+
+DEFAULT_NUM_REVISIONS = 5
+DEFAULT_SOURCE_FILES = [
+    os.path.join(root_dir, 'reviewboard', 'diffviewer', 'diffutils.py'),
+    os.path.join(root_dir, 'reviewboard', 'reviews', 'models.py'),
+    os.path.join(root_dir, 'reviewboard', 'htdocs', 'media', 'rb', 'js',
+                 'diffviewer.js'),
+]
+
+
+def make_revisions(filename, num_revisions):
+    """
+    Returns the original content of a file followed by the patched content
+    for each revision of a diff. Every revision builds on the last one,
+    changing a handful of lines, as an author would while addressing
+    reviews.
+    """
+    f = open(filename)
+    lines = f.read().splitlines(True)
+    f.close()
+
+    rand = random.Random(filename)
+    revisions = [''.join(lines)]
+
+    for i in xrange(num_revisions):
+        lines = list(lines)
+
+        for j in xrange(5):
+            linenum = rand.randint(0, len(lines) - 1)
+            lines[linenum] = lines[linenum].rstrip('\n') + '  # r%d\n' % i
+
+        revisions.append(''.join(lines))
+
+    return revisions
+
+
+def get_views(revisions):
+    """
+    Returns the (old, new) content pairs highlighted when viewing each
+    revision of the diff, and then each interdiff between consecutive
+    revisions.
+    """
+    orig = revisions[0]
+    views = [(orig, patched) for patched in revisions[1:]]
+    views += [(revisions[i], revisions[i + 1])
+              for i in xrange(1, len(revisions) - 1)]
+
+    return views
+
+
+def highlight_uncached(data, filename):
+    lexer = get_lexer_for_filename(filename, stripnl=False)
+    lexer.add_filter('codetagify')
+
+    return pygments.highlight(data, lexer, HtmlFormatter()).splitlines()
+
+
+def run(highlight, files):
+    start = time.time()
+
+    for filename, views in files:
+        for old, new in views:
+            highlight(old, filename)
+            highlight(new, filename)
+
+    return time.time() - start
+
+
+def main():
+    if len(sys.argv) > 1:
+        num_revisions = int(sys.argv[1])
+    else:
+        num_revisions = DEFAULT_NUM_REVISIONS
+
+    filenames = sys.argv[2:] or DEFAULT_SOURCE_FILES
+    files = []
+
+    for filename in filenames:
+        revisions = make_revisions(filename, num_revisions)
+        files.append((filename, get_views(revisions)))
+
+    uncached = run(highlight_uncached, files)
+    cached = run(diffutils.get_highlighted_lines, files)
+    stats = diffutils.get_highlighted_file_cache_stats()
+
+    for filename, views in files:
+        data = views[-1][1]
+
+        if (highlight_uncached(data, filename) !=
+            diffutils.get_highlighted_lines(data, filename)):
+            sys.stderr.write("Highlighted lines differ for %s\n" % filename)
+            sys.exit(1)
+
+    num_views = sum([len(views) for filename, views in files])
+
+    print "%d files, %d diff revisions, %d diffs and interdiffs viewed" % \
+          (len(files), num_revisions, num_views)
+    print "uncached: %.3fs" % uncached
+    print "cached:   %.3fs (%d of %d files highlighted)" % \
+          (cached, stats['misses'], stats['lookups'])
+
+    if cached > 0:
+        print "speedup:  %.1fx" % (uncached / cached)
+
+
+if __name__ == '__main__':
+    main()
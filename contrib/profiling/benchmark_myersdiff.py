@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+#
+# Compares MyersDiffer against FastMyersDiffer on generated files of
+# increasing size, and verifies that both produce the same opcodes.
+#
+# Usage: benchmark_myersdiff.py [size ...]
+
+import os
+import random
+import sys
+import time
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, root_dir)
+
+from reviewboard.diffviewer.fastmyersdiff import FastMyersDiffer
+from reviewboard.diffviewer.myersdiff import MyersDiffer
+
+
+DEFAULT_SIZES = [1000, 5000, 20000]
+
+# The range of lines between changes for each kind of file. Sparse changes
+# are typical of hand-edited code. Dense changes are typical of generated
+# or vendored files, and are where the snake search dominates.
+CHANGE_INTERVALS = [
+    ('sparse', 50, 500),
+    ('dense', 2, 20),
+]
+
+
+def generate_files(num_lines, min_interval, max_interval):
+    """
+    Generates an original and modified file of roughly num_lines lines.
+    The files look a bit like generated code: lots of repeated lines (blank
+    lines, braces, similar statements) with a change every min_interval to
+    max_interval lines. Changed lines are drawn from the same pool as the
+    rest of the file, so they can't simply be discarded before the search.
+    """
+    rand = random.Random(num_lines)
+    common = ['', '{', '}', '    return 0;', '    break;']
+
+    def make_line():
+        if rand.random() < 0.3:
+            return rand.choice(common)
+        else:
+            return '    value = compute(%d);' % rand.randint(0, num_lines / 3)
+
+    a = [make_line() for i in xrange(num_lines)]
+    b = list(a)
+    i = 0
+
+    while i < len(b):
+        i += rand.randint(min_interval, max_interval)
+        change = rand.randint(0, 2)
+
+        if change == 0:
+            b[i:i + rand.randint(1, 5)] = []
+        elif change == 1:
+            b[i:i] = [make_line() for j in xrange(rand.randint(1, 10))]
+        else:
+            b[i:i + 1] = [make_line()]
+
+    return a, b
+
+
+def time_differ(differ_cls, a, b):
+    start = time.time()
+    opcodes = list(differ_cls(a, b, ignore_space=True).get_opcodes())
+
+    return time.time() - start, opcodes
+
+
+def main():
+    if len(sys.argv) > 1:
+        sizes = [int(size) for size in sys.argv[1:]]
+    else:
+        sizes = DEFAULT_SIZES
+
+    print "%8s %10s %12s %12s %8s" % ("changes", "lines", "MyersDiffer",
+                                       "FastMyers", "speedup")
+
+    for name, min_interval, max_interval in CHANGE_INTERVALS:
+        for size in sizes:
+            a, b = generate_files(size, min_interval, max_interval)
+            orig_time, orig_opcodes = time_differ(MyersDiffer, a, b)
+            new_time, new_opcodes = time_differ(FastMyersDiffer, a, b)
+
+            if orig_opcodes != new_opcodes:
+                sys.stderr.write("Opcodes differ for %d lines (%s)\n" %
+                                 (size, name))
+                sys.exit(1)
+
+            if new_time > 0:
+                speedup = "%.1fx" % (orig_time / new_time)
+            else:
+                speedup = "-"
+
+            print "%8s %10d %11.3fs %11.3fs %8s" % (name, size, orig_time,
+                                                   new_time, speedup)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+#
+# Compares the in-process patcher against the `patch` program on the
+# diffviewer test data.
+#
+# Usage: benchmark_patch.py [iterations]
+
+import os
+import sys
+import time
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, root_dir)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'reviewboard.settings')
+
+from reviewboard.diffviewer.diffutils import convert_line_endings, \
+                                            patch_with_subprocess
+from reviewboard.diffviewer.patcher import apply_patch
+
+
+TESTDATA = os.path.join(root_dir, 'reviewboard', 'diffviewer', 'testdata')
+
+
+def read_file(*relative):
+    f = open(os.path.join(TESTDATA, *relative))
+    data = f.read()
+    f.close()
+    return convert_line_endings(data)
+
+
+def load_cases():
+    cases = []
+
+    for diff_name in os.listdir(os.path.join(TESTDATA, 'diffs', 'unified')):
+        orig_name = diff_name[:-len('.diff')]
+        orig_path = os.path.join(TESTDATA, 'orig_src', orig_name)
+
+        if os.path.exists(orig_path):
+            cases.append((orig_name, read_file('orig_src', orig_name),
+                          read_file('diffs', 'unified', diff_name)))
+
+    return cases
+
+
+def run(func, cases, iterations):
+    start = time.time()
+
+    for i in xrange(iterations):
+        for filename, data, diff in cases:
+            func(data, diff, filename)
+
+    return time.time() - start
+
+
+def main():
+    if len(sys.argv) > 1:
+        iterations = int(sys.argv[1])
+    else:
+        iterations = 100
+
+    cases = load_cases()
+
+    for filename, data, diff in cases:
+        if apply_patch(data, diff) != patch_with_subprocess(diff, data,
+                                                            filename):
+            sys.stderr.write("Results differ for %s\n" % filename)
+            sys.exit(1)
+
+    in_process = run(lambda data, diff, filename: apply_patch(data, diff),
+                     cases, iterations)
+    subprocess = run(lambda data, diff, filename:
+                         patch_with_subprocess(diff, data, filename),
+                     cases, iterations)
+    num_patches = iterations * len(cases)
+
+    print "%d patches applied per method" % num_patches
+    print "in-process: %.3fs (%.3fms per patch)" % \
+          (in_process, in_process * 1000 / num_patches)
+    print "patch:      %.3fs (%.3fms per patch)" % \
+          (subprocess, subprocess * 1000 / num_patches)
+
+    if in_process > 0:
+        print "speedup:    %.1fx" % (subprocess / in_process)
+
+
+if __name__ == '__main__':
+    main()
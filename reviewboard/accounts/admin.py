@@ -6,6 +6,7 @@ from django.contrib.auth.models import User
 from django.utils.translation import ugettext_lazy as _
 
 from reviewboard.accounts.models import ReviewRequestVisit, Profile
+from reviewboard.reviews.models import ReviewRequestRecipient
 
 
 USERNAME_REGEX = r'^[-\w.]+$'
@@ -47,6 +48,15 @@ class ProfileAdmin(admin.ModelAdmin):
     list_display = ('__unicode__', 'first_time_setup_done')
     raw_id_fields = ('user', 'starred_review_requests', 'starred_groups')
 
+    def save_model(self, request, obj, form, change):
+        obj.save()
+
+        # The recipients need the new starred review requests, which the
+        # admin would otherwise only save after this returns.
+        form.save_m2m()
+
+        ReviewRequestRecipient.objects.update_for_user(obj.user)
+
 
 # Get rid of the old User admin model, and replace it with our own.
 admin.site.unregister(User)
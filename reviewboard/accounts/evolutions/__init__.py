@@ -0,0 +1,3 @@
+SEQUENCE = [
+    'visit_last_review_timestamp',
+]
@@ -0,0 +1,20 @@
+from django.db import models
+
+from django_evolution.mutations import AddField, SQLMutation
+
+
+MUTATIONS = [
+    AddField('ReviewRequestVisit', 'last_review_timestamp',
+             models.DateTimeField, null=True),
+    SQLMutation('populate_visit_last_review_timestamp', ["""
+        UPDATE accounts_reviewrequestvisit
+           SET last_review_timestamp = (
+               SELECT MAX(reviews_review.timestamp)
+                 FROM reviews_review
+                WHERE reviews_review.review_request_id =
+                      accounts_reviewrequestvisit.review_request_id
+                  AND reviews_review.public
+                  AND reviews_review.user_id !=
+                      accounts_reviewrequestvisit.user_id)
+"""])
+]
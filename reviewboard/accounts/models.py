@@ -6,7 +6,8 @@ from django.utils.translation import ugettext_lazy as _
 
 from djblets.util.db import ConcurrencyManager
 
-from reviewboard.reviews.models import Group, ReviewRequest
+from reviewboard.reviews.models import Group, ReviewRequest, Review
+from reviewboard.reviews.signals import review_published, reply_published
 
 
 class ReviewRequestVisit(models.Model):
@@ -22,6 +23,13 @@ class ReviewRequestVisit(models.Model):
     review_request = models.ForeignKey(ReviewRequest, related_name="visits")
     timestamp = models.DateTimeField(_('last visited'), default=datetime.now)
 
+    # The time of the latest public review or reply made on the review
+    # request by anyone other than this user. This is kept up to date when
+    # reviews are published, so that checking for new updates only needs
+    # to compare the two timestamps.
+    last_review_timestamp = models.DateTimeField(_('last review by others'),
+                                                 null=True, blank=True)
+
     # Set this up with a ConcurrencyManager to help prevent race conditions.
     objects = ConcurrencyManager()
 
@@ -83,3 +91,26 @@ class Profile(models.Model):
 
     def __unicode__(self):
         return self.user.username
+
+
+def update_visits_for_review(review):
+    """
+    Records a newly published review or reply on the visits of everyone
+    other than its author, so that they'll see the review request as having
+    new updates.
+    """
+    ReviewRequestVisit.objects.filter(
+        review_request=review.review_request_id).exclude(
+        user=review.user_id).update(last_review_timestamp=review.timestamp)
+
+
+def review_published_cb(sender, user, review, **kwargs):
+    update_visits_for_review(review)
+
+
+def reply_published_cb(sender, user, reply, **kwargs):
+    update_visits_for_review(reply)
+
+
+review_published.connect(review_published_cb, sender=Review)
+reply_published.connect(reply_published_cb, sender=Review)
@@ -13,6 +13,7 @@ from djblets.siteconfig.models import SiteConfiguration
 
 from reviewboard.accounts.forms import PreferencesForm
 from reviewboard.accounts.models import Profile
+from reviewboard.reviews.models import ReviewRequestRecipient
 
 
 def account_register(request):
@@ -63,6 +64,7 @@ def user_preferences(request, template_name='accounts/prefs.html'):
 
             request.user.review_groups = form.cleaned_data['groups']
             request.user.save()
+            ReviewRequestRecipient.objects.update_for_user(request.user)
 
             profile.first_time_setup_done = True
             profile.syntax_highlighting = \
@@ -124,15 +124,16 @@ def reset_check_cache():
     _install_fine = False
 
 
-def get_can_enable_search():
-    """Checks whether the search functionality can be enabled."""
+def get_can_use_lucene_search():
+    """Checks whether the Lucene search backend can be used."""
     try:
         imp.find_module("lucene")
         return (True, None)
     except ImportError:
         return (False, _(
-            'PyLucene (with JCC) is required to enable search. See the '
-            '<a href="%(url)s">documentation</a> for instructions.'
+            'PyLucene (with JCC) is required to use the Lucene search '
+            'backend. See the <a href="%(url)s">documentation</a> for '
+            'instructions.'
         ) % {'url': 'http://www.reviewboard.org/docs/manual/dev/admin/'
                     'sites/enabling-search/'})
 
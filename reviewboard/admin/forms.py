@@ -39,11 +39,12 @@ import pytz
 
 from reviewboard.admin.checks import get_can_enable_dns, \
                                      get_can_enable_ldap, \
-                                     get_can_enable_search, \
+                                     get_can_use_lucene_search, \
                                      get_can_enable_syntax_highlighting, \
                                      get_can_use_amazon_s3, \
                                      get_can_use_couchdb
 from reviewboard.admin.siteconfig import load_site_config
+from reviewboard.reviews.search import SEARCH_BACKENDS
 
 
 class GeneralSettingsForm(SiteSettingsForm):
@@ -82,12 +83,30 @@ class GeneralSettingsForm(SiteSettingsForm):
                     "and diffs without logging in."),
         required=False)
 
+    site_long_poll_updates = forms.BooleanField(
+        label=_("Show updates as soon as they're published"),
+        help_text=_("If checked, open review request pages will keep a "
+                    "connection to the server in order to be told about "
+                    "new reviews and updates right away, rather than "
+                    "checking every few minutes. This requires a web "
+                    "server that can handle many connections at once."),
+        required=False)
+
     search_enable = forms.BooleanField(
         label=_("Enable search"),
         help_text=_("Provides a search field for quickly searching through "
                     "review requests."),
         required=False)
 
+    search_backend = forms.ChoiceField(
+        label=_("Search backend"),
+        choices=[(name, description)
+                 for name, description, class_path in SEARCH_BACKENDS],
+        help_text=_("The search index to use. The built-in one needs "
+                    "nothing else installed. After changing this, the "
+                    "index must be rebuilt with 'manage.py index --full'."),
+        required=True)
+
     search_index_file = forms.CharField(
         label=_("Search index file"),
         help_text=_("The file that search index data should be stored in."),
@@ -256,11 +275,13 @@ class GeneralSettingsForm(SiteSettingsForm):
         self.fields['custom_backends'].initial = \
             ', '.join(self.siteconfig.get('auth_custom_backends'))
 
-        can_enable_search, reason = get_can_enable_search()
-        if not can_enable_search:
-            self.disabled_fields['search_enable'] = True
-            self.disabled_fields['search_index_file'] = True
-            self.disabled_reasons['search_enable'] = reason
+        can_use_lucene, reason = get_can_use_lucene_search()
+        if not can_use_lucene:
+            self.fields['search_backend'].choices = [
+                (name, description)
+                for name, description in self.fields['search_backend'].choices
+                if name != 'lucene'
+            ]
 
         can_enable_dns, reason = get_can_enable_dns()
         if not can_enable_dns:
@@ -379,12 +400,14 @@ class GeneralSettingsForm(SiteSettingsForm):
                             'site_admin_name',
                             'site_admin_email',
                             'locale_timezone',
-                            'auth_anonymous_access'),
+                            'auth_anonymous_access',
+                            'site_long_poll_updates'),
             },
             {
                 'classes': ('wide',),
                 'title':   _("Search"),
-                'fields':  ('search_enable', 'search_index_file'),
+                'fields':  ('search_enable', 'search_backend',
+                            'search_index_file'),
             },
             {
                 'classes': ('wide',),
@@ -489,10 +512,18 @@ class DiffSettingsForm(SiteSettingsForm):
         label=_("Show syntax highlighting"),
         required=False)
 
+    diffviewer_incremental_highlighting = forms.BooleanField(
+        label=_("Only highlight visible lines"),
+        help_text=_("Highlight only the changed lines and the lines around "
+                    "them. Collapsed lines are highlighted when they're "
+                    "expanded. This keeps large files fast to display."),
+        required=False)
+
     diffviewer_syntax_highlighting_threshold = forms.IntegerField(
         label=_("Syntax highlighting threshold"),
         help_text=_("Files with lines greater than this number will not have "
-                    "syntax highlighting.  Enter 0 for no limit."),
+                    "syntax highlighting.  Enter 0 for no limit. This only "
+                    "applies when all lines are highlighted."),
         required=False)
 
     diffviewer_show_trailing_whitespace = forms.BooleanField(
@@ -527,6 +558,29 @@ class DiffSettingsForm(SiteSettingsForm):
                     "page to the diff viewer."),
         initial=10)
 
+    diffviewer_warmup_enable = forms.BooleanField(
+        label=_("Generate diffs in the background"),
+        help_text=_("Generate the diff viewer's content for new diffs as "
+                    "soon as they're uploaded, instead of when they're first "
+                    "viewed."),
+        required=False)
+
+    diffviewer_warmup_workers = forms.IntegerField(
+        label=_("Background diff workers"),
+        help_text=_("The number of diff files that can be generated in the "
+                    "background at once by each server process. Changes "
+                    "take effect when the server is restarted."),
+        min_value=1,
+        initial=4)
+
+    diffviewer_warmup_repository_workers = forms.IntegerField(
+        label=_("Background diff workers per repository"),
+        help_text=_("The number of background workers that can fetch files "
+                    "from the same repository at once. Changes take effect "
+                    "when the server is restarted."),
+        min_value=1,
+        initial=2)
+
     def load(self):
         # TODO: Move this check into a dependencies module so we can catch it
         #       when the user starts up Review Board.
@@ -537,6 +591,8 @@ class DiffSettingsForm(SiteSettingsForm):
             self.disabled_reasons['diffviewer_syntax_highlighting'] = _(reason)
             self.disabled_fields['diffviewer_syntax_highlighting_threshold'] = True
             self.disabled_reasons['diffviewer_syntax_highlighting_threshold'] = _(reason)
+            self.disabled_fields['diffviewer_incremental_highlighting'] = True
+            self.disabled_reasons['diffviewer_incremental_highlighting'] = _(reason)
 
         self.fields['include_space_patterns'].initial = \
             ', '.join(self.siteconfig.get('diffviewer_include_space_patterns'))
@@ -558,6 +614,7 @@ class DiffSettingsForm(SiteSettingsForm):
                 'title': _("General"),
                 'classes': ('wide',),
                 'fields': ('diffviewer_syntax_highlighting',
+                           'diffviewer_incremental_highlighting',
                            'diffviewer_syntax_highlighting_threshold',
                            'diffviewer_show_trailing_whitespace',
                            'include_space_patterns'),
@@ -572,7 +629,10 @@ class DiffSettingsForm(SiteSettingsForm):
                 'classes': ('wide',),
                 'fields': ('diffviewer_context_num_lines',
                            'diffviewer_paginate_by',
-                           'diffviewer_paginate_orphans')
+                           'diffviewer_paginate_orphans',
+                           'diffviewer_warmup_enable',
+                           'diffviewer_warmup_workers',
+                           'diffviewer_warmup_repository_workers')
             }
         )
 
@@ -40,7 +40,7 @@ from djblets.siteconfig.django_settings import apply_django_settings, \
                                                get_django_settings_map
 from djblets.siteconfig.models import SiteConfiguration
 
-from reviewboard.admin.checks import get_can_enable_search, \
+from reviewboard.admin.checks import get_can_use_lucene_search, \
                                      get_can_enable_syntax_highlighting
 
 
@@ -129,10 +129,20 @@ defaults.update({
     'diffviewer_paginate_orphans':         10,
     'diffviewer_syntax_highlighting':      True,
     'diffviewer_syntax_highlighting_threshold': 0,
+    'diffviewer_incremental_highlighting': True,
     'diffviewer_show_trailing_whitespace': True,
+    'diffviewer_warmup_enable':            True,
+    'diffviewer_warmup_workers':           4,
+    'diffviewer_warmup_repository_workers': 2,
     'mail_send_review_mail':               False,
     'search_enable':                       False,
+
+    # Sites that already have PyLucene keep using their Lucene index.
+    'search_backend': (get_can_use_lucene_search()[0] and 'lucene' or
+                       'builtin'),
+
     'site_domain_method':                  'http',
+    'site_long_poll_updates':              False,
 
     # TODO: Allow relative paths for the index file later on.
     'search_index_file': os.path.join(settings.REVIEWBOARD_ROOT,
@@ -195,8 +205,9 @@ def load_site_config():
     # Now for some more complicated stuff...
 
     # Do some dependency checks and disable things if we don't support them.
-    if not get_can_enable_search()[0]:
-        siteconfig.set('search_enable', False)
+    if (siteconfig.get('search_backend') == 'lucene' and
+        not get_can_use_lucene_search()[0]):
+        siteconfig.set('search_backend', 'builtin')
 
     if not get_can_enable_syntax_highlighting()[0]:
         siteconfig.set('diffviewer_syntax_highlighting', False)
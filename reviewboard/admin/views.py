@@ -10,7 +10,11 @@ from djblets.siteconfig.views import site_settings as djblets_site_settings
 
 from reviewboard.admin.checks import check_updates_required
 from reviewboard.admin.cache_stats import get_cache_stats, get_has_cache_stats
+from reviewboard.diffviewer.diffutils import \
+    get_highlighted_file_cache_stats, get_patched_file_cache_stats
 from reviewboard.reviews.models import Group, DefaultReviewer
+from reviewboard.reviews.search.core import get_searcher_manager_stats
+from reviewboard.scmtools.git import get_cat_file_pool_stats
 from reviewboard.scmtools.models import Repository
 
 
@@ -42,6 +46,10 @@ def cache_stats(request, template_name="admin/cache_stats.html"):
     return render_to_response(template_name, RequestContext(request, {
         'cache_hosts': cache_stats,
         'cache_backend': cache.__module__,
+        'patched_file_stats': get_patched_file_cache_stats(),
+        'highlighted_file_stats': get_highlighted_file_cache_stats(),
+        'git_cat_file_stats': get_cat_file_pool_stats(),
+        'search_stats': get_searcher_manager_stats(),
         'title': _("Server Cache"),
         'root_path': settings.SITE_ROOT + "admin/db/"
     }))
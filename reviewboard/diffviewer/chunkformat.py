@@ -0,0 +1,563 @@
+"""
+A compact encoding for the diff chunks generated by diffutils.get_chunks,
+used when storing them in the cache.
+
+Chunks are stored column by column, rather than as a list of lists per
+line:
+
+* Line numbers are stored as runs of consecutive numbers.
+* Markup is stored once in a table of unique strings, and lines refer to
+  it by index. Unchanged lines share their markup between both sides of
+  the diff, and common lines like blank lines and braces are only stored
+  once.
+* Changed regions are stored in a single list of integers, with runs of
+  lines that have no regions collapsed into one entry.
+
+Integers are stored as packed little-endian arrays.
+
+The lines of a file's chunks can also be split into blocks that are stored
+separately, along with a ChunkIndex used to find them. This allows a few
+lines to be loaded without loading the whole file.
+"""
+
+import sys
+from array import array
+from bisect import bisect_right
+
+from django.utils.safestring import mark_safe
+
+
+# The version of the encoding. This must be bumped whenever the encoding
+# (or the chunk structure from get_chunks) changes. It's part of the chunk
+# cache keys, so chunks stored by an older version are never loaded.
+CHUNK_FORMAT_VERSION = 2
+
+
+class ChunkFormatError(ValueError):
+    """An error indicating that encoded chunks couldn't be decoded."""
+    pass
+
+
+def _pack(values):
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+
+    return values.tostring()
+
+
+def _unpack(data):
+    values = array('i')
+    values.fromstring(data)
+
+    if sys.byteorder != 'little':
+        values.byteswap()
+
+    return values
+
+
+def _encode_line_numbers(linenums):
+    """
+    Encodes a column of line numbers as (first, count) runs of consecutive
+    numbers. Missing line numbers ('') are stored as runs of 0.
+    """
+    runs = array('i')
+    first = None
+    count = 0
+
+    for linenum in linenums:
+        linenum = linenum or 0
+
+        if count and ((first == 0 and linenum == 0) or
+                      (first != 0 and linenum == first + count)):
+            count += 1
+        else:
+            if count:
+                runs.append(first)
+                runs.append(count)
+
+            first = linenum
+            count = 1
+
+    if count:
+        runs.append(first)
+        runs.append(count)
+
+    return _pack(runs)
+
+
+def _decode_line_numbers(data):
+    runs = _unpack(data)
+    linenums = []
+
+    for i in xrange(0, len(runs), 2):
+        first = runs[i]
+        count = runs[i + 1]
+
+        if first == 0:
+            linenums.extend([''] * count)
+        else:
+            linenums.extend(xrange(first, first + count))
+
+    return linenums
+
+
+def _encode_regions(regions_list):
+    """
+    Encodes a column of changed regions. Each line is stored as the number
+    of regions followed by their start and end offsets, a run of n lines
+    with no regions is stored as -n, and None is stored as 0.
+    """
+    values = array('i')
+    empty_run = 0
+
+    for regions in regions_list:
+        if regions is not None and len(regions) == 0:
+            empty_run += 1
+            continue
+
+        if empty_run:
+            values.append(-empty_run)
+            empty_run = 0
+
+        if regions is None:
+            values.append(0)
+        else:
+            values.append(len(regions))
+
+            for start, end in regions:
+                values.append(start)
+                values.append(end)
+
+    if empty_run:
+        values.append(-empty_run)
+
+    return _pack(values)
+
+
+def _decode_regions(data):
+    values = _unpack(data)
+    regions_list = []
+    i = 0
+
+    while i < len(values):
+        value = values[i]
+        i += 1
+
+        if value < 0:
+            for j in xrange(-value):
+                regions_list.append([])
+        elif value == 0:
+            regions_list.append(None)
+        else:
+            regions = []
+
+            for j in xrange(value):
+                regions.append((values[i], values[i + 1]))
+                i += 2
+
+            regions_list.append(regions)
+
+    return regions_list
+
+
+def encode_lines(lines):
+    """
+    Encodes a list of chunk lines into a compact form that can be pickled
+    quickly.
+    """
+    columns = [[] for i in xrange(8)]
+
+    for line in lines:
+        for i in xrange(8):
+            columns[i].append(line[i])
+
+    # Build the table of unique markup strings. Markup never contains
+    # newlines, since it's split on them when it's generated, so the table
+    # is stored as a single newline-separated string.
+    strings = {u'': 0}
+    string_table = [u'']
+    markup_indexes = []
+
+    for markup_column in (columns[2], columns[5]):
+        indexes = array('i')
+
+        for markup in markup_column:
+            if isinstance(markup, str):
+                markup = markup.decode('utf-8')
+            else:
+                markup = unicode(markup)
+
+            try:
+                index = strings[markup]
+            except KeyError:
+                index = len(string_table)
+                strings[markup] = index
+                string_table.append(markup)
+
+            indexes.append(index)
+
+        markup_indexes.append(_pack(indexes))
+
+    whitespace_lines = array('i', [i for i, is_whitespace
+                                   in enumerate(columns[7])
+                                   if is_whitespace])
+
+    return (
+        len(lines),
+        _encode_line_numbers(columns[0]),
+        _encode_line_numbers(columns[1]),
+        _encode_line_numbers(columns[4]),
+        markup_indexes[0],
+        markup_indexes[1],
+        _encode_regions(columns[3]),
+        _encode_regions(columns[6]),
+        _pack(whitespace_lines),
+        u'\n'.join(string_table).encode('utf-8'),
+    )
+
+
+def decode_lines(data):
+    """
+    Decodes a list of chunk lines encoded by encode_lines. A
+    ChunkFormatError is raised if the data is unreadable.
+    """
+    if not isinstance(data, tuple) or len(data) != 10:
+        raise ChunkFormatError("Unknown diff chunk line format")
+
+    num_lines = data[0]
+
+    try:
+        string_table = [mark_safe(markup)
+                        for markup in data[9].decode('utf-8').split(u'\n')]
+        whitespace_lines = [False] * num_lines
+
+        for i in _unpack(data[8]):
+            whitespace_lines[i] = True
+
+        columns = [
+            _decode_line_numbers(data[1]),
+            _decode_line_numbers(data[2]),
+            [string_table[i] for i in _unpack(data[4])],
+            _decode_regions(data[6]),
+            _decode_line_numbers(data[3]),
+            [string_table[i] for i in _unpack(data[5])],
+            _decode_regions(data[7]),
+            whitespace_lines,
+        ]
+    except (IndexError, TypeError, UnicodeError, ValueError), e:
+        raise ChunkFormatError("Invalid diff chunk data: %s" % e)
+
+    for column in columns:
+        if len(column) != num_lines:
+            raise ChunkFormatError("Invalid diff chunk data: expected %d "
+                                   "lines, got %d" % (num_lines, len(column)))
+
+    return map(list, zip(*columns))
+
+
+def _get_chunk_info(chunks):
+    chunk_info = []
+
+    for chunk in chunks:
+        info = chunk.copy()
+        del info['lines']
+        chunk_info.append((len(chunk['lines']), info))
+
+    return chunk_info
+
+
+def encode_chunks(chunks):
+    """
+    Encodes a list of chunks, as returned by get_chunks, into a compact
+    form that can be pickled quickly.
+    """
+    lines = []
+
+    for chunk in chunks:
+        lines += chunk['lines']
+
+    return (CHUNK_FORMAT_VERSION, _get_chunk_info(chunks), encode_lines(lines))
+
+
+def decode_chunks(data):
+    """
+    Decodes chunks encoded by encode_chunks. A ChunkFormatError is raised
+    if the data is from a different version of the encoding, or is
+    otherwise unreadable.
+    """
+    if (not isinstance(data, tuple) or len(data) != 3 or
+        data[0] != CHUNK_FORMAT_VERSION):
+        raise ChunkFormatError("Unknown diff chunk format")
+
+    lines = decode_lines(data[2])
+    chunks = []
+    i = 0
+
+    for count, info in data[1]:
+        chunk = info.copy()
+        chunk['lines'] = lines[i:i + count]
+        chunks.append(chunk)
+        i += count
+
+    if i != len(lines):
+        raise ChunkFormatError("Invalid diff chunk data: expected %d lines, "
+                               "got %d" % (i, len(lines)))
+
+    return chunks
+
+
+class ChunkIndex(object):
+    """
+    An index of the chunks of a file, for loading some of their lines
+    without loading all of them.
+
+    The lines of all the chunks are split into blocks, which are encoded
+    with encode_lines and stored separately. The index itself only holds
+    the chunk information and the line each block starts at, so it's
+    cheap to load. Blocks are loaded as they're needed, by calling
+    load_blocks with a list of block numbers. It must return the encoded
+    blocks, in the same order.
+
+    If the blocks can't be loaded, because they're unreadable or no longer
+    match the index, reload_index is called to build a new index with all
+    of its blocks loaded, which then takes the place of this one. Without
+    reload_index, a ChunkFormatError is raised instead.
+
+    Lines are numbered by their offset into the file's chunks, which is one
+    less than their virtual line number.
+    """
+    BLOCK_SIZE = 500
+    MAX_BLOCK_BYTES = 256 * 1024
+
+    def __init__(self, chunk_info, block_starts, num_lines,
+                 load_blocks=None, reload_index=None):
+        self.chunk_info = chunk_info
+        self.block_starts = block_starts
+        self.num_lines = num_lines
+        self.load_blocks = load_blocks
+        self.reload_index = reload_index
+
+        self._blocks = {}
+        self._chunk_starts = []
+        linenum = 0
+
+        for count, info in chunk_info:
+            self._chunk_starts.append(linenum)
+            linenum += count
+
+        if linenum != num_lines:
+            raise ChunkFormatError("Invalid diff chunk index: expected %d "
+                                   "lines, got %d" % (num_lines, linenum))
+
+    def from_chunks(cls, chunks):
+        """
+        Returns an index for a list of chunks, with all of its blocks loaded.
+        """
+        lines = []
+
+        for chunk in chunks:
+            lines += chunk['lines']
+
+        # Blocks end after BLOCK_SIZE lines, or before a line that would
+        # take them over MAX_BLOCK_BYTES of markup, so that each block fits
+        # in a single cache entry. A line that's larger than that on its
+        # own gets a block to itself.
+        block_starts = []
+        block_bytes = 0
+
+        for i, line in enumerate(lines):
+            line_bytes = len(line[2]) + len(line[5])
+
+            if (not block_starts or
+                i - block_starts[-1] >= cls.BLOCK_SIZE or
+                (block_bytes and
+                 block_bytes + line_bytes > cls.MAX_BLOCK_BYTES)):
+                block_starts.append(i)
+                block_bytes = 0
+
+            block_bytes += line_bytes
+
+        index = cls(_get_chunk_info(chunks), block_starts, len(lines))
+
+        for block in xrange(len(block_starts)):
+            start, end = index._get_block_range(block)
+            index._blocks[block] = lines[start:end]
+
+        return index
+    from_chunks = classmethod(from_chunks)
+
+    def decode(cls, data, load_blocks, reload_index=None):
+        """
+        Returns an index decoded from the data returned by encode. No blocks
+        are loaded until they're needed.
+        """
+        if (not isinstance(data, tuple) or len(data) != 4 or
+            data[0] != CHUNK_FORMAT_VERSION):
+            raise ChunkFormatError("Unknown diff chunk index format")
+
+        return cls(data[1], list(_unpack(data[2])), data[3], load_blocks,
+                   reload_index)
+    decode = classmethod(decode)
+
+    def encode(self):
+        """
+        Returns the index in a form that can be pickled quickly. This doesn't
+        include any blocks.
+        """
+        return (CHUNK_FORMAT_VERSION, self.chunk_info,
+                _pack(array('i', self.block_starts)), self.num_lines)
+
+    def encode_block(self, block):
+        """
+        Returns a loaded block, encoded with encode_lines.
+        """
+        return encode_lines(self._blocks[block])
+
+    def get_num_blocks(self):
+        return len(self.block_starts)
+
+    def preload(self, ranges):
+        """
+        Loads the blocks holding the lines in each of a list of (start, end)
+        ranges, with a single call to load_blocks.
+        """
+        blocks = []
+
+        for start, end in ranges:
+            blocks += self._get_blocks(start, end)
+
+        self._load(blocks)
+
+    def get_lines(self, start, end):
+        """
+        Returns the lines from start up to end, loading any blocks that
+        haven't been loaded yet.
+        """
+        self._load(self._get_blocks(start, end))
+
+        # Loading may have replaced the index, so the blocks are looked up
+        # again.
+        blocks = self._get_blocks(start, end)
+        lines = []
+
+        for block in blocks:
+            block_start = self.block_starts[block]
+            block_lines = self._blocks[block]
+            lines += block_lines[max(start - block_start, 0):
+                                 end - block_start]
+
+        return lines
+
+    def get_chunks(self):
+        """
+        Returns all of the chunks, loading any blocks that haven't been
+        loaded yet.
+        """
+        # Loading may replace the index and change the number of lines,
+        # so the blocks are loaded before the lines are counted.
+        self._load(self._get_blocks(0, self.num_lines))
+        lines = self.get_lines(0, self.num_lines)
+        chunks = []
+
+        for chunk_start, (count, info) in zip(self._chunk_starts,
+                                              self.chunk_info):
+            chunk = info.copy()
+            chunk['lines'] = lines[chunk_start:chunk_start + count]
+            chunks.append(chunk)
+
+        return chunks
+
+    def get_chunks_in_range(self, start, end):
+        """
+        Returns the parts of the chunks that fall between the lines start
+        and end. Only the blocks holding those lines are loaded.
+        """
+        self._load(self._get_blocks(start, end))
+        start = max(start, 0)
+        end = min(end, self.num_lines)
+
+        if start >= end:
+            return []
+
+        lines = self.get_lines(start, end)
+        first_chunk = bisect_right(self._chunk_starts, start) - 1
+        chunks = []
+
+        for i in xrange(first_chunk, len(self.chunk_info)):
+            chunk_start = self._chunk_starts[i]
+
+            if chunk_start >= end:
+                break
+
+            count, info = self.chunk_info[i]
+            chunk = info.copy()
+            chunk['lines'] = lines[max(chunk_start - start, 0):
+                                   chunk_start + count - start]
+            chunk['numlines'] = len(chunk['lines'])
+            chunks.append(chunk)
+
+        return chunks
+
+    def _get_blocks(self, start, end):
+        start = max(start, 0)
+        end = min(end, self.num_lines)
+
+        if start >= end:
+            return []
+
+        return range(bisect_right(self.block_starts, start) - 1,
+                     bisect_right(self.block_starts, end - 1))
+
+    def _load(self, blocks):
+        missing = []
+
+        for block in blocks:
+            if block not in self._blocks and block not in missing:
+                missing.append(block)
+
+        if not missing:
+            return
+
+        missing.sort()
+
+        try:
+            self._load_missing(missing)
+        except ChunkFormatError:
+            if self.reload_index is None:
+                raise
+
+            self._replace(self.reload_index())
+
+    def _load_missing(self, missing):
+        encoded_blocks = self.load_blocks(missing)
+
+        if len(encoded_blocks) != len(missing):
+            raise ChunkFormatError("Expected %d diff chunk blocks, got %d"
+                                   % (len(missing), len(encoded_blocks)))
+
+        for block, data in zip(missing, encoded_blocks):
+            block_start, block_end = self._get_block_range(block)
+            lines = decode_lines(data)
+
+            if len(lines) != block_end - block_start:
+                raise ChunkFormatError(
+                    "Invalid diff chunk block: expected %d lines, got %d"
+                    % (block_end - block_start, len(lines)))
+
+            self._blocks[block] = lines
+
+    def _replace(self, index):
+        self.chunk_info = index.chunk_info
+        self.block_starts = index.block_starts
+        self.num_lines = index.num_lines
+        self._blocks = index._blocks
+        self._chunk_starts = index._chunk_starts
+
+    def _get_block_range(self, block):
+        if block + 1 < len(self.block_starts):
+            end = self.block_starts[block + 1]
+        else:
+            end = self.num_lines
+
+        return self.block_starts[block], end
@@ -1,3 +1,4 @@
+import cPickle as pickle
 import fnmatch
 import logging
 import os
@@ -5,15 +6,17 @@ import re
 import subprocess
 import tempfile
 from difflib import SequenceMatcher
+from sha import sha
 
 try:
     import pygments
     from pygments.lexers import get_lexer_for_filename
-    # from pygments.lexers import guess_lexer_for_filename
     from pygments.formatters import HtmlFormatter
 except ImportError:
     pass
 
+from django.conf import settings
+from django.core.cache import cache
 from django.utils.html import escape
 from django.utils.http import urlquote
 from django.utils.safestring import mark_safe
@@ -25,12 +28,45 @@ from djblets.util.misc import cache_memoize
 
 from reviewboard.accounts.models import Profile
 from reviewboard.admin.checks import get_can_enable_syntax_highlighting
+from reviewboard.diffviewer.chunkformat import CHUNK_FORMAT_VERSION, \
+                                               ChunkFormatError, ChunkIndex
+from reviewboard.diffviewer.fastmyersdiff import FastMyersDiffer
 from reviewboard.diffviewer.myersdiff import MyersDiffer
+from reviewboard.diffviewer.patcher import apply_patch, PatchError
 from reviewboard.diffviewer.smdiff import SMDiffer
 from reviewboard.scmtools.core import PRE_CREATION, HEAD
 
 
-DEFAULT_DIFF_COMPAT_VERSION = 1
+DEFAULT_DIFF_COMPAT_VERSION = 2
+
+# Hit/miss counts for the patched file cache in this process.
+patched_file_cache_stats = {
+    'lookups': 0,
+    'misses': 0,
+}
+
+# Hit/miss counts for the highlighted file cache in this process.
+highlighted_file_cache_stats = {
+    'lookups': 0,
+    'misses': 0,
+}
+
+# The lexer class for each filename that has been highlighted in this
+# process, or None if Pygments has no lexer for it.
+_lexer_classes = {}
+MAX_LEXER_CACHE_SIZE = 5000
+
+# The furthest before or after a range of lines that lexing will start or
+# stop when only part of a file is highlighted.
+HIGHLIGHT_SYNC_LINES = 1000
+
+# The largest entry stored in the cache for a block of chunk lines. Larger
+# blocks are stored in parts, since memcached won't store items over 1MB.
+MAX_CACHED_BLOCK_BYTES = 512 * 1024
+
+# Stored under a block's cache key, along with the number of parts, when
+# the block is stored in parts.
+CHUNK_BLOCK_PARTS = 'chunk-block-parts'
 
 
 class UserVisibleError(Exception):
@@ -51,6 +87,9 @@ def Differ(a, b, ignore_space=False,
         return SMDiffer(a, b)
     elif compat_version == 1:
         return MyersDiffer(a, b, ignore_space)
+    elif compat_version == 2:
+        # Produces the same opcodes as version 1, only faster.
+        return FastMyersDiffer(a, b, ignore_space)
     else:
         raise DiffCompatError(
             "Invalid diff compatibility version (%s) passed to Differ" %
@@ -83,8 +122,11 @@ def convert_line_endings(data):
 
 
 def patch(diff, file, filename):
-    """Apply a diff to a file.  Delegates out to `patch` because noone
-       except Larry Wall knows how to patch."""
+    """Apply a diff to a file.
+
+    The diff is applied in-process when possible, which saves a temporary
+    directory and a fork for every file. If that fails, we delegate out to
+    `patch`, because noone except Larry Wall knows how to patch."""
 
     log_timer = log_timed("Patching file %s" % filename)
 
@@ -92,16 +134,192 @@ def patch(diff, file, filename):
         # Someone uploaded an unchanged file. Return the one we're patching.
         return file
 
+    file = convert_line_endings(file)
+    diff = convert_line_endings(diff)
+
+    try:
+        try:
+            data = apply_patch(file, diff)
+        except PatchError, e:
+            logging.debug("Unable to apply the patch to '%s' in-process "
+                          "(%s). Falling back on patch." % (filename, e))
+            data = patch_with_subprocess(diff, file, filename)
+    finally:
+        log_timer.done()
+
+    return data
+
+
+def get_content_hash(data):
+    """
+    Returns a hash of the given file or diff content, for use in cache keys.
+    """
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+
+    return sha(data).hexdigest()
+
+
+def get_patched_file_cache_key(diff, file):
+    """
+    Returns the cache key for the result of applying a diff to a file.
+
+    The key is built from hashes of the contents, rather than from filediff
+    IDs, so that a file patched for the diff viewer can be reused by the
+    interdiff and comment views (and by any other filediff that happens to
+    have the same original file and diff).
+    """
+    return "patched-file:%s:%s" % (get_content_hash(file),
+                                   get_content_hash(diff))
+
+
+def cached_patch(diff, file, filename):
+    """
+    Apply a diff to a file, using the result from the cache if this file
+    has been patched with this diff before.
+    """
+    if diff.strip() == "":
+        return file
+
+    def do_patch():
+        patched_file_cache_stats['misses'] += 1
+        return [patch(diff, file, filename)]
+
+    patched_file_cache_stats['lookups'] += 1
+
+    # As in get_original_file, we wrap the data in a list so the cache
+    # backend doesn't convert it to unicode.
+    return cache_memoize(get_patched_file_cache_key(diff, file), do_patch,
+                         large_data=True)[0]
+
+
+def get_patched_file_cache_stats():
+    """
+    Returns a dictionary of statistics on the patched file cache for this
+    process.
+    """
+    return _get_cache_stats(patched_file_cache_stats)
+
+
+def _get_cache_stats(counts):
+    lookups = counts['lookups']
+    misses = counts['misses']
+    stats = {
+        'lookups': lookups,
+        'hits': lookups - misses,
+        'misses': misses,
+    }
+
+    if lookups == 0:
+        stats['hit_rate'] = 0
+        stats['miss_rate'] = 0
+    else:
+        stats['hit_rate'] = 100 * stats['hits'] / lookups
+        stats['miss_rate'] = 100 * misses / lookups
+
+    return stats
+
+
+def get_lexer_for_file(filename):
+    """
+    Returns a new Pygments lexer for the given filename, raising ValueError
+    if there isn't one.
+
+    Finding the lexer means matching the filename against the patterns of
+    every lexer Pygments knows about. Pygments only looks at the base name
+    of the file, so the resulting lexer class is remembered for each base
+    name and the search only happens once per process.
+    """
+    basename = os.path.basename(filename)
+
+    try:
+        lexer_cls = _lexer_classes[basename]
+    except KeyError:
+        try:
+            lexer_cls = get_lexer_for_filename(basename).__class__
+        except ValueError:
+            lexer_cls = None
+
+        if len(_lexer_classes) >= MAX_LEXER_CACHE_SIZE:
+            _lexer_classes.clear()
+
+        _lexer_classes[basename] = lexer_cls
+
+    if lexer_cls is None:
+        raise ValueError("No lexer found for filename %r" % filename)
+
+    lexer = lexer_cls(stripnl=False)
+
+    try:
+        # This is only available in 0.7 and higher
+        lexer.add_filter('codetagify')
+    except AttributeError:
+        pass
+
+    return lexer
+
+
+def get_highlighted_file_cache_key(data, lexer, nowrap=False):
+    """
+    Returns the cache key for the syntax highlighted lines of a file.
+
+    Like the patched file cache, this depends only on the content, so a
+    file that appears in several revisions of a diff, or on both sides of
+    an interdiff, is only highlighted once.
+
+    Parts of files highlighted without the surrounding markup (see
+    get_highlighted_line_range) are stored under separate keys, with
+    nowrap set.
+    """
+    if nowrap:
+        prefix = "highlighted-lines"
+    else:
+        prefix = "highlighted-file"
+
+    return "%s:%s:%s:%s" % (prefix, pygments.__version__,
+                            lexer.__class__.__name__,
+                            get_content_hash(data))
+
+
+def get_highlighted_lines(data, filename):
+    """
+    Returns the lines of the given file content, syntax highlighted
+    according to its filename. A ValueError is raised if the file type
+    isn't known to Pygments.
+    """
+    lexer = get_lexer_for_file(filename)
+
+    def do_highlight():
+        highlighted_file_cache_stats['misses'] += 1
+        return pygments.highlight(data, lexer, HtmlFormatter()).splitlines()
+
+    highlighted_file_cache_stats['lookups'] += 1
+
+    return cache_memoize(get_highlighted_file_cache_key(data, lexer),
+                         do_highlight, large_data=True)
+
+
+def get_highlighted_file_cache_stats():
+    """
+    Returns a dictionary of statistics on the highlighted file cache for
+    this process.
+    """
+    return _get_cache_stats(highlighted_file_cache_stats)
+
+
+def patch_with_subprocess(diff, file, filename):
+    """
+    Apply a diff to a file using the `patch` program. The file and diff
+    must already have had their line endings converted.
+    """
     # Prepare the temporary directory if none is available
     tempdir = tempfile.mkdtemp(prefix='reviewboard.')
 
     (fd, oldfile) = tempfile.mkstemp(dir=tempdir)
     f = os.fdopen(fd, "w+b")
-    f.write(convert_line_endings(file))
+    f.write(file)
     f.close()
 
-    diff = convert_line_endings(diff)
-
     # XXX: catch exception if Popen fails?
     newfile = '%s-new' % oldfile
     p = subprocess.Popen(['patch', '-o', newfile, oldfile],
@@ -118,8 +336,6 @@ def patch(diff, file, filename):
         f.write(diff)
         f.close()
 
-        log_timer.done()
-
         # FIXME: This doesn't provide any useful error report on why the patch
         # failed to apply, which makes it hard to debug.  We might also want to
         # have it clean up if DEBUG=False
@@ -136,8 +352,6 @@ def patch(diff, file, filename):
     os.unlink(newfile)
     os.rmdir(tempdir)
 
-    log_timer.done()
-
     return data
 
 
@@ -213,6 +427,78 @@ def convert_to_utf8(s, enc):
         raise TypeError("Value to convert is unexpected type %s", type(s))
 
 
+def get_original_file_cache_key(repository, path, revision):
+    """
+    Returns the cache key used to store the contents of a file fetched
+    from a repository.
+    """
+    return "%s:%s:%s" % (repository.path, urlquote(path), revision)
+
+
+class _CacheMiss(Exception):
+    pass
+
+
+def fetch_original_files(repository, files):
+    """
+    Fetches several files from a repository, given as a list of
+    (path, revision) tuples, and caches their contents.
+
+    Files that are already in the cache are skipped. The rest are fetched
+    together through the SCMTool's get_files, which is much faster than
+    fetching them one at a time for most repository types.
+
+    The contents of each file are returned in a list in the same order.
+    SCM exceptions are passed back to the caller.
+    """
+    def raise_cache_miss():
+        raise _CacheMiss
+
+    results = [None] * len(files)
+    missing = []
+
+    for i, (path, revision) in enumerate(files):
+        if revision == PRE_CREATION:
+            results[i] = ""
+            continue
+
+        key = get_original_file_cache_key(repository, path, revision)
+
+        # We wrap the contents of the file in a list and then return the
+        # first element after getting the result from the cache. This
+        # prevents the cache backend from converting to unicode, since
+        # we're no longer passing in a string and the cache backend doesn't
+        # recursively look through the list in order to convert the
+        # elements inside.
+        #
+        # Basically, this fixes the massive regressions introduced by the
+        # Django unicode changes.
+        try:
+            results[i] = cache_memoize(key, raise_cache_miss,
+                                       large_data=True)[0]
+        except _CacheMiss:
+            missing.append(i)
+
+    if missing:
+        log_timer = log_timed("Fetching %d files from %s" %
+                              (len(missing), repository))
+
+        try:
+            tool = repository.get_scmtool()
+            contents = tool.get_files([files[i] for i in missing])
+        finally:
+            log_timer.done()
+
+        for i, data in zip(missing, contents):
+            path, revision = files[i]
+            data = convert_line_endings(data)
+            key = get_original_file_cache_key(repository, path, revision)
+            results[i] = data
+            cache_memoize(key, lambda: [data], large_data=True)
+
+    return results
+
+
 def get_original_file(filediff):
     """
     Get a file either from the cache or the SCM, applying the parent diff if
@@ -223,42 +509,234 @@ def get_original_file(filediff):
     data = ""
 
     if filediff.source_revision != PRE_CREATION:
-        def fetch_file(file, revision):
-            log_timer = log_timed("Fetching file '%s' r%s from %s" %
-                                  (file, revision, repository))
-            data = tool.get_file(file, revision)
-            data = convert_line_endings(data)
-            log_timer.done()
-            return data
-
-        repository = filediff.diffset.repository
-        tool = repository.get_scmtool()
-        file = filediff.source_file
-        revision = filediff.source_revision
-
-        key = "%s:%s:%s" % (filediff.diffset.repository.path, urlquote(file),
-                            revision)
-
-        # We wrap the result of get_file in a list and then return the first
-        # element after getting the result from the cache. This prevents the
-        # cache backend from converting to unicode, since we're no longer
-        # passing in a string and the cache backend doesn't recursively look
-        # through the list in order to convert the elements inside.
-        #
-        # Basically, this fixes the massive regressions introduced by the
-        # Django unicode changes.
-        data = cache_memoize(key, lambda: [fetch_file(file, revision)],
-                             large_data=True)[0]
+        data = fetch_original_files(filediff.diffset.repository,
+                                    [(filediff.source_file,
+                                      filediff.source_revision)])[0]
 
     # If there's a parent diff set, apply it to the buffer.
     if filediff.parent_diff:
-        data = patch(filediff.parent_diff, data, filediff.source_file)
+        data = cached_patch(filediff.parent_diff, data, filediff.source_file)
 
     return data
 
 
+def prefetch_original_files(filediffs):
+    """
+    Fetches and caches the original files for a list of filediffs in as few
+    round trips to each repository as possible, so that generating their
+    chunks doesn't need to go back to the repository for every file.
+    """
+    repositories = {}
+    files_by_repository = {}
+
+    for filediff in filediffs:
+        if filediff.binary or filediff.source_revision == PRE_CREATION:
+            continue
+
+        repository = filediff.diffset.repository
+        repositories[repository.id] = repository
+        files_by_repository.setdefault(repository.id, []).append(
+            (filediff.source_file, filediff.source_revision))
+
+    for repository_id, files in files_by_repository.iteritems():
+        try:
+            fetch_original_files(repositories[repository_id], files)
+        except Exception, e:
+            # Any problems will be reported when each file's chunks are
+            # generated, so there's no need to fail here.
+            logging.warning("Unable to prefetch files from %s: %s" %
+                            (repositories[repository_id], e))
+
+
 def get_patched_file(buffer, filediff):
-    return patch(filediff.diff, buffer, filediff.dest_file)
+    return cached_patch(filediff.diff, buffer, filediff.dest_file)
+
+
+def get_diff_file_contents(diffset, filediff, interfilediff,
+                           force_interdiff):
+    """
+    Returns the old and new versions of the file shown for a filediff (or
+    for an interdiff between two filediffs), converted to unicode.
+    """
+    old = get_original_file(filediff)
+    new = get_patched_file(old, filediff)
+
+    if interfilediff:
+        old = new
+        interdiff_orig = get_original_file(interfilediff)
+        new = get_patched_file(interdiff_orig, interfilediff)
+    elif force_interdiff:
+        # Basically, revert the change.
+        temp = old
+        old = new
+        new = temp
+
+    encoding = diffset.repository.encoding or 'iso-8859-15'
+    old = convert_to_utf8(old, encoding)
+    new = convert_to_utf8(new, encoding)
+
+    # Normalize the input so that if there isn't a trailing newline, we add
+    # it.
+    if old and old[-1] != '\n':
+        old += '\n'
+
+    if new and new[-1] != '\n':
+        new += '\n'
+
+    return old, new
+
+
+def split_file_lines(data):
+    """
+    Splits the contents of a file, as returned by get_diff_file_contents,
+    into a list of lines.
+    """
+    lines = re.split(r"\r?\n", data or '')
+
+    # Remove the trailing newline, now that we've split this. This will
+    # prevent a duplicate line number at the end of the diff.
+    del(lines[-1])
+
+    return lines
+
+
+def is_highlighting_sync_line(lines, i):
+    """
+    Returns whether lexing can safely start or stop at line i.
+
+    Lexers keep state between lines, such as whether they're in a comment
+    or a string, so they can't just start at any line. Lines that look like
+    the start of a top-level statement, ones that follow a blank line and
+    aren't indented, are a good bet for where a lexer is back in its initial
+    state.
+    """
+    line = lines[i]
+
+    return (line and not line[0].isspace() and
+            (i == 0 or not lines[i - 1].strip()))
+
+
+def get_highlighting_window(lines, start, end):
+    """
+    Returns the range of lines to lex in order to highlight the lines from
+    start to end.
+
+    The range starts at the closest sync line (see is_highlighting_sync_line)
+    before start, and ends at the closest one after end, so that comments
+    and strings that cross into the lines being highlighted are lexed in
+    full. Neither side goes past HIGHLIGHT_SYNC_LINES lines from the
+    requested range.
+    """
+    first = max(start - HIGHLIGHT_SYNC_LINES, 0)
+    last = min(end + HIGHLIGHT_SYNC_LINES, len(lines))
+
+    for i in xrange(start, first, -1):
+        if is_highlighting_sync_line(lines, i):
+            first = i
+            break
+
+    for i in xrange(end, last):
+        if is_highlighting_sync_line(lines, i):
+            last = i
+            break
+
+    return first, last
+
+
+def get_highlighted_line_range(lines, filename, start, end):
+    """
+    Returns the highlighted markup for lines[start:end], without lexing the
+    rest of the file. A ValueError is raised if the file type isn't known to
+    Pygments.
+
+    The highlighted window of lines is cached by its content, along with the
+    highlighted files, so the same lines shown again in another revision or
+    interdiff are only lexed once.
+    """
+    lexer = get_lexer_for_file(filename)
+    first, last = get_highlighting_window(lines, start, end)
+    data = '\n'.join(lines[first:last]) + '\n'
+
+    def do_highlight():
+        highlighted_file_cache_stats['misses'] += 1
+        return pygments.highlight(data, lexer,
+                                  HtmlFormatter(nowrap=True)).splitlines()
+
+    highlighted_file_cache_stats['lookups'] += 1
+
+    markup = cache_memoize(get_highlighted_file_cache_key(data, lexer, True),
+                           do_highlight, large_data=True)
+    markup = markup[start - first:end - first]
+
+    # Make sure a lexer that drops trailing blank lines doesn't leave any
+    # lines without markup.
+    if len(markup) < end - start:
+        markup += [escape(line) for line in lines[start + len(markup):end]]
+
+    return markup
+
+
+def highlight_chunk_lines(a, b, filediff, chunks):
+    """
+    Fills in the highlighted markup for the lines of a consecutive run of
+    chunks. a and b are the lines of the old and new files.
+
+    Sides of the diff that Pygments has no lexer for keep their plain
+    markup.
+    """
+    lines = []
+
+    for chunk in chunks:
+        lines += chunk['lines']
+        chunk['needs_highlighting'] = False
+
+    sides = [
+        (a, filediff.source_file, 1, 2),
+        (b, filediff.dest_file, 4, 5),
+    ]
+
+    for file_lines, filename, linenum_index, markup_index in sides:
+        linenums = [line[linenum_index] for line in lines
+                    if line[linenum_index]]
+
+        if not linenums:
+            continue
+
+        start = linenums[0] - 1
+
+        try:
+            markup = get_highlighted_line_range(file_lines, filename, start,
+                                                linenums[-1])
+        except ValueError:
+            continue
+
+        for line in lines:
+            if line[linenum_index]:
+                line[markup_index] = \
+                    mark_safe(markup[line[linenum_index] - 1 - start])
+
+
+def apply_pending_highlighting(file, chunks):
+    """
+    Highlights the lines of any of the given chunks from a file (as returned
+    by get_diff_files) that were left unhighlighted when the chunks were
+    generated. This is used when collapsed chunks are about to be shown.
+    """
+    pending = [chunk for chunk in chunks
+               if chunk.get('needs_highlighting', False)]
+
+    if not pending:
+        return
+
+    filediff = file['filediff']
+    old, new = get_diff_file_contents(filediff.diffset, filediff,
+                                      file['interfilediff'],
+                                      file['force_interdiff'])
+    a = split_file_lines(old)
+    b = split_file_lines(new)
+
+    for chunk in pending:
+        highlight_chunk_lines(a, b, filediff, [chunk])
 
 
 def get_chunks(diffset, filediff, interfilediff, force_interdiff,
@@ -289,23 +767,6 @@ def get_chunks(diffset, filediff, interfilediff, force_interdiff,
         chunks.append(new_chunk(lines[start:end], end - start, 'equal',
                       collapsable))
 
-    def apply_pygments(data, filename):
-        # XXX Guessing is preferable but really slow, especially on XML
-        #     files.
-        #if filename.endswith(".xml"):
-        lexer = get_lexer_for_filename(filename, stripnl=False)
-        #else:
-        #    lexer = guess_lexer_for_filename(filename, data, stripnl=False)
-
-        try:
-            # This is only available in 0.7 and higher
-            lexer.add_filter('codetagify')
-        except AttributeError:
-            pass
-
-        return pygments.highlight(data, lexer, HtmlFormatter()).splitlines()
-
-
     # There are three ways this function is called:
     #
     #     1) filediff, no interfilediff
@@ -341,40 +802,11 @@ def get_chunks(diffset, filediff, interfilediff, force_interdiff,
     assert filediff
 
     file = filediff.source_file
-    revision = filediff.source_revision
-
-    old = get_original_file(filediff)
-    new = get_patched_file(old, filediff)
-
-    if interfilediff:
-        old = new
-        interdiff_orig = get_original_file(interfilediff)
-        new = get_patched_file(interdiff_orig, interfilediff)
-    elif force_interdiff:
-        # Basically, revert the change.
-        temp = old
-        old = new
-        new = temp
 
-    encoding = diffset.repository.encoding or 'iso-8859-15'
-    old = convert_to_utf8(old, encoding)
-    new = convert_to_utf8(new, encoding)
-
-    # Normalize the input so that if there isn't a trailing newline, we add
-    # it.
-    if old and old[-1] != '\n':
-        old += '\n'
-
-    if new and new[-1] != '\n':
-        new += '\n'
-
-    a = re.split(r"\r?\n", old or '')
-    b = re.split(r"\r?\n", new or '')
-
-    # Remove the trailing newline, now that we've split this. This will
-    # prevent a duplicate line number at the end of the diff.
-    del(a[-1])
-    del(b[-1])
+    old, new = get_diff_file_contents(diffset, filediff, interfilediff,
+                                      force_interdiff)
+    a = split_file_lines(old)
+    b = split_file_lines(new)
 
     a_num_lines = len(a)
     b_num_lines = len(b)
@@ -383,17 +815,19 @@ def get_chunks(diffset, filediff, interfilediff, force_interdiff,
 
     siteconfig = SiteConfiguration.objects.get_current()
 
+    incremental_highlighting = \
+        (enable_syntax_highlighting and
+         siteconfig.get('diffviewer_incremental_highlighting'))
     threshold = siteconfig.get('diffviewer_syntax_highlighting_threshold')
 
-    if threshold and (a_num_lines > threshold or b_num_lines > threshold):
+    if (not incremental_highlighting and threshold and
+        (a_num_lines > threshold or b_num_lines > threshold)):
         enable_syntax_highlighting = False
 
-    if enable_syntax_highlighting:
+    if enable_syntax_highlighting and not incremental_highlighting:
         try:
-            # TODO: Try to figure out the right lexer for these files
-            #       once instead of twice.
-            markup_a = apply_pygments(old or '', filediff.source_file)
-            markup_b = apply_pygments(new or '', filediff.dest_file)
+            markup_a = get_highlighted_lines(old or '', filediff.source_file)
+            markup_b = get_highlighted_lines(new or '', filediff.dest_file)
         except ValueError:
             pass
 
@@ -454,6 +888,23 @@ def get_chunks(diffset, filediff, interfilediff, force_interdiff,
         else:
             chunks.append(new_chunk(lines, numlines, tag, meta=meta))
 
+    if incremental_highlighting:
+        # Only the lines that are shown when the diff is first displayed
+        # are highlighted now. Collapsed chunks are highlighted when
+        # they're expanded.
+        run = []
+
+        for chunk in chunks + [None]:
+            if chunk and not chunk['collapsable']:
+                run.append(chunk)
+            else:
+                if run:
+                    highlight_chunk_lines(a, b, filediff, run)
+                    run = []
+
+                if chunk:
+                    chunk['needs_highlighting'] = True
+
     if interfilediff:
         logging.debug("Done generating diff chunks for interdiff ids %s-%s",
                       filediff.id, interfilediff.id)
@@ -491,6 +942,200 @@ def opcodes_with_metadata(differ):
         yield group
 
 
+def get_chunks_cache_key(filediff, interfilediff=None, force_interdiff=False,
+                         enable_syntax_highlighting=True):
+    """
+    Returns the cache key used to store the chunks for a filediff (or an
+    interdiff between two filediffs).
+    """
+    key = "diff-sidebyside-v%s-" % CHUNK_FORMAT_VERSION
+
+    if enable_syntax_highlighting:
+        key += "hl-"
+
+    if not force_interdiff:
+        key += str(filediff.id)
+    elif interfilediff:
+        key += "interdiff-%s-%s" % (filediff.id, interfilediff.id)
+    else:
+        key += "interdiff-%s-none" % filediff.id
+
+    return key
+
+
+def get_chunk_block_cache_key(key, block):
+    """
+    Returns the cache key for a block of lines from the chunks stored under
+    the given key.
+    """
+    return "%s-block-%d" % (key, block)
+
+
+def _cache_chunk_block(block_key, data):
+    """
+    Stores an encoded block of chunk lines in the cache.
+
+    A block holding a very long line can be too large for a single cache
+    entry, so it's pickled and stored in parts, with the number of parts
+    stored under the block's key.
+    """
+    pickled = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+
+    if len(pickled) <= MAX_CACHED_BLOCK_BYTES:
+        cache.set(block_key, data, settings.CACHE_EXPIRATION_TIME)
+        return
+
+    num_parts = 0
+
+    for i in xrange(0, len(pickled), MAX_CACHED_BLOCK_BYTES):
+        cache.set("%s-part-%d" % (block_key, num_parts),
+                  pickled[i:i + MAX_CACHED_BLOCK_BYTES],
+                  settings.CACHE_EXPIRATION_TIME)
+        num_parts += 1
+
+    cache.set(block_key, (CHUNK_BLOCK_PARTS, num_parts),
+              settings.CACHE_EXPIRATION_TIME)
+
+
+def _get_cached_chunk_blocks(block_keys):
+    """
+    Returns a dictionary of the encoded blocks of chunk lines found in the
+    cache, by key. Blocks stored in parts are put back together, and left
+    out if any of the parts are missing.
+    """
+    cached_blocks = cache.get_many(block_keys)
+    part_keys = {}
+
+    for block_key, data in cached_blocks.items():
+        if (isinstance(data, tuple) and len(data) == 2 and
+            data[0] == CHUNK_BLOCK_PARTS):
+            part_keys[block_key] = ["%s-part-%d" % (block_key, i)
+                                    for i in xrange(data[1])]
+            del cached_blocks[block_key]
+
+    if part_keys:
+        all_part_keys = []
+
+        for keys in part_keys.itervalues():
+            all_part_keys += keys
+
+        cached_parts = cache.get_many(all_part_keys)
+
+        for block_key, keys in part_keys.iteritems():
+            if len([part_key for part_key in keys
+                    if part_key in cached_parts]) == len(keys):
+                try:
+                    cached_blocks[block_key] = pickle.loads(
+                        ''.join([cached_parts[part_key]
+                                 for part_key in keys]))
+                except (pickle.UnpicklingError, EOFError, ValueError):
+                    pass
+
+    return cached_blocks
+
+
+def get_cached_chunk_index(filediff, interfilediff=None,
+                           force_interdiff=False,
+                           enable_syntax_highlighting=True):
+    """
+    Returns a ChunkIndex for the chunks of a filediff (or an interdiff
+    between two filediffs), generating and caching the chunks if they
+    aren't already in the cache.
+
+    The index is cached separately from the blocks holding the lines of the
+    chunks, so it's cheap to load. Blocks are loaded as they're needed. If
+    any have been evicted from the cache, the chunks are generated again.
+    If those no longer match the cached index, or the cached blocks can't
+    be read, the index is replaced with the newly generated one.
+    """
+    key = get_chunks_cache_key(filediff, interfilediff, force_interdiff,
+                               enable_syntax_highlighting)
+    generated = []
+    rebuilt = []
+
+    def build_index():
+        index = ChunkIndex.from_chunks(
+            get_chunks(filediff.diffset, filediff, interfilediff,
+                       force_interdiff, enable_syntax_highlighting))
+
+        for block in xrange(index.get_num_blocks()):
+            _cache_chunk_block(get_chunk_block_cache_key(key, block),
+                               index.encode_block(block))
+
+        return index
+
+    def generate_index():
+        generated.append(build_index())
+
+        return generated[-1].encode()
+
+    def load_blocks(blocks):
+        block_keys = [get_chunk_block_cache_key(key, block)
+                      for block in blocks]
+        cached_blocks = _get_cached_chunk_blocks(block_keys)
+
+        if len(cached_blocks) == len(block_keys):
+            return [cached_blocks[block_key] for block_key in block_keys]
+
+        logging.debug("Diff chunk blocks for %s are no longer cached. "
+                      "Generating them again." % key)
+
+        # If the cached index is still good, only the blocks need to be
+        # stored again. This doesn't go through cache_memoize, which may
+        # find the index cached by another request and not generate
+        # anything.
+        index = build_index()
+
+        if index.encode() != data:
+            # The chunks came out differently this time, such as when the
+            # file has changed in the repository, so the new blocks don't
+            # fit the cached index.
+            rebuilt.append(index)
+            raise ChunkFormatError("The diff chunks for %s have changed"
+                                   % key)
+
+        return [index.encode_block(block) for block in blocks]
+
+    def reload_index():
+        if rebuilt:
+            index = rebuilt[-1]
+        else:
+            logging.warning("Unable to load the cached diff chunk blocks "
+                            "for %s. Generating them again." % key)
+            index = build_index()
+
+        cache.delete(key)
+        cache_memoize(key, index.encode, large_data=True)
+
+        return index
+
+    data = cache_memoize(key, generate_index, large_data=True)
+
+    if generated:
+        return generated[0]
+
+    try:
+        return ChunkIndex.decode(data, load_blocks, reload_index)
+    except ChunkFormatError, e:
+        logging.warning("Unable to load the cached diff chunks for %s: %s"
+                        % (key, e))
+        cache.delete(key)
+
+        return ChunkIndex.from_chunks(
+            get_chunks(filediff.diffset, filediff, interfilediff,
+                       force_interdiff, enable_syntax_highlighting))
+
+
+def get_cached_chunks(filediff, interfilediff=None, force_interdiff=False,
+                      enable_syntax_highlighting=True):
+    """
+    Returns the chunks for a filediff, generating and caching them if they
+    aren't already in the cache.
+    """
+    return get_cached_chunk_index(filediff, interfilediff, force_interdiff,
+                                  enable_syntax_highlighting).get_chunks()
+
+
 def get_revision_str(revision):
     if revision == HEAD:
         return "HEAD"
@@ -535,12 +1180,6 @@ def get_diff_files(diffset, filediff=None, interdiffset=None,
                filediff.source_file == interfilediff.source_file:
                 interdiff_map[interfilediff.source_file] = interfilediff
 
-    key_prefix = "diff-sidebyside-"
-
-    if enable_syntax_highlighting:
-        key_prefix += "hl-"
-
-
     # In order to support interdiffs properly, we need to display diffs
     # on every file in the union of both diffsets. Iterating over one diffset
     # or the other doesn't suffice.
@@ -634,22 +1273,9 @@ def get_diff_files(diffset, filediff=None, interdiffset=None,
             chunks = []
 
             if not filediff.binary:
-                key = key_prefix
-
-                if not force_interdiff:
-                    key += str(filediff.id)
-                elif interfilediff:
-                    key += "interdiff-%s-%s" % (filediff.id, interfilediff.id)
-                else:
-                    key += "interdiff-%s-none" % filediff.id
-
-                chunks = cache_memoize(
-                    key,
-                    lambda: get_chunks(filediff.diffset,
-                                       filediff, interfilediff,
-                                       force_interdiff,
-                                       enable_syntax_highlighting),
-                    large_data=True)
+                chunks = get_cached_chunks(filediff, interfilediff,
+                                           force_interdiff,
+                                           enable_syntax_highlighting)
 
             file['chunks'] = chunks
             file['changed_chunks'] = []
@@ -695,9 +1321,10 @@ def get_file_chunks_in_range(context, filediff, interfilediff,
     filediff/interfilediff.
 
     This is primarily intended for use with templates. It takes a
-    RequestContext for looking up the user and for caching file lists,
-    in order to improve performance and reduce lookup times for files that have
-    already been fetched.
+    RequestContext for looking up the user and for caching the chunk indexes
+    of files, in order to improve performance and reduce lookup times for
+    files that have already been fetched. Only the lines in the range are
+    loaded from the cache, rather than all the chunks of the file.
 
     Each returned chunk is a dictionary with the following fields:
 
@@ -726,52 +1353,71 @@ def get_file_chunks_in_range(context, filediff, interfilediff,
       7        True if line consists of only whitespace changes
       ======== =============================================================
     """
-    interdiffset = None
+    for chunk in get_file_chunks_in_ranges(context, filediff, interfilediff,
+                                           [(first_line, num_lines)])[0]:
+        yield chunk
 
-    key = "_diff_files_%s_%s" % (filediff.diffset.id, filediff.id)
+
+def get_file_chunks_in_ranges(context, filediff, interfilediff, ranges):
+    """
+    Returns the chunks within each of several ranges of lines in the
+    specified filediff/interfilediff. ranges is a list of (first_line,
+    num_lines) tuples, and a list of chunks is returned for each, in the
+    same order.
+
+    This gives the same results as calling get_file_chunks_in_range for
+    each range, but all the blocks of lines covering the ranges are loaded
+    from the cache at once, and any highlighting that's still needed is
+    applied with a single fetch of the file.
+    """
+    key = "_diff_chunk_index_%s_%s" % (filediff.diffset.id, filediff.id)
 
     if interfilediff:
         key += "_%s" % (interfilediff.id)
-        interdiffset = interfilediff.diffset
 
     if key in context:
-        files = context[key]
+        file = context[key]
+    elif (filediff.binary or
+          (interfilediff and filediff.diff == interfilediff.diff)):
+        # These files have no chunks to show. get_diff_files leaves out
+        # interdiffs between identical diffs entirely.
+        file = None
+        context[key] = file
     else:
         assert 'user' in context
-        files = get_diff_files(filediff.diffset, filediff, interdiffset,
-                               get_enable_highlighting(context['user']))
-        context[key] = files
-
-    if not files:
-        raise StopIteration
-
-    assert len(files) == 1
+        force_interdiff = interfilediff is not None
+        file = {
+            'filediff': filediff,
+            'interfilediff': interfilediff,
+            'force_interdiff': force_interdiff,
+            'chunk_index': get_cached_chunk_index(
+                filediff, interfilediff, force_interdiff,
+                get_enable_highlighting(context['user'])),
+        }
+        context[key] = file
 
-    for chunk in files[0]['chunks']:
-        lines = chunk['lines']
-        if lines[-1][0] >= first_line >= lines[0][0]:
-            start_index = first_line - lines[0][0]
+    if not file:
+        return [[] for i in ranges]
 
-            if first_line + num_lines <= lines[-1][0]:
-                last_index = start_index + num_lines
-            else:
-                last_index = len(lines)
+    # Virtual line numbers start at 1, while the index counts from 0.
+    index = file['chunk_index']
+    line_ranges = []
 
-            new_chunk = {
-                'lines': chunk['lines'][start_index:last_index],
-                'numlines': last_index - start_index,
-                'change': chunk['change'],
-                'meta': chunk.get('meta', {}),
-            }
+    for first_line, num_lines in ranges:
+        if first_line < 1:
+            line_ranges.append((0, 0))
+        else:
+            line_ranges.append((first_line - 1, first_line - 1 + num_lines))
 
-            yield new_chunk
+    index.preload(line_ranges)
+    chunks_list = [index.get_chunks_in_range(start, end)
+                   for start, end in line_ranges]
 
-            first_line += new_chunk['numlines']
-            num_lines -= new_chunk['numlines']
+    apply_pending_highlighting(file, [chunk
+                                      for chunks in chunks_list
+                                      for chunk in chunks])
 
-            assert num_lines >= 0
-            if num_lines == 0:
-                break
+    return chunks_list
 
 
 def get_enable_highlighting(user):
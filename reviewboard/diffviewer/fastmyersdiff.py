@@ -0,0 +1,519 @@
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from reviewboard.diffviewer.myersdiff import MyersDiffer
+
+
+def _forward_run(a, b, x, y, limit):
+    """
+    Returns the number of consecutive equal codes in a and b starting at
+    a[x] and b[y], up to limit.
+
+    Runs are compared in slices of exponentially growing size. Slice
+    comparisons happen in C, so long runs of equal lines (which are common
+    in large, mostly unchanged files) cost a handful of comparisons rather
+    than one Python-level comparison per line.
+    """
+    n = 0
+    step = 1
+
+    while n < limit:
+        end = n + step
+
+        if end > limit:
+            end = limit
+
+        if a[x + n:x + end] == b[y + n:y + end]:
+            n = end
+            step <<= 1
+        elif step == 1:
+            break
+        else:
+            step = 1
+
+    return n
+
+
+def _backward_run(a, b, x, y, limit):
+    """
+    Returns the number of consecutive equal codes in a and b ending just
+    before a[x] and b[y], up to limit.
+    """
+    n = 0
+    step = 1
+
+    while n < limit:
+        end = n + step
+
+        if end > limit:
+            end = limit
+
+        if a[x - end:x - n] == b[y - end:y - n]:
+            n = end
+            step <<= 1
+        elif step == 1:
+            break
+        else:
+            step = 1
+
+    return n
+
+
+class FastMyersDiffer(MyersDiffer):
+    """
+    A faster implementation of MyersDiffer's snake search.
+
+    The algorithm is identical to MyersDiffer and produces identical
+    opcodes. The difference is in how the search runs:
+
+      * State is bound to locals instead of being looked up on self.
+      * Long runs of equal lines are matched by comparing slices.
+      * If NumPy is installed, the line codes and diagonal vectors are kept
+        in contiguous integer arrays, and search steps covering many
+        diagonals extend all of those diagonals at once using NumPy views
+        of those arrays. This is where the time goes on large files with
+        many changes.
+    """
+    # The minimum number of diagonals in a search step before NumPy is used.
+    # Below this, the per-step overhead of NumPy outweighs the gains.
+    VECTORIZE_MIN_DIAGONALS = 256
+
+    # The length of a snake at which we stop comparing line by line and
+    # start comparing slices.
+    SLICE_RUN_LENGTH = 8
+
+    def _gen_diff_data(self):
+        if self.a_data and self.b_data:
+            return
+
+        self.a_data = self.DiffData(self._gen_diff_codes(self.a))
+        self.b_data = self.DiffData(self._gen_diff_codes(self.b))
+
+        self._discard_confusing_lines()
+
+        self.max_lines = self.a_data.undiscarded_lines + \
+                         self.b_data.undiscarded_lines + 3
+
+        vector_size = self.a_data.undiscarded_lines + \
+                      self.b_data.undiscarded_lines + 3
+
+        if numpy is None:
+            # Lists are faster than arrays for the element-by-element
+            # access of the non-vectorized search.
+            self.fdiag = [0] * vector_size
+            self.bdiag = [0] * vector_size
+        else:
+            self.a_data.undiscarded = array('l', self.a_data.undiscarded)
+            self.b_data.undiscarded = array('l', self.b_data.undiscarded)
+            self.fdiag = array('l', [0]) * vector_size
+            self.bdiag = array('l', [0]) * vector_size
+
+            # These are views on the arrays above, not copies.
+            self.np_a = numpy.frombuffer(self.a_data.undiscarded,
+                                         dtype=numpy.int_)
+            self.np_b = numpy.frombuffer(self.b_data.undiscarded,
+                                         dtype=numpy.int_)
+            self.np_fdiag = numpy.frombuffer(self.fdiag, dtype=numpy.int_)
+            self.np_bdiag = numpy.frombuffer(self.bdiag, dtype=numpy.int_)
+
+        self.downoff = self.upoff = self.b_data.undiscarded_lines + 1
+
+        self._lcs(0, self.a_data.undiscarded_lines,
+                  0, self.b_data.undiscarded_lines,
+                  self.minimal_diff)
+        self._shift_chunks(self.a_data, self.b_data)
+        self._shift_chunks(self.b_data, self.a_data)
+
+    def _find_sms(self, a_lower, a_upper, b_lower, b_upper, find_minimal):
+        """
+        Finds the Shortest Middle Snake.
+
+        See MyersDiffer._find_sms for the details of the algorithm.
+        """
+        down_vector = self.fdiag
+        up_vector = self.bdiag
+        downoff = self.downoff
+        upoff = self.upoff
+        a = self.a_data.undiscarded
+        b = self.b_data.undiscarded
+        max_lines = self.max_lines
+        snake_limit = self.SNAKE_LIMIT
+        slice_run_length = self.SLICE_RUN_LENGTH
+
+        if numpy is not None:
+            # Diagonals are stepped by 2, so this is the width of the
+            # diagonal range that hits VECTORIZE_MIN_DIAGONALS.
+            vectorize_width = 2 * self.VECTORIZE_MIN_DIAGONALS
+        else:
+            vectorize_width = 2 * max_lines
+
+        down_k = a_lower - b_lower
+        up_k = a_upper - b_upper
+        odd_delta = (down_k - up_k) % 2 != 0
+
+        down_vector[downoff + down_k] = a_lower
+        up_vector[upoff + up_k] = a_upper
+
+        dmin = a_lower - b_upper
+        dmax = a_upper - b_lower
+
+        down_min = down_max = down_k
+        up_min = up_max = up_k
+
+        cost = 0
+
+        while True:
+            cost += 1
+            big_snake = False
+
+            if down_min > dmin:
+                down_min -= 1
+                down_vector[downoff + down_min - 1] = -1
+            else:
+                down_min += 1
+
+            if down_max < dmax:
+                down_max += 1
+                down_vector[downoff + down_max + 1] = -1
+            else:
+                down_max -= 1
+
+            # Extend the forward path
+            if down_max - down_min >= vectorize_width:
+                result, big_snake = self._extend_forward(
+                    down_min, down_max, up_min, up_max, odd_delta,
+                    a_upper, b_upper)
+
+                if result:
+                    return result
+
+                k_range = ()
+            else:
+                k_range = xrange(down_max, down_min - 1, -2)
+
+            for k in k_range:
+                tlo = down_vector[downoff + k - 1]
+                thi = down_vector[downoff + k + 1]
+
+                if tlo >= thi:
+                    x = tlo + 1
+                else:
+                    x = thi
+
+                y = x - k
+                old_x = x
+
+                while x < a_upper and y < b_upper and a[x] == b[y]:
+                    x += 1
+                    y += 1
+
+                    if x - old_x == slice_run_length:
+                        run = _forward_run(a, b, x, y,
+                                           min(a_upper - x, b_upper - y))
+                        x += run
+                        y += run
+                        break
+
+                if x - old_x > snake_limit:
+                    big_snake = True
+
+                down_vector[downoff + k] = x
+
+                if odd_delta and up_min <= k <= up_max and \
+                   up_vector[upoff + k] <= x:
+                    return x, y, True, True
+
+            # Extend the reverse path
+            if up_min > dmin:
+                up_min -= 1
+                up_vector[upoff + up_min - 1] = max_lines
+            else:
+                up_min += 1
+
+            if up_max < dmax:
+                up_max += 1
+                up_vector[upoff + up_max + 1] = max_lines
+            else:
+                up_max -= 1
+
+            if up_max - up_min >= vectorize_width:
+                result, found_big_snake = self._extend_reverse(
+                    down_min, down_max, up_min, up_max, odd_delta,
+                    a_lower, b_lower)
+
+                if result:
+                    return result
+
+                big_snake = big_snake or found_big_snake
+                k_range = ()
+            else:
+                k_range = xrange(up_max, up_min - 1, -2)
+
+            for k in k_range:
+                tlo = up_vector[upoff + k - 1]
+                thi = up_vector[upoff + k + 1]
+
+                if tlo < thi:
+                    x = tlo
+                else:
+                    x = thi - 1
+
+                y = x - k
+                old_x = x
+
+                while x > a_lower and y > b_lower and a[x - 1] == b[y - 1]:
+                    x -= 1
+                    y -= 1
+
+                    if old_x - x == slice_run_length:
+                        run = _backward_run(a, b, x, y,
+                                            min(x - a_lower, y - b_lower))
+                        x -= run
+                        y -= run
+                        break
+
+                if old_x - x > snake_limit:
+                    big_snake = True
+
+                up_vector[upoff + k] = x
+
+                if not odd_delta and down_min <= k <= down_max and \
+                   x <= down_vector[downoff + k]:
+                    return x, y, True, True
+
+            if find_minimal:
+                continue
+
+            if cost > 200 and big_snake:
+                result = self._find_good_diagonal(
+                    cost, down_k, up_k, down_min, down_max, up_min, up_max,
+                    a_lower, a_upper, b_lower, b_upper)
+
+                if result:
+                    return result
+
+    def _extend_forward(self, down_min, down_max, up_min, up_max, odd_delta,
+                        a_upper, b_upper):
+        """
+        Extends every forward diagonal in [down_min, down_max] using NumPy.
+
+        The diagonals of a step never read each other's results, so this is
+        equivalent to the loop in _find_sms. Where that loop returns at the
+        first overlapping diagonal (in descending order), we pick the same
+        one.
+
+        Returns a tuple of the _find_sms result (or None) and whether a big
+        snake was found.
+        """
+        down_vector = self.np_fdiag
+        start = self.downoff + down_min
+        end = self.downoff + down_max + 1
+
+        ks = numpy.arange(down_min, down_max + 1, 2)
+        tlo = down_vector[start - 1:end - 1:2]
+        thi = down_vector[start + 1:end + 1:2]
+        xs = numpy.where(tlo >= thi, tlo + 1, thi)
+        ys = xs - ks
+        start_xs = xs.copy()
+
+        self._extend_snakes(xs, ys, a_upper, b_upper, 1)
+
+        down_vector[start:end:2] = xs
+        big_snake = bool(((xs - start_xs) > self.SNAKE_LIMIT).any())
+
+        if odd_delta:
+            up_xs = self.np_bdiag[self.upoff + down_min:
+                                  self.upoff + down_max + 1:2]
+            overlaps = numpy.flatnonzero((ks >= up_min) & (ks <= up_max) &
+                                         (up_xs <= xs))
+
+            if len(overlaps):
+                i = overlaps[-1]
+                return (int(xs[i]), int(ys[i]), True, True), big_snake
+
+        return None, big_snake
+
+    def _extend_reverse(self, down_min, down_max, up_min, up_max, odd_delta,
+                        a_lower, b_lower):
+        """
+        Extends every reverse diagonal in [up_min, up_max] using NumPy.
+
+        See _extend_forward.
+        """
+        up_vector = self.np_bdiag
+        start = self.upoff + up_min
+        end = self.upoff + up_max + 1
+
+        ks = numpy.arange(up_min, up_max + 1, 2)
+        tlo = up_vector[start - 1:end - 1:2]
+        thi = up_vector[start + 1:end + 1:2]
+        xs = numpy.where(tlo < thi, tlo, thi - 1)
+        ys = xs - ks
+        start_xs = xs.copy()
+
+        self._extend_snakes(xs, ys, a_lower, b_lower, -1)
+
+        up_vector[start:end:2] = xs
+        big_snake = bool(((start_xs - xs) > self.SNAKE_LIMIT).any())
+
+        if not odd_delta:
+            down_xs = self.np_fdiag[self.downoff + up_min:
+                                    self.downoff + up_max + 1:2]
+            overlaps = numpy.flatnonzero((ks >= down_min) &
+                                         (ks <= down_max) &
+                                         (xs <= down_xs))
+
+            if len(overlaps):
+                i = overlaps[-1]
+                return (int(xs[i]), int(ys[i]), True, True), big_snake
+
+        return None, big_snake
+
+    def _extend_snakes(self, xs, ys, x_bound, y_bound, direction):
+        """
+        Slides each (x, y) along its diagonal while the lines match, in the
+        given direction, without passing the bounds.
+
+        All diagonals are advanced together. Each round compares a block of
+        lines for every diagonal that's still matching, doubling the block
+        size every round, so long snakes take a logarithmic number of rounds.
+        """
+        np_a = self.np_a
+        np_b = self.np_b
+
+        if direction > 0:
+            limits = numpy.minimum(x_bound - xs, y_bound - ys)
+        else:
+            limits = numpy.minimum(xs - x_bound, ys - y_bound)
+
+        active = numpy.flatnonzero(limits > 0)
+        block_size = 1
+
+        while len(active):
+            offsets = numpy.arange(block_size)
+            active_limits = limits[active]
+
+            if direction > 0:
+                a_indexes = xs[active][:, numpy.newaxis] + offsets
+                b_indexes = ys[active][:, numpy.newaxis] + offsets
+            else:
+                a_indexes = xs[active][:, numpy.newaxis] - 1 - offsets
+                b_indexes = ys[active][:, numpy.newaxis] - 1 - offsets
+
+            # Indexes past a diagonal's limit are masked out below, but
+            # still need to be valid for the lookup.
+            a_indexes = numpy.clip(a_indexes, 0, len(np_a) - 1)
+            b_indexes = numpy.clip(b_indexes, 0, len(np_b) - 1)
+
+            matches = (np_a[a_indexes] == np_b[b_indexes]) & \
+                      (offsets < active_limits[:, numpy.newaxis])
+            all_match = matches.all(1)
+            runs = numpy.where(all_match, block_size, matches.argmin(1))
+
+            xs[active] += runs * direction
+            ys[active] += runs * direction
+            limits[active] -= runs
+
+            active = active[all_match & (active_limits > block_size)]
+            block_size *= 2
+
+    def _find_good_diagonal(self, cost, down_k, up_k,
+                            down_min, down_max, up_min, up_max,
+                            a_lower, a_upper, b_lower, b_upper):
+        """
+        Heuristics courtesy of GNU diff.
+
+        Looks for a diagonal that made lots of progress compared with the
+        edit distance. This must match MyersDiffer._find_sms exactly in
+        order to produce the same opcodes. Note that once a sufficient
+        diagonal fails to match, the original implementation measures the
+        remaining diagonals against k = 1 (forward) or k = 0 (reverse)
+        rather than the starting k-line. We track that the same way.
+        """
+        a = self.a_data.undiscarded
+        b = self.b_data.undiscarded
+        down_vector = self.fdiag
+        up_vector = self.bdiag
+        downoff = self.downoff
+        upoff = self.upoff
+        snake_limit = self.SNAKE_LIMIT
+
+        k = down_k
+
+        for d in xrange(down_max, down_min - 1, -2):
+            dd = d - k
+            x = down_vector[downoff + d]
+            y = x - d
+            v = (x - a_lower) * 2 + dd
+
+            if v > 12 * (cost + abs(dd)) and \
+               a_lower + snake_limit <= x < a_upper and \
+               b_lower + snake_limit <= y < b_upper:
+                if a[x - 1] == b[y - 1]:
+                    return x, y, True, False
+
+                k = 1
+
+        k = up_k
+
+        for d in xrange(up_max, up_min - 1, -2):
+            dd = d - k
+            x = up_vector[upoff + d]
+            y = x - d
+            v = (a_upper - x) * 2 + dd
+
+            if v > 12 * (cost + abs(dd)) and \
+               a_lower < x <= a_upper - snake_limit and \
+               b_lower < y <= b_upper - snake_limit:
+                if a[x] == b[y]:
+                    return x, y, False, True
+
+                k = 0
+
+        return None
+
+    def _lcs(self, a_lower, a_upper, b_lower, b_upper, find_minimal):
+        """
+        The divide-and-conquer implementation of the Longest Common
+        Subsequence (LCS) algorithm.
+        """
+        a = self.a_data.undiscarded
+        b = self.b_data.undiscarded
+
+        # Fast walkthrough equal lines at the start and end
+        run = _forward_run(a, b, a_lower, b_lower,
+                           min(a_upper - a_lower, b_upper - b_lower))
+        a_lower += run
+        b_lower += run
+
+        run = _backward_run(a, b, a_upper, b_upper,
+                            min(a_upper - a_lower, b_upper - b_lower))
+        a_upper -= run
+        b_upper -= run
+
+        if a_lower == a_upper:
+            # Inserted lines.
+            modified = self.b_data.modified
+            real_indexes = self.b_data.real_indexes
+
+            for i in xrange(b_lower, b_upper):
+                modified[real_indexes[i]] = True
+        elif b_lower == b_upper:
+            # Deleted lines
+            modified = self.a_data.modified
+            real_indexes = self.a_data.real_indexes
+
+            for i in xrange(a_lower, a_upper):
+                modified[real_indexes[i]] = True
+        else:
+            # Find the middle snake and length of an optimal path for A and B
+            x, y, low_minimal, high_minimal = \
+                self._find_sms(a_lower, a_upper, b_lower, b_upper,
+                               find_minimal)
+
+            self._lcs(a_lower, x, b_lower, y, low_minimal)
+            self._lcs(x, a_upper, y, b_upper, high_minimal)
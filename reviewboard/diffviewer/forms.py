@@ -6,7 +6,9 @@ from django.utils.translation import ugettext as _
 
 from reviewboard.diffviewer.diffutils import DEFAULT_DIFF_COMPAT_VERSION
 from reviewboard.diffviewer.models import DiffSet, FileDiff
-from reviewboard.scmtools.core import PRE_CREATION, UNKNOWN, FileNotFoundError
+from reviewboard.diffviewer.warmup import warm_filediffs
+from reviewboard.scmtools.core import PRE_CREATION, UNKNOWN
+from reviewboard.scmtools.errors import FilesNotFoundError
 
 
 class EmptyDiffError(ValueError):
@@ -94,6 +96,8 @@ class UploadDiffForm(forms.Form):
         diffset.repository = self.repository
         diffset.save()
 
+        filediffs = []
+
         for f in files:
             if f.origFile in parent_files:
                 parent_file = parent_files[f.origFile]
@@ -120,13 +124,26 @@ class UploadDiffForm(forms.Form):
                                 parent_diff=parent_content,
                                 binary=f.binary)
             filediff.save()
+            filediffs.append(filediff)
+
+        warm_filediffs(filediffs)
 
         return diffset
 
     def _process_files(self, file, basedir, check_existance=False):
+        """
+        Parses the files out of a diff, returning a list of them with their
+        filenames and revisions normalized.
+
+        If check_existance is True, the repository is asked whether the
+        original version of every file exists, all at once. If any are
+        missing, a FilesNotFoundError listing every one of them is raised.
+        """
         tool = self.repository.get_scmtool()
+        files = []
+        files_to_check = []
 
-        for f in tool.get_parser(file.read()).parse():
+        for f in tool.get_parser(file).iter_files():
             f2, revision = tool.parse_diff_revision(f.origFile, f.origInfo)
             if f2.startswith("/"):
                 filename = f2
@@ -137,15 +154,28 @@ class UploadDiffForm(forms.Form):
             if (revision != PRE_CREATION and
                 revision != UNKNOWN and
                 not f.binary and
-                (check_existance and
-                 not tool.file_exists(filename, revision))):
-                raise FileNotFoundError(filename, revision)
+                check_existance):
+                files_to_check.append((filename, revision))
 
             f.origFile = filename
             f.origInfo = revision
 
-            yield f
+            files.append(f)
+
+        if files_to_check:
+            # The contents are fetched later on, when the diff is warmed up
+            # or first viewed, so only check that the files are there.
+            missing = [
+                file_info
+                for file_info, exists in zip(files_to_check,
+                                             tool.files_exist(files_to_check))
+                if not exists
+            ]
+
+            if missing:
+                raise FilesNotFoundError(missing)
 
+        return files
 
     def _compare_files(self, filename1, filename2):
         """
@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+import optparse
+import sys
+
+from django.core.management.base import NoArgsCommand
+
+from reviewboard.diffviewer.models import DiffSet
+from reviewboard.diffviewer.warmup import warm_filediffs
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        optparse.make_option('--days', type='int', dest='days', default=7,
+                             help='Warm up diffs uploaded within this many '
+                                  'days (default 7)'),
+        optparse.make_option('--diffset', type='int', action='append',
+                             dest='diffsets', default=[],
+                             help='Warm up the diffset with this ID. '
+                                  'May be given more than once.'),
+        )
+    help = "Generates and caches the diff viewer chunks for recent diffs, " \
+           "such as after the cache has been flushed"
+    requires_model_validation = True
+
+    def handle_noargs(self, **options):
+        diffset_ids = options.get('diffsets')
+
+        if diffset_ids:
+            diffsets = DiffSet.objects.filter(pk__in=diffset_ids)
+        else:
+            since = datetime.now() - timedelta(days=options.get('days'))
+            diffsets = DiffSet.objects.filter(timestamp__gte=since)
+
+        diffsets = diffsets.select_related('repository')
+        num_files = 0
+
+        for diffset in diffsets:
+            # Each diffset is finished before moving on to the next, so the
+            # files of one diffset are fetched together and the queue
+            # never fills up.
+            filediffs = list(diffset.files.all())
+
+            for filediff in filediffs:
+                filediff.diffset = diffset
+
+            num_files += warm_filediffs(filediffs, wait=True)
+
+        sys.stdout.write("Warmed up the diffs for %d files.\n" % num_files)
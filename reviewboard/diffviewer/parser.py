@@ -1,5 +1,6 @@
 import logging
 import re
+from array import array
 
 
 class File:
@@ -19,6 +20,93 @@ class DiffParserError(Exception):
         self.linenum = linenum
 
 
+class DiffLines(object):
+    """
+    A read-only sequence of the lines in a diff, without their newlines.
+
+    Rather than splitting the diff up front, this records the offset of
+    each line into the original buffer as it's first needed, and slices
+    lines out on demand. Runs of lines can be pulled out in one go with
+    get_data(), which avoids building up file content a line at a time.
+
+    The buffer is expected to only use "\\n" for line endings.
+    """
+    # The number of recently accessed lines to keep around. Parsers look
+    # at the same few lines repeatedly while checking for headers.
+    CACHE_SIZE = 16
+
+    def __init__(self, data):
+        self.data = data
+        self.offsets = array('l', [0])
+        self._cache = {}
+
+        self._num_lines = data.count("\n")
+
+        if data and not data.endswith("\n"):
+            self._num_lines += 1
+
+    def __len__(self):
+        return self._num_lines
+
+    def __getitem__(self, linenum):
+        if linenum < 0:
+            linenum += self._num_lines
+
+        try:
+            return self._cache[linenum]
+        except KeyError:
+            pass
+
+        if linenum < 0 or linenum >= self._num_lines:
+            raise IndexError("list index out of range")
+
+        start = self.get_offset(linenum)
+        end = self.data.find("\n", start)
+
+        if end == -1:
+            end = len(self.data)
+
+        line = self.data[start:end]
+
+        if len(self._cache) >= self.CACHE_SIZE:
+            self._cache.clear()
+
+        self._cache[linenum] = line
+
+        return line
+
+    def get_offset(self, linenum):
+        """
+        Returns the offset into the buffer of the start of the given line.
+        Line numbers past the end of the diff map to the end of the buffer.
+        """
+        if linenum >= self._num_lines:
+            return len(self.data)
+
+        offsets = self.offsets
+        data = self.data
+
+        while len(offsets) <= linenum:
+            offsets.append(data.index("\n", offsets[-1]) + 1)
+
+        return offsets[linenum]
+
+    def get_data(self, start, end):
+        """
+        Returns the lines from start up to (but not including) end as a
+        single string, with every line ending in a newline.
+        """
+        if start >= end:
+            return ""
+
+        data = self.data[self.get_offset(start):self.get_offset(end)]
+
+        if not data.endswith("\n"):
+            data += "\n"
+
+        return data
+
+
 class DiffParser(object):
     """
     Parses diff files into fragments, taking into account special fields
@@ -28,39 +116,65 @@ class DiffParser(object):
     INDEX_SEP = "=" * 67
 
     def __init__(self, data):
+        """
+        Creates a parser for a diff. The diff can be given either as a
+        string or as a file-like object, such as an uploaded file.
+        """
+        if hasattr(data, 'read'):
+            data = data.read()
+
+        if "\r" in data:
+            # Line offsets are computed on "\n" alone, so normalize
+            # any other line endings up front.
+            data = data.replace("\r\n", "\n").replace("\r", "\n")
+
         self.data = data
-        self.lines = data.splitlines()
+        self.lines = DiffLines(data)
 
     def parse(self):
         """
         Parses the diff, returning a list of File objects representing each
         file in the diff.
         """
-        logging.debug("DiffParser.parse: Beginning parse of diff, size = %s",
-                      len(self.data))
+        self.files = list(self.iter_files())
+
+        return self.files
+
+    def iter_files(self):
+        """
+        Parses the diff, yielding a File object for each file in the diff
+        as soon as its content has been found.
+        """
+        logging.debug("DiffParser.iter_files: Beginning parse of diff, "
+                      "size = %s", len(self.data))
 
-        self.files = []
         file = None
+        body_start = 0
         i = 0
+        num_lines = len(self.lines)
 
         # Go through each line in the diff, looking for diff headers.
-        while i < len(self.lines):
+        while i < num_lines:
             next_linenum, new_file = self.parse_change_header(i)
 
             if new_file:
-                # This line is the start of a new file diff.
+                # This line is the start of a new file diff. Everything
+                # since the previous header belongs to the previous file.
+                if file:
+                    file.data += self.lines.get_data(body_start, i)
+                    yield file
+
                 file = new_file
-                self.files.append(file)
+                body_start = next_linenum
                 i = next_linenum
             else:
-                if file:
-                    file.data += self.lines[i] + "\n"
-
                 i += 1
 
-        logging.debug("DiffParser.parse: Finished parsing diff.")
+        if file:
+            file.data += self.lines.get_data(body_start, num_lines)
+            yield file
 
-        return self.files
+        logging.debug("DiffParser.iter_files: Finished parsing diff.")
 
     def parse_change_header(self, linenum):
         """
@@ -84,7 +198,7 @@ class DiffParser(object):
             file.origInfo = info.get('origInfo')
             file.newInfo  = info.get('newInfo')
             file.origChangesetId = info.get('origChangesetId')
-            file.data = ""
+            header = []
 
             # The header is part of the diff, so make sure it gets in the
             # diff content. But only the parts that patch will understand.
@@ -101,7 +215,9 @@ class DiffParser(object):
                     self.lines[i + 1] == self.INDEX_SEP):
 
                     # This is a valid part of a diff header. Add it.
-                    file.data += self.lines[i] + "\n"
+                    header.append(line + "\n")
+
+            file.data = "".join(header)
 
         return linenum, file
 
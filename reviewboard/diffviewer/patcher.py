@@ -0,0 +1,305 @@
+import re
+
+
+HUNK_HEADER_RE = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+class PatchError(Exception):
+    """
+    Raised when a diff can't be applied in-process. Callers are expected to
+    fall back on the `patch` program when they see this.
+    """
+    pass
+
+
+class Hunk:
+    """
+    A single hunk from a unified diff.
+
+    The old and new sides are stored as lists of lines without their
+    trailing newlines. Whether the last line on either side lacks a newline
+    (the "\\ No newline at end of file" marker) is stored separately.
+    """
+    def __init__(self, old_start, old_count, new_start, new_count):
+        self.old_start = old_start
+        self.old_count = old_count
+        self.new_start = new_start
+        self.new_count = new_count
+        self.old_lines = []
+        self.new_lines = []
+        self.old_noeol = False
+        self.new_noeol = False
+
+        # The number of context lines at the start and end of the hunk.
+        self.leading_context = 0
+        self.trailing_context = 0
+
+    def get_position(self):
+        """
+        Returns the 0-based index into the original file where this hunk
+        expects to start.
+        """
+        if self.old_count == 0:
+            # A pure insertion references the line it's inserted after.
+            return self.old_start
+
+        return self.old_start - 1
+
+
+def parse_hunks(diff):
+    """
+    Parses the hunks out of a unified diff for a single file.
+
+    Anything outside of a hunk (file headers, Index lines, and so on) is
+    skipped. A PatchError is raised for anything we don't know how to
+    handle in-process, such as context diffs or malformed hunks.
+    """
+    hunks = []
+    lines = diff.split("\n")
+
+    if lines and lines[-1] == "":
+        del(lines[-1])
+
+    i = 0
+    num_lines = len(lines)
+
+    while i < num_lines:
+        line = lines[i]
+        i += 1
+
+        if line.startswith("***************"):
+            raise PatchError("Context diffs are not supported in-process")
+        elif not line.startswith("@@ "):
+            continue
+
+        m = HUNK_HEADER_RE.match(line)
+
+        if not m:
+            raise PatchError("Malformed hunk header: %s" % line)
+
+        old_start, old_count, new_start, new_count = m.groups()
+
+        if old_count is None:
+            old_count = 1
+
+        if new_count is None:
+            new_count = 1
+
+        hunk = Hunk(int(old_start), int(old_count),
+                    int(new_start), int(new_count))
+        old_left = hunk.old_count
+        new_left = hunk.new_count
+        seen_change = False
+        last_type = None
+
+        while old_left > 0 or new_left > 0 or \
+              (i < num_lines and lines[i].startswith("\\")):
+            if i >= num_lines:
+                raise PatchError("Unexpected end of diff in hunk")
+
+            line = lines[i]
+            i += 1
+
+            if line.startswith("\\"):
+                # Applies to whichever side(s) the previous line was on.
+                if last_type in (" ", "-"):
+                    hunk.old_noeol = True
+
+                if last_type in (" ", "+"):
+                    hunk.new_noeol = True
+
+                continue
+
+            if line == "":
+                # Some tools strip the trailing space from blank context
+                # lines. patch treats these as context, so we do too.
+                line_type = " "
+                content = ""
+            else:
+                line_type = line[0]
+                content = line[1:]
+
+            if line_type == " ":
+                if old_left == 0 or new_left == 0:
+                    raise PatchError("Hunk has too many context lines")
+
+                hunk.old_lines.append(content)
+                hunk.new_lines.append(content)
+                old_left -= 1
+                new_left -= 1
+
+                if seen_change:
+                    hunk.trailing_context += 1
+                else:
+                    hunk.leading_context += 1
+            elif line_type == "-":
+                if old_left == 0:
+                    raise PatchError("Hunk has too many removed lines")
+
+                hunk.old_lines.append(content)
+                old_left -= 1
+                seen_change = True
+                hunk.trailing_context = 0
+            elif line_type == "+":
+                if new_left == 0:
+                    raise PatchError("Hunk has too many added lines")
+
+                hunk.new_lines.append(content)
+                new_left -= 1
+                seen_change = True
+                hunk.trailing_context = 0
+            else:
+                raise PatchError("Unexpected line in hunk: %s" % line)
+
+            last_type = line_type
+
+        hunks.append(hunk)
+
+    return hunks
+
+
+def _lines_match(lines, pos, needle):
+    if pos < 0 or pos + len(needle) > len(lines):
+        return False
+
+    for i in xrange(len(needle)):
+        if lines[pos + i] != needle[i]:
+            return False
+
+    return True
+
+
+def _locate(lines, needle, expected, min_pos):
+    """
+    Finds the position in lines closest to expected at which needle
+    matches, never looking before min_pos. Like patch, at each distance
+    the later position is tried before the earlier one.
+
+    Returns None if there's no match.
+    """
+    max_pos = len(lines) - len(needle)
+
+    if max_pos < min_pos:
+        return None
+
+    expected = max(min(expected, max_pos), min_pos)
+    max_offset = max(expected - min_pos, max_pos - expected)
+
+    for offset in xrange(max_offset + 1):
+        pos = expected + offset
+
+        if pos <= max_pos and _lines_match(lines, pos, needle):
+            return pos
+
+        pos = expected - offset
+
+        if offset > 0 and pos >= min_pos and \
+           _lines_match(lines, pos, needle):
+            return pos
+
+    return None
+
+
+def apply_patch(data, diff):
+    """
+    Applies a unified diff to the contents of a file, entirely in memory.
+
+    This follows patch's behavior for hunks that have moved (offset) and
+    "\\ No newline at end of file" markers. Hunks that would need some of
+    their context ignored (fuzz) raise PatchError, so that patch decides
+    how to apply them. Its rules for fuzz are subtle, and getting them
+    slightly wrong means showing the wrong file rather than an error.
+
+    Both data and diff are expected to have already had their line
+    endings normalized to "\\n".
+
+    Raises PatchError if the diff can't be parsed or a hunk doesn't apply.
+    """
+    hunks = parse_hunks(diff)
+
+    if not hunks:
+        raise PatchError("No hunks were found in the diff")
+
+    lines = data.split("\n")
+    has_eol = True
+
+    if lines[-1] == "":
+        del(lines[-1])
+    else:
+        has_eol = False
+
+    result = []
+    src_pos = 0   # Index into lines of the first line not yet copied.
+    offset = 0    # How far hunks have drifted from their stated positions.
+
+    for hunk_num, hunk in enumerate(hunks):
+        expected = hunk.get_position() + offset
+
+        # As with patch, a hunk with less context on one side than the
+        # other must be anchored to the start or end of the file.
+        context = max(hunk.leading_context, hunk.trailing_context)
+        anchor_start = (hunk.leading_context < context and
+                        hunk.old_start <= 1)
+        anchor_end = (hunk.trailing_context < context)
+
+        old_lines = hunk.old_lines
+        new_lines = hunk.new_lines
+
+        if anchor_start or anchor_end:
+            if anchor_start and anchor_end and len(old_lines) != len(lines):
+                pos = None
+            elif anchor_start:
+                pos = 0
+            else:
+                pos = len(lines) - len(old_lines)
+
+            if (pos is not None and
+                (pos < src_pos or not _lines_match(lines, pos, old_lines))):
+                pos = None
+        elif not old_lines:
+            # Pure insertions don't move. patch places them where the
+            # hunk header (adjusted by any previous offset) says.
+            pos = max(min(expected, len(lines)), src_pos)
+        else:
+            pos = _locate(lines, old_lines, expected, src_pos)
+
+        if pos is None:
+            raise PatchError("Hunk #%d doesn't apply without fuzz" %
+                             (hunk_num + 1))
+
+        end = pos + len(old_lines)
+        at_eof = (end == len(lines))
+
+        if hunk.old_noeol and (not at_eof or has_eol):
+            raise PatchError("Hunk #%d expects no newline at end of file" %
+                             (hunk_num + 1))
+
+        if at_eof and old_lines and not has_eol and not hunk.old_noeol:
+            # patch won't match the last line of a file that has no
+            # newline against a line in the hunk that has one.
+            raise PatchError("Hunk #%d expects a newline at end of file" %
+                             (hunk_num + 1))
+
+        result.extend(lines[src_pos:pos])
+        result.extend(new_lines)
+        src_pos = end
+        offset = pos - hunk.get_position()
+
+        if at_eof:
+            if new_lines:
+                has_eol = not hunk.new_noeol
+            elif old_lines:
+                # The end of the file was deleted. Whatever line now ends
+                # the file was followed by a newline.
+                has_eol = True
+
+    result.extend(lines[src_pos:])
+
+    if not result:
+        return ""
+
+    patched = "\n".join(result)
+
+    if has_eol:
+        patched += "\n"
+
+    return patched
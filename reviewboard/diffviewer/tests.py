@@ -1,13 +1,21 @@
 import os
+import threading
+import time
 import unittest
+from StringIO import StringIO
 
 from django.test import TestCase
 from djblets.siteconfig.models import SiteConfiguration
 
+from reviewboard.diffviewer.chunkformat import CHUNK_FORMAT_VERSION, \
+                                               ChunkFormatError, ChunkIndex, \
+                                               decode_chunks, encode_chunks
 from reviewboard.diffviewer.models import DiffSet, FileDiff
 from reviewboard.diffviewer.templatetags.difftags import highlightregion
 import reviewboard.diffviewer.diffutils as diffutils
 import reviewboard.diffviewer.parser as diffparser
+from reviewboard.diffviewer.patcher import apply_patch, PatchError
+from reviewboard.diffviewer.warmup import WarmupPool
 from reviewboard.scmtools.models import Repository
 
 
@@ -82,10 +90,21 @@ class MyersDifferTest(TestCase):
         opcodes = list(diffutils.MyersDiffer(a, b).get_opcodes())
         self.assertEquals(opcodes, expected)
 
+        opcodes = list(diffutils.FastMyersDiffer(a, b).get_opcodes())
+        self.assertEquals(opcodes, expected)
+
 
 class DiffParserTest(unittest.TestCase):
     PREFIX = os.path.join(os.path.dirname(__file__), 'testdata')
 
+    # Files and diffs that patch only applies with fuzz.
+    FUZZ_CASES = [
+        ("1\n2\n3\n4\nX\n6\n7\n8\n",
+         "@@ -2,5 +2,5 @@\n 2\n 3\n-4\n+four\n 5\n 6\n"),
+        ("q\np\nq\na",
+         "@@ -1 +1,2 @@\n+b\n a\n\\ No newline at end of file\n"),
+    ]
+
     def diff(self, options=''):
         f = os.popen('diff -rN -x .svn %s %s/orig_src %s/new_src' %
                      (options, self.PREFIX, self.PREFIX))
@@ -125,6 +144,24 @@ class DiffParserTest(unittest.TestCase):
         files = diffparser.DiffParser(data).parse()
         self.compareDiffs(files, "context")
 
+    def testIterFilesFromFileObject(self):
+        """Testing iter_files on a file-like object"""
+        data = self.diff('-u')
+        files = list(diffparser.DiffParser(StringIO(data)).iter_files())
+        self.compareDiffs(files, "unified")
+
+        for file, expected in zip(files, diffparser.DiffParser(data).parse()):
+            self.assertEqual(file.data, expected.data)
+
+    def testParseNormalizesLineEndings(self):
+        """Testing parse on a diff with CRLF line endings"""
+        data = self.diff('-u')
+        files = diffparser.DiffParser(data.replace("\n", "\r\n")).parse()
+        expected = diffparser.DiffParser(data).parse()
+
+        self.assertEqual([file.data for file in files],
+                         [file.data for file in expected])
+
     def testPatch(self):
         """Testing patching"""
 
@@ -181,6 +218,89 @@ class DiffParserTest(unittest.TestCase):
         self.assertEqual(diff, files[0].data)
         self.assertEqual(patched, new)
 
+    def testPatchedFileCacheKey(self):
+        """Testing that patched file cache keys depend only on content"""
+        key = diffutils.get_patched_file_cache_key('diff', 'file')
+        self.assertEqual(diffutils.get_patched_file_cache_key(u'diff',
+                                                              u'file'),
+                         key)
+        self.assertNotEqual(diffutils.get_patched_file_cache_key('diff2',
+                                                                 'file'),
+                            key)
+        self.assertNotEqual(diffutils.get_patched_file_cache_key('diff',
+                                                                 'file2'),
+                            key)
+
+    def testLexerForFile(self):
+        """Testing that lexers are found by the file's base name"""
+        lexer = diffutils.get_lexer_for_file('/trunk/src/main.py')
+        self.assertEqual(lexer.__class__.__name__, 'PythonLexer')
+        self.assert_(diffutils.get_lexer_for_file('main.py') is not lexer)
+        self.assertRaises(ValueError,
+                          lambda: diffutils.get_lexer_for_file('/README.x1'))
+        self.assertRaises(ValueError,
+                          lambda: diffutils.get_lexer_for_file('README.x1'))
+
+    def testHighlightedFileCacheKey(self):
+        """Testing that highlighted file cache keys depend on the lexer"""
+        py_lexer = diffutils.get_lexer_for_file('a.py')
+        c_lexer = diffutils.get_lexer_for_file('a.c')
+        key = diffutils.get_highlighted_file_cache_key('data', py_lexer)
+        self.assertEqual(
+            diffutils.get_highlighted_file_cache_key(u'data',
+                diffutils.get_lexer_for_file('/b/c.py')),
+            key)
+        self.assertNotEqual(
+            diffutils.get_highlighted_file_cache_key('data2', py_lexer),
+            key)
+        self.assertNotEqual(
+            diffutils.get_highlighted_file_cache_key('data', c_lexer),
+            key)
+        self.assertNotEqual(
+            diffutils.get_highlighted_file_cache_key('data', py_lexer, True),
+            key)
+
+    def testHighlightedLineRange(self):
+        """Testing highlighting part of a file"""
+        data = ('import os\n'
+                '\n'
+                'def foo():\n'
+                '    """\n'
+                '    A docstring.\n'
+                '\n'
+                '    More.\n'
+                '    """\n'
+                '    return 1\n'
+                '\n'
+                'x = 1\n')
+        lines = diffutils.split_file_lines(data)
+        self.assertEqual(diffutils.get_highlighting_window(lines, 4, 5),
+                         (2, 10))
+        self.assertEqual(diffutils.get_highlighting_window(lines, 2, 3),
+                         (2, 10))
+        self.assertEqual(diffutils.get_highlighting_window(lines, 10, 11),
+                         (10, 11))
+        self.assertEqual(diffutils.get_highlighting_window(lines, 0, 11),
+                         (0, 11))
+
+        lexer = diffutils.get_lexer_for_file('foo.py')
+        full = diffutils.pygments.highlight(
+            data, lexer, diffutils.HtmlFormatter(nowrap=True)).splitlines()
+
+        for start, end in [(0, 11), (2, 9), (3, 5), (10, 11)]:
+            self.assertEqual(
+                diffutils.get_highlighted_line_range(lines, 'foo.py',
+                                                     start, end),
+                full[start:end])
+
+        # Highlighting the same window again comes from the cache.
+        misses = diffutils.highlighted_file_cache_stats['misses']
+        self.assertEqual(
+            diffutils.get_highlighted_line_range(lines, 'foo.py', 3, 5),
+            full[3:5])
+        self.assertEqual(diffutils.highlighted_file_cache_stats['misses'],
+                         misses)
+
     def testInterline(self):
         """Testing inter-line diffs"""
 
@@ -220,6 +340,316 @@ class DiffParserTest(unittest.TestCase):
         return data
 
 
+class PatcherTest(unittest.TestCase):
+    """Unit tests for the in-process patcher."""
+    PREFIX = os.path.join(os.path.dirname(__file__), 'testdata')
+
+    def testApplyPatch(self):
+        """Testing apply_patch against the test data"""
+        for orig, new, diff in [('foo.c', 'foo.c', 'foo.c.diff'),
+                                ('README', 'README', 'README.diff'),
+                                ('README.nonewline', 'README.nonewline',
+                                 'README.nonewline.diff')]:
+            old = diffutils.convert_line_endings(self._get_file('orig_src',
+                                                                orig))
+            diff = diffutils.convert_line_endings(
+                self._get_file('diffs', 'unified', diff))
+            self.assertEqual(apply_patch(old, diff),
+                             self._get_file('new_src', new))
+
+    def testApplyPatchWithOffset(self):
+        """Testing apply_patch with a hunk that has moved"""
+        old = "a\nb\nc\nd\ne\nf\ng\n"
+        diff = "@@ -1,3 +1,3 @@\n c\n-d\n+D\n e\n"
+        self.assertEqual(apply_patch(old, diff), "a\nb\nc\nD\ne\nf\ng\n")
+
+    def testApplyPatchWithFuzz(self):
+        """Testing apply_patch leaving hunks that need fuzz to patch"""
+        for old, diff in self.FUZZ_CASES:
+            self.assertRaises(PatchError, lambda: apply_patch(old, diff))
+
+        # patch rejects this one, rather than applying it with fuzz.
+        self.assertRaises(PatchError,
+                          lambda: apply_patch("b\nd\nd\nd\nq\nc\n",
+                                              "@@ -1,6 +1,6 @@\n b\n d\n d\n"
+                                              "-d\n+x\n d\n c\n"))
+
+    def testPatchWithFuzz(self):
+        """Testing diffutils.patch with fuzz against the patch program"""
+        for old, diff in self.FUZZ_CASES:
+            self.assertEqual(diffutils.patch(diff, old, "foo"),
+                             diffutils.patch_with_subprocess(diff, old,
+                                                             "foo"))
+
+    def testApplyPatchNoNewline(self):
+        """Testing apply_patch removing a trailing newline"""
+        old = "a\nb\n"
+        diff = "@@ -1,2 +1,2 @@\n a\n-b\n+b\n\\ No newline at end of file\n"
+        self.assertEqual(apply_patch(old, diff), "a\nb")
+
+    def testApplyPatchNewFile(self):
+        """Testing apply_patch creating a file"""
+        diff = "--- /dev/null\n+++ foo\n@@ -0,0 +1,2 @@\n+a\n+b\n"
+        self.assertEqual(apply_patch("", diff), "a\nb\n")
+
+    def testApplyPatchFailure(self):
+        """Testing apply_patch with a diff that doesn't apply"""
+        self.assertRaises(PatchError,
+                          lambda: apply_patch("a\nb\n",
+                                              "@@ -1 +1 @@\n-c\n+d\n"))
+        self.assertRaises(PatchError,
+                          lambda: apply_patch("a\n", "*** a\n--- b\n"
+                                              "***************\n"))
+
+    def _get_file(self, *relative):
+        f = open(os.path.join(*tuple([self.PREFIX] + list(relative))))
+        data = f.read()
+        f.close()
+        return data
+
+
+class WarmupPoolTest(unittest.TestCase):
+    """Unit tests for the background warm-up pool."""
+    def testRunsAllJobs(self):
+        """Testing that WarmupPool runs every queued job"""
+        results = []
+        pool = WarmupPool(num_workers=3, max_jobs_per_key=3)
+
+        for i in range(10):
+            self.assert_(pool.add_job(i % 2, results.append, (i,),
+                                      block=True))
+
+        pool.wait()
+        results.sort()
+        self.assertEqual(results, range(10))
+
+    def testLimitsJobsPerKey(self):
+        """Testing that WarmupPool limits concurrent jobs with the same key"""
+        lock = threading.Lock()
+        state = {'running': 0, 'max_running': 0}
+
+        def job():
+            lock.acquire()
+            state['running'] += 1
+            state['max_running'] = max(state['running'],
+                                       state['max_running'])
+            lock.release()
+
+            time.sleep(0.01)
+
+            lock.acquire()
+            state['running'] -= 1
+            lock.release()
+
+        pool = WarmupPool(num_workers=4, max_jobs_per_key=2)
+
+        for i in range(8):
+            pool.add_job('repository', job, block=True)
+
+        pool.wait()
+        self.assertEqual(state['max_running'], 2)
+
+    def testRunsOtherKeysWhileLimited(self):
+        """Testing that WarmupPool runs jobs for keys that aren't limited"""
+        release = threading.Event()
+        other_ran = threading.Event()
+        pool = WarmupPool(num_workers=3, max_jobs_per_key=1)
+
+        for i in range(3):
+            pool.add_job('busy', release.wait, block=True)
+
+        pool.add_job('other', other_ran.set, block=True)
+
+        other_ran.wait(5)
+        self.assert_(other_ran.isSet())
+
+        release.set()
+        pool.wait()
+
+    def testChunksCacheKey(self):
+        """Testing that warm-up and the diff viewer share chunk cache keys"""
+        filediff = FileDiff(id=10)
+        interfilediff = FileDiff(id=11)
+        prefix = "diff-sidebyside-v%s-" % CHUNK_FORMAT_VERSION
+
+        self.assertEqual(diffutils.get_chunks_cache_key(filediff),
+                         prefix + "hl-10")
+        self.assertEqual(diffutils.get_chunks_cache_key(filediff, None, False,
+                                                        False),
+                         prefix + "10")
+        self.assertEqual(diffutils.get_chunks_cache_key(filediff,
+                                                        interfilediff, True),
+                         prefix + "hl-interdiff-10-11")
+        self.assertEqual(diffutils.get_chunks_cache_key(filediff, None, True),
+                         prefix + "hl-interdiff-10-none")
+
+
+class ChunkFormatTest(unittest.TestCase):
+    """Unit tests for the compact chunk encoding"""
+    CHUNKS = [
+        {
+            'lines': [
+                [1, 1, u'a', [], 1, u'a', [], False],
+                [2, 2, u'', [], 2, u'', [], False],
+                [3, 3, u'&lt;b&gt;', [], 3, u'&lt;b&gt;', [], False],
+            ],
+            'numlines': 3,
+            'change': 'equal',
+            'collapsable': True,
+            'meta': {},
+            'needs_highlighting': True,
+        },
+        {
+            'lines': [
+                [4, 4, u'c d', [(0, 1)], 4, u'c  e', [(0, 1), (3, 4)],
+                 True],
+                [5, 5, u'f', None, 5, u'\xe9', None, False],
+                [6, '', u'', [], 6, u'g', [], False],
+            ],
+            'numlines': 3,
+            'change': 'replace',
+            'collapsable': False,
+            'meta': {
+                'whitespace_chunk': False,
+                'whitespace_lines': [(4, 4)],
+            },
+        },
+        {
+            'lines': [],
+            'numlines': 0,
+            'change': 'equal',
+            'collapsable': False,
+            'meta': {},
+        },
+    ]
+
+    def testRoundTrip(self):
+        """Testing that chunks survive encoding and decoding"""
+        self.assertEqual(decode_chunks(encode_chunks(self.CHUNKS)),
+                         self.CHUNKS)
+        self.assertEqual(decode_chunks(encode_chunks([])), [])
+
+    def testDecodeInvalid(self):
+        """Testing decoding chunks in another format"""
+        data = encode_chunks(self.CHUNKS)
+
+        self.assertRaises(ChunkFormatError,
+                          lambda: decode_chunks(self.CHUNKS))
+        self.assertRaises(ChunkFormatError,
+                          lambda: decode_chunks((CHUNK_FORMAT_VERSION + 1,)
+                                                + data[1:]))
+        self.assertRaises(ChunkFormatError,
+                          lambda: decode_chunks(
+                              data[:2] +
+                              (data[2][:4] + ('',) + data[2][5:],)))
+
+    def testChunkIndex(self):
+        """Testing loading ranges of chunks from a ChunkIndex"""
+        class SmallBlockChunkIndex(ChunkIndex):
+            BLOCK_SIZE = 2
+
+        index = SmallBlockChunkIndex.from_chunks(self.CHUNKS)
+        self.assertEqual(index.block_starts, [0, 2, 4])
+        self.assertEqual(index.get_chunks(), self.CHUNKS)
+
+        blocks = [index.encode_block(block)
+                  for block in xrange(index.get_num_blocks())]
+        loaded = []
+
+        def load_blocks(block_nums):
+            loaded.extend(block_nums)
+            return [blocks[block] for block in block_nums]
+
+        index = ChunkIndex.decode(index.encode(), load_blocks)
+        chunks = index.get_chunks_in_range(2, 4)
+        self.assertEqual(loaded, [1])
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(chunks[0]['lines'], self.CHUNKS[0]['lines'][2:])
+        self.assertEqual(chunks[0]['numlines'], 1)
+        self.assertEqual(chunks[0]['change'], 'equal')
+        self.assertEqual(chunks[1]['lines'], self.CHUNKS[1]['lines'][:1])
+        self.assertEqual(chunks[1]['change'], 'replace')
+
+        self.assertEqual(index.get_chunks_in_range(5, 100)[0]['lines'],
+                         self.CHUNKS[1]['lines'][2:])
+        self.assertEqual(loaded, [1, 2])
+        self.assertEqual(index.get_chunks_in_range(6, 100), [])
+
+        self.assertEqual(index.get_chunks(), self.CHUNKS)
+        self.assertEqual(loaded, [1, 2, 0])
+
+    def testChunkIndexLongLines(self):
+        """Testing that long lines in a ChunkIndex start new blocks"""
+        class SmallByteChunkIndex(ChunkIndex):
+            MAX_BLOCK_BYTES = 4
+
+        index = SmallByteChunkIndex.from_chunks(self.CHUNKS)
+        self.assertEqual(index.block_starts, [0, 2, 3, 4])
+        self.assertEqual(index.get_chunks(), self.CHUNKS)
+
+    def testChunkIndexReload(self):
+        """Testing reloading a ChunkIndex whose blocks no longer match"""
+        class SmallBlockChunkIndex(ChunkIndex):
+            BLOCK_SIZE = 2
+
+        index = SmallBlockChunkIndex.from_chunks(self.CHUNKS)
+        blocks = [index.encode_block(block)
+                  for block in xrange(index.get_num_blocks())]
+
+        # The file changed after the index was cached, and the blocks were
+        # evicted, so they're generated again from the new content.
+        new_chunks = [self.CHUNKS[0]]
+        new_index = SmallBlockChunkIndex.from_chunks(new_chunks)
+
+        def load_blocks(block_nums):
+            if 2 in block_nums:
+                raise ChunkFormatError("The diff chunks have changed")
+
+            return [blocks[block] for block in block_nums]
+
+        def reload_index():
+            return new_index
+
+        index = ChunkIndex.decode(index.encode(), load_blocks)
+        self.assertEqual(index.get_chunks_in_range(0, 2)[0]['lines'],
+                         self.CHUNKS[0]['lines'][:2])
+        self.assertRaises(ChunkFormatError, index.get_chunks)
+
+        index = ChunkIndex.decode(index.encode(), load_blocks, reload_index)
+        self.assertEqual(index.get_chunks_in_range(4, 6), [])
+        self.assertEqual(index.get_chunks(), new_chunks)
+
+        # Blocks that don't fit the index are replaced the same way.
+        index = ChunkIndex.decode(SmallBlockChunkIndex.from_chunks(
+            self.CHUNKS).encode(), lambda block_nums: [blocks[0]],
+            reload_index)
+        self.assertEqual(index.get_chunks(), new_chunks)
+
+    def testChunkIndexPreload(self):
+        """Testing preloading several ranges of lines in a ChunkIndex"""
+        class SmallBlockChunkIndex(ChunkIndex):
+            BLOCK_SIZE = 2
+
+        index = SmallBlockChunkIndex.from_chunks(self.CHUNKS)
+        blocks = [index.encode_block(block)
+                  for block in xrange(index.get_num_blocks())]
+        calls = []
+
+        def load_blocks(block_nums):
+            calls.append(block_nums)
+            return [blocks[block] for block in block_nums]
+
+        index = ChunkIndex.decode(index.encode(), load_blocks)
+        index.preload([(5, 6), (0, 1), (1, 2), (0, 0)])
+        self.assertEqual(calls, [[0, 2]])
+
+        self.assertEqual(index.get_chunks_in_range(5, 6)[0]['lines'],
+                         self.CHUNKS[1]['lines'][2:])
+        self.assertEqual(index.get_chunks_in_range(0, 2)[0]['lines'],
+                         self.CHUNKS[0]['lines'][:2])
+        self.assertEqual(len(calls), 1)
+
+
 class HighlightRegionTest(TestCase):
     def setUp(self):
         siteconfig = SiteConfiguration.objects.get_current()
@@ -14,6 +14,7 @@ from djblets.util.misc import cache_memoize, get_object_or_none
 
 from reviewboard.diffviewer.models import DiffSet, FileDiff
 from reviewboard.diffviewer.diffutils import UserVisibleError, \
+                                             apply_pending_highlighting, \
                                              get_diff_files, \
                                              get_enable_highlighting
 
@@ -53,9 +54,16 @@ def build_diff_fragment(request, file, chunkindex, highlighting, collapseall,
 
     context['file'] = file
 
-    return cache_memoize(key,
-        lambda: render_to_string(template_name,
-                                 RequestContext(request, context)))
+    def render():
+        if not collapseall and not file['binary']:
+            # Collapsed chunks are about to be shown, and may not have
+            # been highlighted yet.
+            apply_pending_highlighting(file, file['chunks'])
+
+        return render_to_string(template_name,
+                                RequestContext(request, context))
+
+    return cache_memoize(key, render)
 
 
 def get_collapse_diff(request):
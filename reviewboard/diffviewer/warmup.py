@@ -0,0 +1,270 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection
+from djblets.siteconfig.models import SiteConfiguration
+
+from reviewboard.admin.checks import get_can_enable_syntax_highlighting
+from reviewboard.diffviewer.diffutils import get_cached_chunks, \
+                                            prefetch_original_files
+
+
+class WarmupPool(object):
+    """
+    A bounded pool of worker threads that run jobs in the background.
+
+    Every job is queued along with a key, such as a repository ID. No more
+    than max_jobs_per_key jobs sharing a key will run at once, which keeps
+    a large upload from tying up every connection to a single repository.
+    Jobs run in the order they were queued, except that jobs whose key is
+    at its limit are passed over, so that they don't hold up the workers
+    while jobs for other keys are waiting.
+
+    Workers are started the first time a job is added.
+    """
+    MAX_QUEUED_JOBS = 1000
+
+    def __init__(self, num_workers=4, max_jobs_per_key=2):
+        self.num_workers = max(num_workers, 1)
+        self.max_jobs_per_key = max(max_jobs_per_key, 1)
+        self.workers = []
+
+        self._lock = threading.Lock()
+        self._jobs = []
+        self._running = {}
+        self._pending = 0
+        self._pending_cond = threading.Condition(self._lock)
+        self._jobs_cond = threading.Condition(self._lock)
+        self._space_cond = threading.Condition(self._lock)
+
+    def add_job(self, key, func, args=(), block=False):
+        """
+        Queues a job to run func(*args) in the background.
+
+        If block is True, this waits for room in the queue. Otherwise, the
+        job is dropped when the queue is full. Returns whether the job was
+        queued.
+        """
+        self._start_workers()
+
+        self._lock.acquire()
+
+        try:
+            while len(self._jobs) >= self.MAX_QUEUED_JOBS:
+                if not block:
+                    return False
+
+                self._space_cond.wait()
+
+            self._jobs.append((key, func, args))
+            self._pending += 1
+            self._jobs_cond.notifyAll()
+        finally:
+            self._lock.release()
+
+        return True
+
+    def wait(self):
+        """
+        Waits until every queued job has finished running.
+        """
+        self._lock.acquire()
+
+        try:
+            while self._pending > 0:
+                self._pending_cond.wait()
+        finally:
+            self._lock.release()
+
+    def _start_workers(self):
+        self._lock.acquire()
+
+        try:
+            while len(self.workers) < self.num_workers:
+                worker = threading.Thread(target=self._run_worker)
+                worker.setDaemon(True)
+                worker.start()
+                self.workers.append(worker)
+        finally:
+            self._lock.release()
+
+    def _take_job(self):
+        """
+        Removes and returns the first queued job whose key is below its
+        limit of running jobs, or None if there isn't one. This must be
+        called with the lock held.
+        """
+        for i, job in enumerate(self._jobs):
+            key = job[0]
+            running = self._running.get(key, 0)
+
+            if running < self.max_jobs_per_key:
+                del self._jobs[i]
+                self._running[key] = running + 1
+                self._space_cond.notify()
+
+                return job
+
+        return None
+
+    def _job_done(self, key):
+        self._lock.acquire()
+
+        try:
+            self._running[key] -= 1
+
+            if self._running[key] == 0:
+                del self._running[key]
+
+            self._pending -= 1
+            self._pending_cond.notifyAll()
+
+            # Jobs that were passed over for this key may be able to run now.
+            self._jobs_cond.notifyAll()
+        finally:
+            self._lock.release()
+
+    def _run_worker(self):
+        while True:
+            self._lock.acquire()
+
+            try:
+                job = self._take_job()
+
+                while job is None:
+                    self._jobs_cond.wait()
+                    job = self._take_job()
+            finally:
+                self._lock.release()
+
+            key, func, args = job
+
+            try:
+                try:
+                    func(*args)
+                except Exception, e:
+                    logging.error("Background job %r failed: %s" % (func, e),
+                                  exc_info=1)
+            finally:
+                self._job_done(key)
+
+
+_warmup_pool = None
+_warmup_pool_lock = threading.Lock()
+
+
+def get_warmup_pool():
+    """
+    Returns the process-wide pool used for warming up diff chunks, creating
+    it from the site configuration the first time it's needed.
+    """
+    global _warmup_pool
+
+    _warmup_pool_lock.acquire()
+
+    try:
+        if _warmup_pool is None:
+            siteconfig = SiteConfiguration.objects.get_current()
+            _warmup_pool = WarmupPool(
+                siteconfig.get('diffviewer_warmup_workers'),
+                siteconfig.get('diffviewer_warmup_repository_workers'))
+
+        return _warmup_pool
+    finally:
+        _warmup_pool_lock.release()
+
+
+def _warm_filediff(filediff, enable_syntax_highlighting):
+    try:
+        get_cached_chunks(filediff,
+                          enable_syntax_highlighting=enable_syntax_highlighting)
+    finally:
+        # Each worker thread gets its own database connection. Don't hold
+        # it open while the worker sits idle.
+        connection.close()
+
+
+def _queue_filediffs(pool, filediffs, enable_syntax_highlighting, block):
+    """
+    Queues a job to warm up each of the filediffs, returning the number
+    that were queued.
+    """
+    num_queued = 0
+
+    for filediff in filediffs:
+        if pool.add_job(filediff.diffset.repository_id, _warm_filediff,
+                        (filediff, enable_syntax_highlighting), block):
+            num_queued += 1
+        else:
+            logging.debug("Diff warm-up queue is full. Skipping filediff %s"
+                          % filediff.id)
+
+    return num_queued
+
+
+def _warm_diffset(pool, filediffs, enable_syntax_highlighting):
+    try:
+        prefetch_original_files(filediffs)
+    finally:
+        connection.close()
+
+    # This runs in a worker, so it must not wait for room in the queue.
+    # The workers that would make room could all be waiting here.
+    _queue_filediffs(pool, filediffs, enable_syntax_highlighting, False)
+
+
+def warm_filediffs(filediffs, wait=False):
+    """
+    Generates and caches the chunks for each of the given filediffs in the
+    background, so that the first person to view the diff doesn't have to
+    wait for them.
+
+    Chunks are generated with the site's default syntax highlighting
+    setting, which is what most users will be viewing them with.
+
+    If wait is True, the original files are fetched and the jobs are queued
+    from the calling thread, which blocks until all chunks have been
+    generated. Otherwise, files that don't fit in the queue are skipped,
+    and their chunks will be generated when they're first viewed.
+
+    Returns the number of filediffs that were queued. Without wait, the
+    files are queued by a background job, and any skipped there are still
+    counted.
+    """
+    siteconfig = SiteConfiguration.objects.get_current()
+
+    if not wait and (not siteconfig.get('diffviewer_warmup_enable') or
+                     getattr(settings, "RUNNING_TEST", False)):
+        # Background threads would race with the test database, so unit
+        # tests only ever warm up chunks when asked to wait.
+        return 0
+
+    enable_syntax_highlighting = \
+        (siteconfig.get('diffviewer_syntax_highlighting') and
+         get_can_enable_syntax_highlighting()[0])
+
+    filediffs = [filediff for filediff in filediffs if not filediff.binary]
+
+    if not filediffs:
+        return 0
+
+    # The original files are fetched first, all at once, and then each
+    # file's chunks are generated as a separate job.
+    pool = get_warmup_pool()
+
+    if wait:
+        prefetch_original_files(filediffs)
+        num_queued = _queue_filediffs(pool, filediffs,
+                                      enable_syntax_highlighting, True)
+        pool.wait()
+
+        return num_queued
+
+    if not pool.add_job(filediffs[0].diffset.repository_id, _warm_diffset,
+                        (pool, filediffs, enable_syntax_highlighting)):
+        logging.debug("Diff warm-up queue is full. Skipping %d filediffs"
+                      % len(filediffs))
+        return 0
+
+    return len(filediffs)
@@ -325,8 +325,12 @@ $.extend(RB.ReviewRequest.prototype, {
         this.checkUpdatesType = type;
         this.lastUpdateTimestamp = lastUpdateTimestamp;
 
-        setTimeout(function() { self._checkForUpdates(); },
-                   RB.ReviewRequest.CHECK_UPDATES_MSECS);
+        if (LONG_POLL_UPDATES) {
+            this._waitForUpdates();
+        } else {
+            setTimeout(function() { self._checkForUpdates(); },
+                       RB.ReviewRequest.CHECK_UPDATES_MSECS);
+        }
     },
 
     _checkForUpdates: function() {
@@ -337,13 +341,7 @@ $.extend(RB.ReviewRequest.prototype, {
             noActivityIndicator: true,
             path: "/last-update/",
             success: function(rsp) {
-                if ((self.checkUpdatesType == undefined ||
-                     self.checkUpdatesType == rsp.type) &&
-                    self.lastUpdateTimestamp != rsp.timestamp) {
-                    $.event.trigger("updated", [rsp], self);
-                }
-
-                self.lastUpdateTimestamp = rsp.timestamp;
+                self._handleUpdate(rsp);
 
                 setTimeout(function() { self._checkForUpdates(); },
                            RB.ReviewRequest.CHECK_UPDATES_MSECS);
@@ -351,6 +349,36 @@ $.extend(RB.ReviewRequest.prototype, {
         });
     },
 
+    _waitForUpdates: function() {
+        var self = this;
+
+        this._apiCall({
+            type: "GET",
+            noActivityIndicator: true,
+            path: "/wait-for-update/",
+            data: { since: this.lastUpdateTimestamp },
+            success: function(rsp) {
+                self._handleUpdate(rsp);
+                self._waitForUpdates();
+            },
+            error: function() {
+                /* Back off, so a server problem isn't made worse. */
+                setTimeout(function() { self._waitForUpdates(); },
+                           RB.ReviewRequest.CHECK_UPDATES_MSECS);
+            }
+        });
+    },
+
+    _handleUpdate: function(rsp) {
+        if ((this.checkUpdatesType == undefined ||
+             this.checkUpdatesType == rsp.type) &&
+            this.lastUpdateTimestamp != rsp.timestamp) {
+            $.event.trigger("updated", [rsp], this);
+        }
+
+        this.lastUpdateTimestamp = rsp.timestamp;
+    },
+
     _apiCall: function(options) {
         var self = this;
 
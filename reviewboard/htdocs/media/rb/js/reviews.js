@@ -2,6 +2,7 @@
 var gPublishing = false;
 var gPendingSaveCount = 0;
 var gPendingDiffFragments = {};
+var DIFF_FRAGMENT_BATCH_SIZE = 25;
 var gReviewBanner = $("#review-banner");
 var gDraftBanner = $("#draft-banner");
 var gDraftBannerButtons = $("input", gDraftBanner);
@@ -1141,26 +1142,34 @@ function loadDiffFragments(queue_name, container_prefix) {
 
     for (var key in gPendingDiffFragments[queue_name]) {
         var comments = gPendingDiffFragments[queue_name][key];
-        var url = gReviewRequestPath + "fragments/diff-comments/";
 
-        for (var i = 0; i < comments.length; i++) {
-            url += comments[i];
-
-            if (i != comments.length - 1) {
-                url += ","
-            }
+        /*
+         * Files with many comments are loaded a batch at a time, so that
+         * the first fragments show up while the rest are still rendering.
+         */
+        for (var i = 0; i < comments.length; i += DIFF_FRAGMENT_BATCH_SIZE) {
+            var url = gReviewRequestPath + "fragments/diff-comments/" +
+                      comments.slice(i, i + DIFF_FRAGMENT_BATCH_SIZE)
+                              .join(",") +
+                      "/?queue=" + queue_name +
+                      "&container_prefix=" + container_prefix +
+                      "&" + AJAX_SERIAL;
+
+            $.funcQueue(queue_name).add(function(url) {
+                return function() {
+                    var e = document.createElement("script");
+                    e.type = "text/javascript";
+                    e.src = url;
+
+                    // Don't hold up the remaining batches if this one fails.
+                    e.onerror = function() {
+                        $.funcQueue(queue_name).next();
+                    };
+
+                    document.body.appendChild(e);
+                };
+            }(url));
         }
-
-        url += "/?queue=" + queue_name +
-               "&container_prefix=" + container_prefix +
-               "&" + AJAX_SERIAL;
-
-        $.funcQueue("diff_comments").add(function(url) {
-            var e = document.createElement("script");
-            e.type = "text/javascript";
-            e.src = url;
-            document.body.appendChild(e);
-        }(url));
     }
 
     // Clear the list.
@@ -88,7 +88,7 @@ def check_dependencies():
     except ImportError:
         dependency_warning('hg not found.  Mercurial integration will not work.')
 
-    for check_func in (checks.get_can_enable_search,
+    for check_func in (checks.get_can_use_lucene_search,
                        checks.get_can_enable_syntax_highlighting):
         success, reason = check_func()
 
@@ -0,0 +1,20 @@
+from reviewboard.signals import initializing
+
+
+def connect_signals(**kwargs):
+    """
+    Listens to the ``initializing`` signal and connects the signals that
+    keep the cached dashboard counts and review request recipients up to
+    date and announce updates to review requests.
+    """
+    from django.db.models.signals import pre_delete
+
+    from reviewboard.reviews import counts, updates
+    from reviewboard.reviews.models import Group, group_deleted_cb
+
+    counts.connect_signals()
+    updates.connect_signals()
+    pre_delete.connect(group_deleted_cb, sender=Group)
+
+
+initializing.connect(connect_signals)
@@ -1,10 +1,12 @@
 from django.contrib import admin
+from django.contrib.auth.models import User
 from django.utils.translation import ugettext_lazy as _
 
 from reviewboard.reviews.forms import DefaultReviewerForm
 from reviewboard.reviews.models import Comment, DefaultReviewer, Group, \
                                        Review, ReviewRequest, \
-                                       ReviewRequestDraft, Screenshot, \
+                                       ReviewRequestDraft, \
+                                       ReviewRequestRecipient, Screenshot, \
                                        ScreenshotComment
 
 
@@ -40,6 +42,24 @@ class GroupAdmin(admin.ModelAdmin):
     list_display = ('name', 'display_name', 'mailing_list')
     filter_horizontal = ('users',)
 
+    def save_model(self, request, obj, form, change):
+        if change:
+            old_user_ids = set(obj.users.values_list('id', flat=True))
+        else:
+            old_user_ids = set()
+
+        obj.save()
+
+        # The recipients need the new list of users, which the admin would
+        # otherwise only save after this returns.
+        form.save_m2m()
+
+        new_user_ids = set(obj.users.values_list('id', flat=True))
+
+        for user in User.objects.filter(
+            pk__in=list(old_user_ids ^ new_user_ids)):
+            ReviewRequestRecipient.objects.update_for_user(user)
+
 
 class ReviewAdmin(admin.ModelAdmin):
     list_display = ('review_request', 'user', 'public', 'ship_it',
@@ -58,6 +78,15 @@ class ReviewRequestAdmin(admin.ModelAdmin):
                      'inactive_screenshots')
     filter_horizontal = ('target_people',)
 
+    def save_model(self, request, obj, form, change):
+        obj.save()
+
+        # The recipients need the new targets, which the admin would
+        # otherwise only save after this returns.
+        form.save_m2m()
+
+        ReviewRequestRecipient.objects.update_for_review_request(obj)
+
 
 class ReviewRequestDraftAdmin(admin.ModelAdmin):
     list_display = ('summary', 'submitter', 'last_updated')
@@ -0,0 +1,218 @@
+import time
+from sha import sha
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.query import QuerySet
+from django.db.models.signals import post_save, pre_delete
+
+from reviewboard.reviews.models import ReviewRequest
+from reviewboard.reviews.signals import review_request_published
+
+
+# The views in the dashboard sidebar that show a count of review requests.
+COUNTED_VIEWS = ['all', 'outgoing', 'mine', 'incoming', 'to-me', 'to-group',
+                 'starred']
+
+
+def get_dashboard_review_requests(user, view, group=None):
+    """
+    Returns the review requests shown in the dashboard for the given view,
+    as a queryset or list.
+    """
+    if view == 'all':
+        return ReviewRequest.objects.public(user)
+    elif view == 'outgoing':
+        return ReviewRequest.objects.from_user(user.username, user)
+    elif view == 'mine':
+        return ReviewRequest.objects.from_user(user.username, user, None)
+    elif view == 'incoming':
+        return ReviewRequest.objects.to_user(user.username, user)
+    elif view == 'to-me':
+        return ReviewRequest.objects.to_user_directly(user.username, user)
+    elif view == 'to-group':
+        return ReviewRequest.objects.to_group(group.name, user)
+    elif view == 'starred':
+        return user.get_profile().starred_review_requests.public(user)
+    else:
+        raise ValueError("Invalid dashboard view '%s'" % view)
+
+
+def count_dashboard_review_requests(user, view, group=None):
+    """
+    Counts the review requests in a dashboard view, straight from the
+    database.
+    """
+    review_requests = get_dashboard_review_requests(user, view, group)
+
+    if isinstance(review_requests, QuerySet):
+        return review_requests.count()
+    else:
+        return len(review_requests)
+
+
+def get_dashboard_count(user, view, group=None):
+    """
+    Returns the number of review requests in a dashboard view.
+
+    Counts are cached, and keyed off the generations of everything that can
+    affect them: the user, the group for 'to-group', every group the user
+    belongs to for 'incoming', and any review request at all for 'all'.
+    When a review request changes, the generations of the users and groups
+    it belongs to are bumped, so their stale counts are never looked up
+    again.
+    """
+    gen_keys = [_get_gen_key('global'), _get_gen_key('user', user.id)]
+
+    if view == 'all':
+        gen_keys.append(_get_gen_key('all'))
+    elif view == 'to-group':
+        gen_keys.append(_get_gen_key('group', group.id))
+    elif view == 'incoming':
+        gen_keys += [_get_gen_key('group', group_id)
+                     for group_id in user.review_groups.values_list('id',
+                                                                    flat=True)]
+
+    if view == 'to-group':
+        key = 'dashboard-count-%s-%s-%s' % (view, user.id, group.id)
+    else:
+        key = 'dashboard-count-%s-%s' % (view, user.id)
+
+    # A user can be in any number of groups, so the generations are hashed
+    # to keep the key short enough for memcached.
+    gens = _get_generations(gen_keys)
+    key += '-' + sha(','.join(['%s=%s' % (gen_key, gen)
+                               for gen_key, gen in zip(gen_keys, gens)])) \
+                 .hexdigest()
+
+    count = cache.get(key)
+
+    if count is None:
+        count = count_dashboard_review_requests(user, view, group)
+        cache.set(key, count, settings.CACHE_EXPIRATION_TIME)
+
+    return count
+
+
+def invalidate_user_counts(user_ids):
+    """
+    Invalidates the cached dashboard counts for the given users.
+    """
+    _bump_generations([_get_gen_key('user', user_id)
+                       for user_id in user_ids])
+
+
+def invalidate_review_request_counts(review_request, user_ids=[],
+                                     group_ids=[]):
+    """
+    Invalidates the cached counts of every dashboard view the review request
+    may be in. These are the views of the submitter, the target people,
+    anyone who starred it, and the target groups, along with 'all'.
+
+    Any other users or groups that it was just removed from can be passed
+    in user_ids and group_ids.
+    """
+    user_ids = set(user_ids)
+    user_ids.add(review_request.submitter_id)
+    user_ids.update(review_request.target_people.values_list('id',
+                                                             flat=True))
+    user_ids.update(review_request.starred_by.values_list('user',
+                                                          flat=True))
+
+    group_ids = set(group_ids)
+    group_ids.update(review_request.target_groups.values_list('id',
+                                                              flat=True))
+
+    gen_keys = [_get_gen_key('all')]
+    gen_keys += [_get_gen_key('user', user_id) for user_id in user_ids]
+    gen_keys += [_get_gen_key('group', group_id) for group_id in group_ids]
+
+    _bump_generations(gen_keys)
+
+
+def invalidate_all_counts():
+    """
+    Invalidates every cached dashboard count.
+    """
+    _bump_generations([_get_gen_key('global')])
+
+
+def review_request_saved_cb(sender, instance, **kwargs):
+    """
+    Listens to ReviewRequest saves, which cover creating, publishing,
+    closing and reopening review requests, and invalidates the counts
+    that may include it.
+    """
+    invalidate_review_request_counts(instance)
+
+
+def review_request_deleted_cb(sender, instance, **kwargs):
+    """
+    Listens to ReviewRequest deletions and invalidates the counts that
+    included it.
+    """
+    invalidate_review_request_counts(instance)
+
+
+def review_request_published_cb(sender, user, review_request, changedesc,
+                                **kwargs):
+    """
+    Listens to the ``review_request_published`` signal and invalidates the
+    counts of any people or groups that were removed from the review
+    request. The save that published it covers the rest.
+    """
+    if not changedesc:
+        return
+
+    fields = changedesc.fields_changed
+    user_ids = []
+    group_ids = []
+
+    if 'target_people' in fields:
+        user_ids = [item[2] for item in fields['target_people']['removed']]
+
+    if 'target_groups' in fields:
+        group_ids = [item[2] for item in fields['target_groups']['removed']]
+
+    if user_ids or group_ids:
+        invalidate_review_request_counts(review_request, user_ids, group_ids)
+
+
+def connect_signals():
+    post_save.connect(review_request_saved_cb, sender=ReviewRequest)
+    pre_delete.connect(review_request_deleted_cb, sender=ReviewRequest)
+    review_request_published.connect(review_request_published_cb,
+                                     sender=ReviewRequest)
+
+
+def _get_gen_key(*parts):
+    return 'dashboard-count-gen-%s' % '-'.join([str(part) for part in parts])
+
+
+def _get_generations(gen_keys):
+    gens = cache.get_many(gen_keys)
+    result = []
+
+    for gen_key in gen_keys:
+        gen = gens.get(gen_key)
+
+        if gen is None:
+            gen = _new_generation()
+            cache.add(gen_key, gen, settings.CACHE_EXPIRATION_TIME)
+
+        result.append(gen)
+
+    return result
+
+
+def _bump_generations(gen_keys):
+    gen = _new_generation()
+
+    for gen_key in gen_keys:
+        cache.set(gen_key, gen, settings.CACHE_EXPIRATION_TIME)
+
+
+def _new_generation():
+    # A time-based generation keeps working if the cache evicts it, as
+    # it'll never go back to a value used before.
+    return '%d' % (time.time() * 1000000)
@@ -1,6 +1,9 @@
+import logging
+
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.utils.html import conditional_escape
 from django.utils.translation import ugettext_lazy as _
 from djblets.datagrid.grids import Column, DateTimeColumn, \
@@ -26,7 +29,14 @@ class StarColumn(Column):
         self.shrink = True
 
     def render_data(self, obj):
-        return render_star(self.datagrid.request.user, obj)
+        # Review requests loaded for the datagrid already know whether
+        # they're starred. See ReviewRequestQuerySet.with_datagrid_fields.
+        if hasattr(obj, "is_starred"):
+            starred = obj.is_starred > 0
+        else:
+            starred = None
+
+        return render_star(self.datagrid.request.user, obj, starred)
 
 
 class ShipItColumn(Column):
@@ -80,37 +90,43 @@ class MyCommentsColumn(Column):
         if user.is_anonymous():
             return ""
 
-        reviews = review_request.reviews.filter(user=user)
+        if hasattr(review_request, "my_review_count"):
+            if review_request.my_review_count == 0:
+                return ""
 
-        if len(reviews) == 0:
-            return ""
+            found_draft = review_request.my_draft_review_count > 0
+            found_ship_it = review_request.my_ship_it_count > 0
+        else:
+            reviews = review_request.reviews.filter(user=user)
 
-        image_url = None
-        image_alt = None
-        found_ship_it = False
+            if len(reviews) == 0:
+                return ""
+
+            found_draft = False
+            found_ship_it = False
+
+            for review in reviews:
+                if not review.public:
+                    found_draft = True
+
+                if review.ship_it:
+                    found_ship_it = True
 
         # Priority is ranked in the following order:
         #
         # 1) Non-public (draft) reviews
         # 2) Public reviews marked "Ship It"
         # 3) Public reviews not marked "Ship It"
-        for review in reviews:
-            if not review.public:
-                image_url = self.image_url
-                image_alt = _("Comments drafted")
-                break
-
-            if review.ship_it:
-                found_ship_it = True
-
-        if not image_url:
-            if found_ship_it:
-                image_url = settings.MEDIA_URL + \
-                            "rb/images/comment-shipit-small.png"
-                image_alt = _("Comments published. Ship it!")
-            else:
-                image_url = settings.MEDIA_URL + "rb/images/comment-small.png"
-                image_alt = _("Comments published")
+        if found_draft:
+            image_url = self.image_url
+            image_alt = _("Comments drafted")
+        elif found_ship_it:
+            image_url = settings.MEDIA_URL + \
+                        "rb/images/comment-shipit-small.png"
+            image_alt = _("Comments published. Ship it!")
+        else:
+            image_url = settings.MEDIA_URL + "rb/images/comment-small.png"
+            image_alt = _("Comments published")
 
         return '<img src="%s?%s" width="%s" height="%s" alt="%s" ' \
                'title="%s" />' % \
@@ -157,13 +173,18 @@ class SummaryColumn(Column):
         if not summary:
             summary = '&nbsp;<i>%s</i>' % _('No Summary')
 
-        if review_request.submitter == self.datagrid.request.user:
-            try:
-                draft = review_request.draft.get()
-                summary = conditional_escape(draft.summary)
+        if review_request.submitter_id == self.datagrid.request.user.id:
+            if hasattr(review_request, "draft_summary"):
+                draft_summary = review_request.draft_summary
+            else:
+                try:
+                    draft_summary = review_request.draft.get().summary
+                except ReviewRequestDraft.DoesNotExist:
+                    draft_summary = None
+
+            if draft_summary is not None:
+                summary = conditional_escape(draft_summary)
                 return self.__labeled_summary(_('Draft'), summary)
-            except ReviewRequestDraft.DoesNotExist:
-                pass
 
             if (not review_request.public and
                 review_request.status == ReviewRequest.PENDING_REVIEW):
@@ -223,6 +244,9 @@ class ReviewCountColumn(Column):
         self.link_func = self.link_to_object
 
     def render_data(self, review_request):
+        if hasattr(review_request, "public_review_count"):
+            return str(review_request.public_review_count)
+
         return str(review_request.get_public_reviews().count())
 
     def link_to_object(self, review_request, value):
@@ -311,8 +335,25 @@ class ReviewRequestDataGrid(DataGrid):
 
         return False
 
+    def precompute_objects(self):
+        if not settings.DEBUG:
+            DataGrid.precompute_objects(self)
+            return
+
+        # Rendering the rows should take the same handful of queries no
+        # matter how many rows there are. Log the count so regressions
+        # are easy to spot.
+        num_queries = len(connection.queries)
+        DataGrid.precompute_objects(self)
+
+        logging.debug("%s: rendered %d rows using %d queries" %
+                      (self.__class__.__name__, len(self.rows),
+                       len(connection.queries) - num_queries))
+
     def post_process_queryset(self, queryset):
-        return queryset.with_counts(self.request.user)
+        user = self.request.user
+
+        return queryset.with_counts(user).with_datagrid_fields(user)
 
     def link_to_object(self, obj, value):
         if value and isinstance(value, User):
@@ -3,4 +3,6 @@ SEQUENCE = [
     'last_review_timestamp',
     'shipit_count',
     'default_reviewer_repositories',
+    'last_activity',
+    'last_updated_index',
 ]
@@ -0,0 +1,67 @@
+from django.db import models
+
+from django_evolution.mutations import AddField, SQLMutation
+
+
+MUTATIONS = [
+    AddField('ReviewRequest', 'last_activity_time', models.DateTimeField,
+             null=True),
+    AddField('ReviewRequest', 'last_activity_type', models.CharField,
+             initial='', max_length=16),
+    AddField('ReviewRequest', 'last_activity_user', models.ForeignKey,
+             null=True, related_model='auth.User'),
+    SQLMutation('populate_last_activity', ["""
+        UPDATE reviews_reviewrequest
+           SET last_activity_time = last_updated,
+               last_activity_type = 'review-request',
+               last_activity_user_id = submitter_id
+""", """
+        UPDATE reviews_reviewrequest
+           SET last_activity_time = (
+                   SELECT MAX(diffviewer_diffset.timestamp)
+                     FROM diffviewer_diffset
+                    WHERE diffviewer_diffset.history_id =
+                          reviews_reviewrequest.diffset_history_id),
+               last_activity_type = 'diff',
+               last_activity_user_id = NULL
+         WHERE (SELECT MAX(diffviewer_diffset.timestamp)
+                  FROM diffviewer_diffset
+                 WHERE diffviewer_diffset.history_id =
+                       reviews_reviewrequest.diffset_history_id) >=
+               last_activity_time
+""", """
+        UPDATE reviews_reviewrequest
+           SET last_activity_time = (
+                   SELECT reviews_review.timestamp
+                     FROM reviews_review
+                    WHERE reviews_review.review_request_id =
+                          reviews_reviewrequest.id
+                      AND reviews_review.public
+                    ORDER BY reviews_review.timestamp DESC
+                    LIMIT 1),
+               last_activity_type = (
+                   SELECT CASE WHEN reviews_review.base_reply_to_id IS NULL
+                               THEN 'review'
+                               ELSE 'reply'
+                          END
+                     FROM reviews_review
+                    WHERE reviews_review.review_request_id =
+                          reviews_reviewrequest.id
+                      AND reviews_review.public
+                    ORDER BY reviews_review.timestamp DESC
+                    LIMIT 1),
+               last_activity_user_id = (
+                   SELECT reviews_review.user_id
+                     FROM reviews_review
+                    WHERE reviews_review.review_request_id =
+                          reviews_reviewrequest.id
+                      AND reviews_review.public
+                    ORDER BY reviews_review.timestamp DESC
+                    LIMIT 1)
+         WHERE (SELECT MAX(reviews_review.timestamp)
+                  FROM reviews_review
+                 WHERE reviews_review.review_request_id =
+                       reviews_reviewrequest.id
+                   AND reviews_review.public) >= last_activity_time
+"""])
+]
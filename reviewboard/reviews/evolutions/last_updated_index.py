@@ -0,0 +1,6 @@
+from django_evolution.mutations import ChangeField
+
+
+MUTATIONS = [
+    ChangeField('ReviewRequest', 'last_updated', initial=None, db_index=True)
+]
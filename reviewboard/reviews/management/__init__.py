@@ -0,0 +1,16 @@
+from django.db.models import signals
+
+from reviewboard.reviews import models as reviews_app
+from reviewboard.reviews.models import ReviewRequestRecipient
+
+
+def init_recipients(app, created_models, **kwargs):
+    """
+    Fills in the recipients of any existing review requests when upgrading
+    from a version without them.
+    """
+    if ReviewRequestRecipient in created_models:
+        ReviewRequestRecipient.objects.rebuild()
+
+
+signals.post_syncdb.connect(init_recipients, sender=reviews_app)
@@ -0,0 +1,77 @@
+import optparse
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import NoArgsCommand
+
+from reviewboard.accounts.models import Profile
+from reviewboard.reviews.counts import count_dashboard_review_requests, \
+                                       get_dashboard_count, \
+                                       invalidate_user_counts
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        optparse.make_option('--user', action='append', dest='usernames',
+                             default=[],
+                             help='Check the counts for this user. '
+                                  'May be given more than once.'),
+        optparse.make_option('--fix', action='store_true', dest='fix',
+                             default=False,
+                             help='Invalidate the cached counts of any '
+                                  'users whose counts are wrong'),
+        )
+    help = "Compares the cached review request counts in the dashboard " \
+           "sidebar against the database, and reports any that differ"
+    requires_model_validation = True
+
+    def handle_noargs(self, **options):
+        usernames = options.get('usernames')
+
+        if usernames:
+            users = User.objects.filter(username__in=usernames)
+        else:
+            users = User.objects.filter(is_active=True)
+
+        num_users = 0
+        bad_user_ids = []
+
+        for user in users:
+            num_users += 1
+            entries = [('outgoing', None), ('mine', None),
+                       ('incoming', None), ('to-me', None)]
+            groups = set(user.review_groups.all())
+
+            try:
+                profile = user.get_profile()
+                entries.append(('starred', None))
+                groups.update(profile.starred_groups.all())
+            except Profile.DoesNotExist:
+                # The user has never logged in, so there's nothing starred.
+                pass
+
+            entries += [('to-group', group) for group in groups]
+
+            for view, group in entries:
+                cached = get_dashboard_count(user, view, group)
+                actual = count_dashboard_review_requests(user, view, group)
+
+                if cached != actual:
+                    name = view
+
+                    if group:
+                        name += ' %s' % group.name
+
+                    sys.stdout.write("%s: %s is %d, should be %d\n" %
+                                     (user.username, name, cached, actual))
+
+                    if user.id not in bad_user_ids:
+                        bad_user_ids.append(user.id)
+
+        if bad_user_ids and options.get('fix'):
+            invalidate_user_counts(bad_user_ids)
+            sys.stdout.write("Invalidated the counts for %d users.\n" %
+                             len(bad_user_ids))
+
+        sys.stdout.write("Checked the counts for %d users, %d wrong.\n" %
+                         (num_users, len(bad_user_ids)))
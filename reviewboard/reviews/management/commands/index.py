@@ -1,25 +1,19 @@
-from datetime import datetime
 import os
 import optparse
 import sys
 import time
 
 from django.core.management.base import NoArgsCommand
-from django.db.models import Q
+from django.utils.html import striptags
 
 from djblets.siteconfig.models import SiteConfiguration
 
-from reviewboard.reviews.models import ReviewRequest
-
-try:
-    import lucene
-    lucene.initVM(lucene.CLASSPATH)
-    have_lucene = True
-except ImportError:
-    # This is here just in case someone is misconfigured but manages to
-    # skip the dependency checks inside manage.py (perhaps they have
-    # DEBUG = False)
-    have_lucene = False
+from reviewboard.reviews.search import INDEXED_STATUSES, \
+                                       advance_watermark, get_file_paths, \
+                                       get_pending_review_requests, \
+                                       get_search_backend, \
+                                       get_search_fields, load_watermark, \
+                                       save_watermark
 
 
 class Command(NoArgsCommand):
@@ -27,10 +21,21 @@ class Command(NoArgsCommand):
         optparse.make_option('--full', action='store_false',
                              dest='incremental', default=True,
                              help='Do a full (level-0) index of the database'),
+        optparse.make_option('--watch', action='store_true',
+                             dest='watch', default=False,
+                             help='Keep running, and index changes as they '
+                                  'happen'),
         )
     help = "Creates a search index of review requests"
     requires_model_validation = True
 
+    # The number of review requests indexed before the changes are
+    # committed and the watermark is saved.
+    BATCH_SIZE = 100
+
+    # How often, in seconds, to look for changes when using --watch.
+    WATCH_INTERVAL = 10
+
     def handle_noargs(self, **options):
         siteconfig = SiteConfiguration.objects.get_current()
 
@@ -41,134 +46,90 @@ class Command(NoArgsCommand):
                              'settings to run this command.\n')
             sys.exit(1)
 
-        if not have_lucene:
-            sys.stderr.write('PyLucene is required to build the search index.\n')
-            sys.exit(1)
+        self.backend = get_search_backend()
+        available, reason = self.backend.is_available()
 
-        incremental = options.get('incremental', True)
+        if not available:
+            sys.stderr.write('%s\n' % striptags(reason))
+            sys.exit(1)
 
-        store_dir = siteconfig.get("search_index_file")
+        store_dir = self.backend.index_dir
         if not os.path.exists(store_dir):
-            os.mkdir(store_dir)
-        timestamp_file = os.path.join(store_dir, 'timestamp')
-
-        timestamp = 0
-        if incremental:
-            try:
-                f = open(timestamp_file, 'r')
-                timestamp = datetime.fromtimestamp(int(f.read()))
-                f.close()
-            except IOError:
-                incremental = False
-
-        f = open(timestamp_file, 'w')
-        f.write('%d' % time.time())
-        f.close()
-
-        store = lucene.FSDirectory.getDirectory(store_dir, False)
-        writer = lucene.IndexWriter(store, False,
-                                    lucene.StandardAnalyzer(),
-                                    not incremental)
-
-        status = Q(status='P') | Q(status='S')
-        objects = ReviewRequest.objects.filter(status)
-        if incremental:
-            query = Q(last_updated__gt=timestamp)
-            # FIXME: re-index based on reviews once reviews are indexed.  I
-            # tried ORing this in, but it doesn't seem to work.
-            #        Q(review__timestamp__gt=timestamp)
-            objects = objects.filter(query)
-
-        if sys.stdout.isatty():
+            os.makedirs(store_dir)
+
+        watermark = None
+
+        if options.get('incremental', True):
+            watermark = load_watermark(store_dir)
+
+        self.verbose = sys.stdout.isatty()
+        self.full = watermark is None
+
+        if self.verbose:
             print 'Creating Review Request Index'
-        totalobjs = objects.count()
-        i = 0
-        prev_pct = -1
-
-        for request in objects:
-            try:
-                # Remove the old documents from the index
-                if incremental:
-                    writer.deleteDocuments(lucene.Term('id', str(request.id)))
-
-                self.index_review_request(writer, request)
-
-                if sys.stdout.isatty():
-                    i += 1
-                    pct = (i * 100 / totalobjs)
-                    if pct != prev_pct:
-                        sys.stdout.write("  [%s%%]\r" % pct)
-                        sys.stdout.flush()
-                        prev_pct = pct
-
-            except Exception, e:
-                sys.stderr.write('Error indexing ReviewRequest #%d: %s\n' % \
-                                 (request.id, e))
-
-        if sys.stdout.isatty():
-            print 'Optimizing Index'
-        writer.optimize()
-
-        if sys.stdout.isatty():
-            print 'Indexed %d documents' % totalobjs
+
+        total = 0
+
+        while True:
+            watermark, num_indexed = self.index_pending(store_dir, watermark)
+            total += num_indexed
+
+            if not options.get('watch'):
+                break
+
+            time.sleep(self.WATCH_INTERVAL)
+
+        if self.verbose:
+            print 'Indexed %d documents' % total
             print 'Done'
 
-        writer.close()
-
-    def index_review_request(self, writer, request):
-        # There are several fields we want to make available to users.
-        # We index them individually, but also create a big hunk of text
-        # to use for the default field, so people can just type in a
-        # string and get results.
-        doc = lucene.Document()
-        doc.add(lucene.Field('id', str(request.id),
-                             lucene.Field.Store.YES,
-                             lucene.Field.Index.NO))
-        doc.add(lucene.Field('summary', request.summary,
-                             lucene.Field.Store.NO,
-                             lucene.Field.Index.TOKENIZED))
-        # Remove commas, since lucene won't tokenize it right with them
-        bugs = ' '.join(request.bugs_closed.split(','))
-        doc.add(lucene.Field('bug', bugs,
-                             lucene.Field.Store.NO,
-                             lucene.Field.Index.TOKENIZED))
-
-        name = ' '.join([request.submitter.username,
-                         request.submitter.get_full_name()])
-        doc.add(lucene.Field('author', name,
-                             lucene.Field.Store.NO,
-                             lucene.Field.Index.TOKENIZED))
-        doc.add(lucene.Field('username', request.submitter.username,
-                             lucene.Field.Store.NO,
-                             lucene.Field.Index.UN_TOKENIZED))
-
-        # FIXME: index reviews
-        # FIXME: index dates
-
-        files = []
-        if request.diffset_history:
-            for diffset in request.diffset_history.diffsets.all():
-                for filediff in diffset.files.all():
-                    if filediff.source_file:
-                        files.append(filediff.source_file)
-                    if filediff.dest_file:
-                        files.append(filediff.dest_file)
-        aggregate_files = '\n'.join(set(files))
-        # FIXME: this tokenization doesn't let people search for files
-        # in a really natural way.  It'll split on '/' which handles the
-        # majority case, but it'd be nice to be able to drill down
-        # (main.cc, vmuiLinux/main.cc, and player/linux/main.cc)
-        doc.add(lucene.Field('file', aggregate_files,
-                             lucene.Field.Store.NO,
-                             lucene.Field.Index.TOKENIZED))
-
-        text = '\n'.join([request.summary,
-                          request.description,
-                          request.testing_done,
-                          bugs,
-                          name,
-                          aggregate_files])
-        doc.add(lucene.Field('text', text,
-                             lucene.Field.Store.NO,
-                             lucene.Field.Index.TOKENIZED))
-        writer.addDocument(doc)
+    def index_pending(self, store_dir, watermark):
+        """
+        Indexes all the review requests that changed since the watermark,
+        a batch at a time. Returns the new watermark and the number of
+        review requests indexed.
+        """
+        total = 0
+        batch = get_pending_review_requests(watermark, self.BATCH_SIZE)
+
+        while batch or self.full:
+            writer = self.backend.get_writer(self.full and total == 0)
+            paths = get_file_paths(batch)
+
+            for request in batch:
+                try:
+                    # Remove the old documents from the index
+                    writer.delete_document(request.id)
+
+                    if request.status in INDEXED_STATUSES:
+                        writer.add_document(
+                            get_search_fields(request, paths[request.id]))
+                except Exception, e:
+                    sys.stderr.write('Error indexing ReviewRequest #%d: %s\n' %
+                                     (request.id, e))
+
+            total += len(batch)
+
+            if self.full and len(batch) < self.BATCH_SIZE:
+                if self.verbose:
+                    print 'Optimizing Index'
+
+                writer.optimize()
+                self.full = False
+
+            # Only move the watermark once the batch is committed, so
+            # nothing is lost if we stop in between.
+            writer.close()
+
+            watermark = advance_watermark(watermark, batch)
+
+            if watermark:
+                save_watermark(store_dir, watermark)
+
+            if self.verbose:
+                sys.stdout.write("  [%d]\r" % total)
+                sys.stdout.flush()
+
+            batch = get_pending_review_requests(watermark, self.BATCH_SIZE)
+
+        return watermark, total
@@ -0,0 +1,17 @@
+import sys
+
+from django.core.management.base import NoArgsCommand
+
+from reviewboard.reviews.models import ReviewRequestRecipient
+
+
+class Command(NoArgsCommand):
+    help = "Rebuilds the list of users who receive each review request, " \
+           "used for the incoming review request lists"
+    requires_model_validation = True
+
+    def handle_noargs(self, **options):
+        ReviewRequestRecipient.objects.rebuild()
+
+        sys.stdout.write("Rebuilt %d review request recipients.\n" %
+                         ReviewRequestRecipient.objects.count())
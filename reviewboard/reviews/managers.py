@@ -2,6 +2,7 @@ import logging
 
 from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection, transaction
 from django.db.models import Manager, Q
 from django.db.models.query import QuerySet
 
@@ -27,6 +28,14 @@ class DefaultReviewerManager(Manager):
 
 class ReviewRequestQuerySet(QuerySet):
     def with_counts(self, user):
+        """
+        Returns a queryset that adds a new_review_count field to each
+        review request, which is non-zero if anyone other than the user has
+        published a review or reply since the user last visited it.
+
+        This only looks up the user's ReviewRequestVisit, which keeps track
+        of the latest review by others as reviews are published.
+        """
         queryset = self
 
         if user and user.is_authenticated():
@@ -34,16 +43,12 @@ class ReviewRequestQuerySet(QuerySet):
 
             select_dict['new_review_count'] = """
                 SELECT COUNT(*)
-                  FROM reviews_review, accounts_reviewrequestvisit
-                  WHERE reviews_review.public
-                    AND reviews_review.review_request_id =
-                        reviews_reviewrequest.id
-                    AND accounts_reviewrequestvisit.review_request_id =
+                  FROM accounts_reviewrequestvisit
+                  WHERE accounts_reviewrequestvisit.review_request_id =
                         reviews_reviewrequest.id
                     AND accounts_reviewrequestvisit.user_id = %(user_id)s
-                    AND reviews_review.timestamp >
+                    AND accounts_reviewrequestvisit.last_review_timestamp >
                         accounts_reviewrequestvisit.timestamp
-                    AND reviews_review.user_id != %(user_id)s
             """ % {
                 'user_id': str(user.id)
             }
@@ -52,6 +57,251 @@ class ReviewRequestQuerySet(QuerySet):
 
         return queryset
 
+    def with_datagrid_fields(self, user):
+        """
+        Returns a queryset that loads everything the review request
+        datagrids display for each row, so that a page of review requests
+        can be rendered without any per-row queries.
+
+        The submitter and repository are fetched along with each review
+        request, and the following fields are added:
+
+            * public_review_count: The number of public top-level reviews.
+
+        And, if the user is logged in:
+
+            * is_starred: Whether the user has starred the review request.
+            * draft_summary: The summary of the draft, if the user owns the
+              review request and has a draft. This is None otherwise.
+            * my_review_count: The number of reviews made by the user.
+            * my_draft_review_count: The number of those not yet published.
+            * my_ship_it_count: The number of those marked "Ship It!"
+        """
+        select_dict = {}
+
+        select_dict['public_review_count'] = """
+            SELECT COUNT(*)
+              FROM reviews_review
+              WHERE reviews_review.public
+                AND reviews_review.base_reply_to_id IS NULL
+                AND reviews_review.review_request_id =
+                    reviews_reviewrequest.id
+        """
+
+        if user and user.is_authenticated():
+            params = {
+                'user_id': str(user.id)
+            }
+
+            select_dict['is_starred'] = """
+                SELECT COUNT(*)
+                  FROM accounts_profile,
+                       accounts_profile_starred_review_requests starred
+                  WHERE accounts_profile.user_id = %(user_id)s
+                    AND starred.profile_id = accounts_profile.id
+                    AND starred.reviewrequest_id = reviews_reviewrequest.id
+            """ % params
+
+            select_dict['draft_summary'] = """
+                SELECT reviews_reviewrequestdraft.summary
+                  FROM reviews_reviewrequestdraft
+                  WHERE reviews_reviewrequestdraft.review_request_id =
+                        reviews_reviewrequest.id
+                    AND reviews_reviewrequest.submitter_id = %(user_id)s
+            """ % params
+
+            select_dict['my_review_count'] = """
+                SELECT COUNT(*)
+                  FROM reviews_review
+                  WHERE reviews_review.review_request_id =
+                        reviews_reviewrequest.id
+                    AND reviews_review.user_id = %(user_id)s
+            """ % params
+
+            select_dict['my_draft_review_count'] = """
+                SELECT COUNT(*)
+                  FROM reviews_review
+                  WHERE NOT reviews_review.public
+                    AND reviews_review.review_request_id =
+                        reviews_reviewrequest.id
+                    AND reviews_review.user_id = %(user_id)s
+            """ % params
+
+            select_dict['my_ship_it_count'] = """
+                SELECT COUNT(*)
+                  FROM reviews_review
+                  WHERE reviews_review.ship_it
+                    AND reviews_review.review_request_id =
+                        reviews_reviewrequest.id
+                    AND reviews_review.user_id = %(user_id)s
+            """ % params
+
+        return self.select_related('submitter', 'repository') \
+                   .extra(select=select_dict)
+
+    def get_last_activity(self):
+        """
+        Returns the last public activity information for every review
+        request in the queryset, as a dictionary mapping review request IDs
+        to the (timestamp, type) tuples returned by
+        ReviewRequest.get_last_activity.
+
+        This only loads the stored activity fields, in a single query.
+        """
+        result = {}
+
+        for review_request_id, timestamp, activity_type, last_updated in \
+            self.values_list('id', 'last_activity_time', 'last_activity_type',
+                             'last_updated'):
+            if timestamp is None:
+                result[review_request_id] = \
+                    (last_updated, self.model.ACTIVITY_REVIEW_REQUEST)
+            else:
+                result[review_request_id] = (timestamp, activity_type)
+
+        return result
+
+
+class ReviewRequestRecipientManager(Manager):
+    """
+    A manager for ReviewRequestRecipient models. Provides functions for
+    bringing the recipients of review requests up to date after their
+    targets, group memberships or stars change.
+    """
+
+    def update_for_review_request(self, review_request):
+        """
+        Updates the recipients of a review request from its target people,
+        target groups and the users who starred it.
+        """
+        direct_ids = set(review_request.target_people.values_list('id',
+                                                                  flat=True))
+        direct_ids.update(review_request.starred_by.values_list('user',
+                                                                flat=True))
+
+        group_ids = list(review_request.target_groups.values_list('id',
+                                                                  flat=True))
+
+        if group_ids:
+            via_group_ids = set(User.objects.filter(
+                review_groups__in=group_ids).values_list('id', flat=True))
+        else:
+            via_group_ids = set()
+
+        self._sync(self.filter(review_request=review_request), 'user_id',
+                   {'review_request': review_request},
+                   direct_ids, via_group_ids)
+
+    def update_for_user(self, user):
+        """
+        Updates the review requests a user receives, from the review
+        requests they're a target person of, are in a target group of, or
+        have starred.
+        """
+        review_requests = \
+            self.model._meta.get_field('review_request').rel.to.objects
+        direct_ids = set(review_requests.filter(
+            target_people=user).values_list('id', flat=True))
+        direct_ids.update(review_requests.filter(
+            starred_by__user=user).values_list('id', flat=True))
+        via_group_ids = set(review_requests.filter(
+            target_groups__users=user).values_list('id', flat=True))
+
+        self._sync(self.filter(user=user), 'review_request_id',
+                   {'user': user},
+                   direct_ids, via_group_ids)
+
+    def rebuild(self):
+        """
+        Rebuilds the recipients of every review request from scratch.
+
+        This is done with a few bulk queries in the database, rather than
+        review request by review request, so that it's fast enough to run
+        on large installs.
+        """
+        cursor = connection.cursor()
+        cursor.execute("DELETE FROM reviews_reviewrequestrecipient")
+
+        # Target people and users who starred the review request.
+        cursor.execute("""
+            INSERT INTO reviews_reviewrequestrecipient
+                        (review_request_id, user_id, direct, via_group)
+            SELECT direct_users.review_request_id, direct_users.user_id,
+                   %s, %s
+              FROM (SELECT reviewrequest_id AS review_request_id, user_id
+                      FROM reviews_reviewrequest_target_people
+                    UNION
+                    SELECT starred.reviewrequest_id, accounts_profile.user_id
+                      FROM accounts_profile_starred_review_requests starred,
+                           accounts_profile
+                     WHERE starred.profile_id = accounts_profile.id)
+                   direct_users
+        """, [True, False])
+
+        # Members of target groups who are also direct recipients.
+        cursor.execute("""
+            UPDATE reviews_reviewrequestrecipient
+               SET via_group = %s
+             WHERE EXISTS (
+                   SELECT 1
+                     FROM reviews_reviewrequest_target_groups targets,
+                          reviews_group_users members
+                    WHERE targets.group_id = members.group_id
+                      AND targets.reviewrequest_id =
+                          reviews_reviewrequestrecipient.review_request_id
+                      AND members.user_id =
+                          reviews_reviewrequestrecipient.user_id)
+        """, [True])
+
+        # Members of target groups who aren't.
+        cursor.execute("""
+            INSERT INTO reviews_reviewrequestrecipient
+                        (review_request_id, user_id, direct, via_group)
+            SELECT DISTINCT targets.reviewrequest_id, members.user_id, %s, %s
+              FROM reviews_reviewrequest_target_groups targets,
+                   reviews_group_users members
+             WHERE targets.group_id = members.group_id
+               AND NOT EXISTS (
+                   SELECT 1
+                     FROM reviews_reviewrequestrecipient existing
+                    WHERE existing.review_request_id =
+                          targets.reviewrequest_id
+                      AND existing.user_id = members.user_id)
+        """, [False, True])
+
+        transaction.commit_unless_managed()
+
+    def _sync(self, recipients, key_attr, fields, direct_ids, via_group_ids):
+        """
+        Brings a set of recipients in line with the direct and group ids,
+        creating, updating and deleting recipients as needed. The ids are
+        of the user or review request, as named by key_attr, and fields are
+        the fields all of the recipients share.
+        """
+        existing = {}
+
+        for recipient in recipients:
+            existing[getattr(recipient, key_attr)] = recipient
+
+        for key in direct_ids | via_group_ids:
+            direct = key in direct_ids
+            via_group = key in via_group_ids
+            recipient = existing.pop(key, None)
+
+            if recipient is None:
+                recipient = self.model(direct=direct, via_group=via_group,
+                                       **fields)
+                setattr(recipient, key_attr, key)
+                recipient.save()
+            elif (recipient.direct != direct or
+                  recipient.via_group != via_group):
+                recipient.direct = direct
+                recipient.via_group = via_group
+                recipient.save()
+
+        for recipient in existing.itervalues():
+            recipient.delete()
+
 
 class ReviewRequestManager(ConcurrencyManager):
     """
@@ -96,21 +346,23 @@ class ReviewRequestManager(ConcurrencyManager):
         return self._query(extra_query=Q(target_groups__name=group_name),
                            *args, **kwargs)
 
+    # The to_user* queries go through the ReviewRequestRecipient table,
+    # which combines the target people, the target groups' members and the
+    # users who starred a review request.
+
     def to_user_groups(self, username, *args, **kwargs):
-        return self._query(
-            extra_query=Q(target_groups__users__username=username),
-            *args, **kwargs)
+        query = Q(recipients__user__username=username,
+                  recipients__via_group=True)
+        return self._query(extra_query=query, *args, **kwargs)
 
     def to_user_directly(self, username, *args, **kwargs):
         query_user = User.objects.get(username=username)
-        query = Q(starred_by__user=query_user) | Q(target_people=query_user)
+        query = Q(recipients__user=query_user, recipients__direct=True)
         return self._query(extra_query=query, *args, **kwargs)
 
     def to_user(self, username, *args, **kwargs):
         query_user = User.objects.get(username=username)
-        query = Q(starred_by__user=query_user) | \
-                Q(target_people=query_user) | \
-                Q(target_groups__users=query_user)
+        query = Q(recipients__user=query_user)
         return self._query(extra_query=query, *args, **kwargs)
 
     def from_user(self, username, *args, **kwargs):
@@ -22,6 +22,7 @@ from reviewboard.reviews.signals import review_request_published, \
 from reviewboard.reviews.errors import PermissionError
 from reviewboard.reviews.managers import DefaultReviewerManager, \
                                          ReviewRequestManager, \
+                                         ReviewRequestRecipientManager, \
                                          ReviewManager
 from reviewboard.scmtools.errors import EmptyChangeSetError, \
                                         InvalidChangeNumberError
@@ -190,10 +191,23 @@ class ReviewRequest(models.Model):
         (DISCARDED,      _('Discarded')),
     )
 
+    ACTIVITY_REVIEW_REQUEST = "review-request"
+    ACTIVITY_DIFF           = "diff"
+    ACTIVITY_REVIEW         = "review"
+    ACTIVITY_REPLY          = "reply"
+
+    ACTIVITY_TYPES = (
+        (ACTIVITY_REVIEW_REQUEST, _('Review request updated')),
+        (ACTIVITY_DIFF,           _('Diff updated')),
+        (ACTIVITY_REVIEW,         _('New review')),
+        (ACTIVITY_REPLY,          _('New reply')),
+    )
+
     submitter = models.ForeignKey(User, verbose_name=_("submitter"),
                                   related_name="review_requests")
     time_added = models.DateTimeField(_("time added"), default=datetime.now)
-    last_updated = ModificationTimestampField(_("last updated"))
+    last_updated = ModificationTimestampField(_("last updated"),
+                                              db_index=True)
     status = models.CharField(_("status"), max_length=1, choices=STATUSES,
                               db_index=True)
     public = models.BooleanField(_("public"), default=False)
@@ -250,6 +264,20 @@ class ReviewRequest(models.Model):
     shipit_count = models.IntegerField(_("ship-it count"), default=0,
                                        null=True)
 
+    # The latest public activity, kept up to date as the review request and
+    # its diffs and reviews are published. See get_last_activity.
+    last_activity_time = models.DateTimeField(_("last activity time"),
+                                              null=True, default=None,
+                                              blank=True)
+    last_activity_type = models.CharField(_("last activity type"),
+                                          max_length=16,
+                                          choices=ACTIVITY_TYPES,
+                                          blank=True)
+    last_activity_user = models.ForeignKey(User, null=True, blank=True,
+                                           related_name="last_activities",
+                                           verbose_name=_("last activity "
+                                                          "user"))
+
 
     # Set this up with the ReviewRequestManager
     objects = ReviewRequestManager()
@@ -386,34 +414,30 @@ class ReviewRequest(models.Model):
     def get_last_activity(self):
         """Returns the last public activity information on the review request.
 
-        This will return the last object updated, along with the timestamp
-        of that object. It can be used to judge whether something on a
-        review request has been made public more recently.
-        """
-        timestamp = self.last_updated
-        updated_object = self
+        This will return the timestamp of the last public update, along
+        with its type, which is one of the ACTIVITY_* values. It can be used
+        to judge whether something on a review request has been made public
+        more recently.
 
-        # Check if the diff was updated along with this.
-        try:
-            diffset = self.diffset_history.diffsets.latest()
-
-            if diffset.timestamp >= timestamp:
-                timestamp = diffset.timestamp
-                updated_object = diffset
-        except DiffSet.DoesNotExist:
-            pass
+        This is stored on the review request itself, so it doesn't need
+        any queries.
+        """
+        if self.last_activity_time is None:
+            return self.last_updated, self.ACTIVITY_REVIEW_REQUEST
 
-        # Check for the latest review or reply.
-        try:
-            review = self.reviews.filter(public=True).latest()
+        return self.last_activity_time, self.last_activity_type
 
-            if review.timestamp >= timestamp:
-                timestamp = review.timestamp
-                updated_object = review
-        except Review.DoesNotExist:
-            pass
+    def set_last_activity(self, activity_type, user=None, timestamp=None):
+        """
+        Records the latest public activity on the review request. The
+        activity_type is one of the ACTIVITY_* values, and the user is the
+        one responsible for it, if any.
 
-        return timestamp, updated_object
+        This doesn't save the review request.
+        """
+        self.last_activity_time = timestamp or datetime.now()
+        self.last_activity_type = activity_type
+        self.last_activity_user = user
 
     def changeset_is_pending(self):
         """
@@ -449,6 +473,10 @@ class ReviewRequest(models.Model):
             # and all ReviewRequestVisit objects.
             self.visits.all().delete()
 
+        if self.last_activity_time is None:
+            self.set_last_activity(self.ACTIVITY_REVIEW_REQUEST,
+                                   self.submitter)
+
         super(ReviewRequest, self).save()
 
     def can_publish(self):
@@ -467,6 +495,7 @@ class ReviewRequest(models.Model):
             raise AttributeError("%s is not a valid close type" % type)
 
         self.status = type
+        self.set_last_activity(self.ACTIVITY_REVIEW_REQUEST, self.submitter)
         self.save()
 
         try:
@@ -489,6 +518,8 @@ class ReviewRequest(models.Model):
                 self.public = False
 
             self.status = self.PENDING_REVIEW
+            self.set_last_activity(self.ACTIVITY_REVIEW_REQUEST,
+                                   self.submitter)
             self.save()
 
     def update_changenum(self,changenum, user=None):
@@ -512,11 +543,19 @@ class ReviewRequest(models.Model):
             changes = draft.publish(self, send_notification=False)
             draft.delete()
         else:
+            self.set_last_activity(self.ACTIVITY_REVIEW_REQUEST,
+                                   self.submitter)
             changes = None
 
         self.public = True
         self.save()
 
+        if draft is None:
+            # Without a draft, the targets were set on the review request
+            # itself (such as by add_default_reviewers), so the recipients
+            # haven't been updated for them yet.
+            ReviewRequestRecipient.objects.update_for_review_request(self)
+
         review_request_published.send(sender=self.__class__, user=user,
                                       review_request=self,
                                       changedesc=changes)
@@ -551,6 +590,49 @@ class ReviewRequest(models.Model):
         )
 
 
+class ReviewRequestRecipient(models.Model):
+    """
+    A user who receives a review request, either directly, by being one of
+    its target people or by starring it, or through a target group they
+    belong to.
+
+    These are kept up to date as the targets, group memberships and stars
+    change, so that the lists of incoming review requests can be found
+    without joining through each of those relations.
+    """
+    review_request = models.ForeignKey(ReviewRequest,
+                                       related_name="recipients")
+    user = models.ForeignKey(User, related_name="received_review_requests")
+    direct = models.BooleanField(_("direct"), default=False)
+    via_group = models.BooleanField(_("via group"), default=False)
+
+    objects = ReviewRequestRecipientManager()
+
+    def __unicode__(self):
+        return u"%s: %s" % (self.review_request_id, self.user_id)
+
+    class Meta:
+        unique_together = (('user', 'review_request'),)
+
+
+def group_deleted_cb(sender, instance, **kwargs):
+    """
+    Listens to Group deletions and updates the recipients of the review
+    requests that targeted the group, so that its members no longer
+    receive them through it.
+    """
+    review_requests = list(instance.review_requests.all())
+
+    # The group's memberships and targets are only removed after this
+    # returns, so they have to be removed now for the update to see them
+    # gone.
+    instance.review_requests.clear()
+
+    for review_request in review_requests:
+        ReviewRequestRecipient.objects.update_for_review_request(
+            review_request)
+
+
 class ReviewRequestDraft(models.Model):
     """
     A draft of a review request.
@@ -797,6 +879,9 @@ class ReviewRequestDraft(models.Model):
         update_list(review_request.target_people, self.target_people,
                     'target_people', name_field="username")
 
+        ReviewRequestRecipient.objects.update_for_review_request(
+            review_request)
+
         # Specifically handle bug numbers
         old_bugs = set(review_request.get_bug_list())
         new_bugs = set(self.get_bug_list())
@@ -857,6 +942,13 @@ class ReviewRequestDraft(models.Model):
             self.changedesc.save()
             review_request.changedescs.add(self.changedesc)
 
+        if self.diffset and review_request.public:
+            review_request.set_last_activity(ReviewRequest.ACTIVITY_DIFF)
+        else:
+            review_request.set_last_activity(
+                ReviewRequest.ACTIVITY_REVIEW_REQUEST,
+                review_request.submitter)
+
         review_request.save()
 
         if send_notification:
@@ -1148,6 +1240,14 @@ class Review(models.Model):
 
         # Update the last_updated timestamp on the review request.
         self.review_request.last_review_timestamp = self.timestamp
+
+        if self.is_reply():
+            activity_type = ReviewRequest.ACTIVITY_REPLY
+        else:
+            activity_type = ReviewRequest.ACTIVITY_REVIEW
+
+        self.review_request.set_last_activity(activity_type, self.user,
+                                              self.timestamp)
         self.review_request.save()
 
         # Atomicly update the shipit_count
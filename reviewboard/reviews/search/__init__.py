@@ -0,0 +1,365 @@
+import os
+import time
+from datetime import datetime
+
+from django.core.urlresolvers import reverse
+from django.utils.text import truncate_words
+from django.utils.translation import ugettext_lazy as _
+from djblets.siteconfig.models import SiteConfiguration
+
+from reviewboard.diffviewer.models import FileDiff
+from reviewboard.reviews.models import Comment, Review, ReviewRequest, \
+                                       ScreenshotComment
+from reviewboard.reviews.search.core import get_path_terms, \
+                                            get_reversed_path_terms
+
+
+# The available search backends, as (name, description, class path) tuples.
+SEARCH_BACKENDS = (
+    ('builtin', _('Built-in'),
+     'reviewboard.reviews.search.builtin.BuiltinSearchBackend'),
+    ('lucene', _('Lucene (requires PyLucene)'),
+     'reviewboard.reviews.search.pylucene.LuceneSearchBackend'),
+)
+
+# The statuses of the review requests that are searchable. Any others are
+# removed from the index.
+INDEXED_STATUSES = (ReviewRequest.PENDING_REVIEW, ReviewRequest.SUBMITTED)
+
+WATERMARK_FILENAME = 'watermark'
+
+# The file used before the watermark, which only stored the time of the
+# last run.
+OLD_TIMESTAMP_FILENAME = 'timestamp'
+
+# The number of words of the description shown with each search result.
+EXCERPT_WORDS = 30
+
+TIME_ADDED_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class SearchResult(object):
+    """
+    A review request in the search results, with the fields that are shown
+    for it.
+    """
+    def __init__(self, id, summary, excerpt, submitter_name, time_added):
+        self.id = id
+        self.summary = summary
+        self.excerpt = excerpt
+        self.submitter_name = submitter_name
+        self.time_added = time_added
+
+    def get_absolute_url(self):
+        return reverse('review-request-detail',
+                       kwargs={'review_request_id': self.id})
+
+
+def get_search_backend_class(name):
+    """
+    Returns the SearchBackend subclass with the given name, or None if
+    there isn't one.
+    """
+    for backend_name, description, class_path in SEARCH_BACKENDS:
+        if backend_name == name:
+            i = class_path.rfind('.')
+            module, attr = class_path[:i], class_path[i + 1:]
+
+            return getattr(__import__(module, {}, {}, [attr]), attr)
+
+    return None
+
+
+def get_search_backend():
+    """
+    Returns the search backend chosen in the site configuration.
+    """
+    siteconfig = SiteConfiguration.objects.get_current()
+    backend_cls = get_search_backend_class(siteconfig.get("search_backend"))
+
+    if backend_cls is None:
+        backend_cls = get_search_backend_class('builtin')
+
+    return backend_cls(siteconfig.get("search_index_file"))
+
+
+def get_file_paths(review_requests):
+    """
+    Returns a dictionary mapping the IDs of the review requests to sorted
+    lists of the paths of the files in all their diffs. The paths are
+    loaded in a single query.
+    """
+    review_request_ids = {}
+    paths = {}
+
+    for review_request in review_requests:
+        paths[review_request.id] = set()
+
+        if review_request.diffset_history_id:
+            review_request_ids[review_request.diffset_history_id] = \
+                review_request.id
+
+    if review_request_ids:
+        filediffs = FileDiff.objects.filter(
+            diffset__history__in=review_request_ids.keys())
+
+        for history_id, source_file, dest_file in \
+            filediffs.values_list('diffset__history', 'source_file',
+                                  'dest_file'):
+            review_request_paths = paths[review_request_ids[history_id]]
+
+            if source_file:
+                review_request_paths.add(source_file)
+
+            if dest_file:
+                review_request_paths.add(dest_file)
+
+    for review_request_id, review_request_paths in paths.iteritems():
+        review_request_paths = list(review_request_paths)
+        review_request_paths.sort()
+        paths[review_request_id] = review_request_paths
+
+    return paths
+
+
+def get_search_fields(review_request, paths=None):
+    """
+    Returns the searchable fields of a review request, as a dictionary
+    mapping field names to text, or to lists of terms for the path
+    fields.
+
+    Along with the review request's own fields, this includes the text of
+    all its public reviews and comments, the paths of the files in its
+    diffs, and the dates it was added and last updated, in YYYYMMDD form.
+
+    The file paths can be passed in, as returned by get_file_paths, to
+    load them for many review requests at once.
+    """
+    # Remove commas, since they're not tokenized right.
+    bugs = ' '.join(review_request.bugs_closed.split(','))
+
+    name = ' '.join([review_request.submitter.username,
+                     review_request.submitter.get_full_name()])
+
+    if paths is None:
+        paths = get_file_paths([review_request])[review_request.id]
+
+    files = '\n'.join(paths)
+
+    reviews = []
+
+    for review in Review.objects.filter(review_request=review_request,
+                                        public=True).select_related('user'):
+        reviews += [review.user.username, review.user.get_full_name(),
+                    review.body_top, review.body_bottom]
+
+    reviews += Comment.objects.filter(
+        review__review_request=review_request,
+        review__public=True).values_list('text', flat=True)
+    reviews += ScreenshotComment.objects.filter(
+        review__review_request=review_request,
+        review__public=True).values_list('text', flat=True)
+
+    reviews = '\n'.join(reviews)
+
+    return {
+        'id': str(review_request.id),
+        'summary': review_request.summary,
+        'excerpt': _get_excerpt(review_request),
+        'submitter_name': _get_submitter_name(review_request),
+        'time_added': review_request.time_added.strftime(TIME_ADDED_FORMAT),
+        'bug': bugs,
+        'author': name,
+        'username': review_request.submitter.username,
+        'file': files,
+        'path': get_path_terms(paths),
+        'reversed_path': get_reversed_path_terms(paths),
+        'review': reviews,
+        'added': review_request.time_added.strftime('%Y%m%d'),
+        'updated': review_request.last_updated.strftime('%Y%m%d'),
+        'text': '\n'.join([review_request.summary,
+                           review_request.description,
+                           review_request.testing_done,
+                           bugs,
+                           name,
+                           files,
+                           reviews]),
+    }
+
+
+def get_search_results(results):
+    """
+    Returns a list of SearchResults for the hits on a page of results from
+    SearchBackend.search, in the same order.
+
+    The fields shown for each result are stored in the index, so normally
+    only the IDs are loaded from the database, to leave out review requests
+    that were deleted since they were indexed. Hits from indexes built
+    before the fields were stored are loaded in a single query instead, and
+    any that no longer exist are left out.
+    """
+    stored_ids = [hit['id'] for hit in results.hits if 'summary' in hit]
+    missing_ids = [hit['id'] for hit in results.hits
+                   if 'summary' not in hit]
+    existing_ids = set()
+    review_requests = {}
+
+    if stored_ids:
+        existing_ids = set(ReviewRequest.objects.filter(
+            pk__in=stored_ids).values_list('id', flat=True))
+
+    if missing_ids:
+        for review_request in ReviewRequest.objects.filter(
+                pk__in=missing_ids).select_related('submitter'):
+            review_requests[review_request.id] = review_request
+
+    search_results = []
+
+    for hit in results.hits:
+        if hit['id'] in existing_ids:
+            time_added = datetime(*time.strptime(hit['time_added'],
+                                                 TIME_ADDED_FORMAT)[:6])
+            search_results.append(SearchResult(hit['id'], hit['summary'],
+                                               hit['excerpt'],
+                                               hit['submitter_name'],
+                                               time_added))
+        elif hit['id'] in review_requests:
+            review_request = review_requests[hit['id']]
+            search_results.append(SearchResult(
+                review_request.id,
+                review_request.summary,
+                _get_excerpt(review_request),
+                _get_submitter_name(review_request),
+                review_request.time_added))
+
+    return search_results
+
+
+def get_pending_review_requests(watermark, batch_size):
+    """
+    Returns the next batch of review requests that have changed since the
+    index was last updated, in the order they changed.
+
+    Publishing a review request, a review or a reply, and closing or
+    reopening a review request all save the review request, which updates
+    its last_updated timestamp. The review requests ordered by that
+    timestamp form the queue of changes to index, and the watermark is the
+    position in that queue. It's a (timestamp, ids) tuple, where ids are
+    the review requests already indexed at that exact timestamp, or None
+    to index everything.
+    """
+    review_requests = ReviewRequest.objects.select_related('submitter') \
+                                           .order_by('last_updated', 'id')
+
+    if watermark:
+        timestamp, ids = watermark
+        review_requests = review_requests.filter(last_updated__gte=timestamp)
+    else:
+        timestamp = None
+        ids = []
+
+    result = []
+
+    # Skip past the ones at the watermark that were already indexed.
+    for review_request in review_requests[:batch_size + len(ids)]:
+        if (review_request.last_updated != timestamp or
+            review_request.id not in ids):
+            result.append(review_request)
+
+    return result[:batch_size]
+
+
+def advance_watermark(watermark, review_requests):
+    """
+    Returns the new watermark after indexing the given review requests,
+    as returned by get_pending_review_requests.
+    """
+    if not review_requests:
+        return watermark
+
+    timestamp = review_requests[-1].last_updated
+
+    if watermark and watermark[0] == timestamp:
+        ids = list(watermark[1])
+    else:
+        ids = []
+
+    ids += [review_request.id for review_request in review_requests
+            if review_request.last_updated == timestamp]
+
+    return timestamp, ids
+
+
+def load_watermark(store_dir):
+    """
+    Loads the watermark saved in the index directory. Returns None if
+    there isn't one, in which case everything needs to be indexed.
+    """
+    try:
+        f = open(os.path.join(store_dir, WATERMARK_FILENAME), 'r')
+    except IOError:
+        f = None
+
+    if f:
+        try:
+            lines = f.read().splitlines()
+        finally:
+            f.close()
+
+        try:
+            date, microsecond = lines[0].rsplit(' ', 1)
+            timestamp = datetime(*time.strptime(date,
+                                                '%Y-%m-%d %H:%M:%S')[:6])
+            timestamp = timestamp.replace(microsecond=int(microsecond))
+            ids = [int(review_request_id)
+                   for review_request_id in lines[1:]]
+
+            return timestamp, ids
+        except (IndexError, ValueError):
+            return None
+
+    # Fall back on the time of the last run, from older versions.
+    try:
+        f = open(os.path.join(store_dir, OLD_TIMESTAMP_FILENAME), 'r')
+
+        try:
+            return datetime.fromtimestamp(int(f.read())), []
+        finally:
+            f.close()
+    except (IOError, ValueError):
+        return None
+
+
+def save_watermark(store_dir, watermark):
+    """
+    Saves the watermark in the index directory. This should only be done
+    once the indexed changes are committed, so that nothing is lost if the
+    indexer stops in between.
+    """
+    timestamp, ids = watermark
+    filename = os.path.join(store_dir, WATERMARK_FILENAME)
+
+    # Write it out in one go, so a crash can't leave half a watermark.
+    f = open(filename + '.new', 'w')
+
+    try:
+        f.write('%s %d\n' % (timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+                             timestamp.microsecond))
+        f.write(''.join(['%d\n' % review_request_id
+                         for review_request_id in ids]))
+    finally:
+        f.close()
+
+    if os.name == 'nt' and os.path.exists(filename):
+        os.remove(filename)
+
+    os.rename(filename + '.new', filename)
+
+
+def _get_excerpt(review_request):
+    return truncate_words(review_request.description, EXCERPT_WORDS)
+
+
+def _get_submitter_name(review_request):
+    return (review_request.submitter.get_full_name() or
+            review_request.submitter.username)
@@ -0,0 +1,855 @@
+import heapq
+import math
+import mmap
+import os
+import re
+import struct
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from django.utils.encoding import force_unicode
+from django.utils.translation import ugettext as _
+
+from reviewboard.reviews.errors import SearchError
+from reviewboard.reviews.search.core import DEFAULT_FIELD, \
+                                            KEYWORD_FIELDS, \
+                                            STORED_FIELDS, \
+                                            TOKENIZED_FIELDS, \
+                                            SearchBackend, \
+                                            SearchIndexSearcher, \
+                                            SearchIndexWriter, \
+                                            SearchResults, \
+                                            get_path_query
+
+
+# The words that aren't indexed. These are the same as Lucene's
+# StandardAnalyzer, so both backends match the same things.
+STOP_WORDS = set([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'if',
+    'in', 'into', 'is', 'it', 'no', 'not', 'of', 'on', 'or', 'such', 'that',
+    'the', 'their', 'then', 'there', 'these', 'they', 'this', 'to', 'was',
+    'will', 'with',
+])
+
+# The BM25 parameters. K1 controls how quickly repeating a term stops
+# adding to the score, and B how much long fields are penalized.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Each writer adds a segment to the index. Once there are more segments
+# than this, they're merged into one.
+MAX_SEGMENTS = 10
+
+SEGMENTS_FILENAME = 'segments'
+LOCK_FILENAME = 'write.lock'
+SEGMENTS_FORMAT = 1
+
+_word_re = re.compile(r'\w+', re.UNICODE)
+_clause_re = re.compile(r'([+-]?)(?:(\w+):)?'
+                        r'(?:"([^"]*)"|\[(\S+)\s+TO\s+(\S+)\]|(\S+))')
+_segment_file_re = re.compile(r'^_\d+(_\d+)?\.(doc|tis|frq|fdt|del)$')
+
+
+def tokenize(text):
+    """
+    Splits text into the lowercase words that are indexed.
+    """
+    return [word for word in _word_re.findall(force_unicode(text).lower())
+            if word not in STOP_WORDS]
+
+
+class BuiltinSearchBackend(SearchBackend):
+    """
+    A search backend written in pure Python, which needs nothing else
+    installed.
+
+    The index is made of segments, which are never changed once written.
+    Each one has a sorted term dictionary and a list of postings for each
+    term, which are memory-mapped and looked up with a binary search.
+    Results are ranked with BM25.
+
+    The segment files are:
+
+        * <segment>.doc: The review request ID and field lengths of each
+          document, by document number.
+        * <segment>.tis: The sorted term dictionary. This is a table of
+          offsets to the entries, then the entries themselves. Each entry
+          is the term, the number of documents containing it, and the
+          offset of its postings.
+        * <segment>.frq: The postings, which are pairs of document numbers
+          and the number of times the term appears in the document.
+        * <segment>.fdt: The stored fields of each document. This is a
+          table of offsets to each document's fields, then the fields
+          themselves, separated by NUL characters. Segments written before
+          fields were stored don't have this file.
+        * <segment>_<generation>.del: The numbers of the deleted documents.
+
+    The 'segments' file lists the current segments and their deletions,
+    and is replaced whenever a writer is closed. Searchers keep the files
+    of the segments they opened, so they can go on using them after a
+    writer has removed them.
+    """
+    name = 'builtin'
+
+    def __init__(self, index_dir):
+        # This is kept apart from any Lucene index in the same directory.
+        SearchBackend.__init__(self, os.path.join(index_dir, 'builtin'))
+
+    def get_writer(self, create=False):
+        return BuiltinSearchIndexWriter(self.index_dir, create)
+
+    def get_generation(self):
+        # Segment names are never reused, and a segment's deletion
+        # generation goes up whenever documents are deleted from it.
+        return _read_segments(self.index_dir)[1]
+
+    def open_searcher(self):
+        segments, readers = _open_segment_readers(self.index_dir)
+
+        return BuiltinSearchIndexSearcher(segments, readers)
+
+
+class BuiltinSearchIndexSearcher(SearchIndexSearcher):
+    def __init__(self, segments, readers):
+        SearchIndexSearcher.__init__(self, segments)
+        self.readers = readers
+
+        # The statistics used for scoring only change with the index, so
+        # they're worked out once for all the searches.
+        self.num_docs = 0
+        total_lengths = [0] * len(TOKENIZED_FIELDS)
+
+        for reader in readers:
+            live_docs = [doc_num for doc_num in xrange(reader.num_docs)
+                         if doc_num not in reader.deleted]
+            self.num_docs += len(live_docs)
+
+            for i, lengths in enumerate(reader.lengths):
+                for doc_num in live_docs:
+                    total_lengths[i] += lengths[doc_num]
+
+        self.avg_lengths = [float(total) / max(self.num_docs, 1)
+                            for total in total_lengths]
+
+    def search(self, query, offset=0, limit=None):
+        clauses = _parse_query(query)
+
+        if not clauses or self.num_docs == 0:
+            return SearchResults(0, [])
+
+        results = _search(self.readers, clauses, self.num_docs,
+                          self.avg_lengths)
+
+        # Only the matches up to the end of the page need to be sorted.
+        if limit is None:
+            results.sort()
+            top_results = results[offset:]
+        else:
+            top_results = heapq.nsmallest(offset + limit, results)[offset:]
+
+        return SearchResults(len(results),
+                             [self._get_hit(-review_request_id)
+                              for score, review_request_id in top_results])
+
+    def _get_hit(self, review_request_id):
+        hit = {}
+
+        for reader in self.readers:
+            doc_num = reader.get_doc_num(review_request_id)
+
+            if doc_num is not None:
+                hit = reader.get_stored_fields(doc_num) or {}
+                break
+
+        hit['id'] = review_request_id
+
+        return hit
+
+    def close(self):
+        for reader in self.readers:
+            reader.close()
+
+
+class BuiltinSearchIndexWriter(SearchIndexWriter):
+    def __init__(self, index_dir, create):
+        self.index_dir = index_dir
+
+        if not os.path.exists(index_dir):
+            os.makedirs(index_dir)
+
+        self.lock_file = open(os.path.join(index_dir, LOCK_FILENAME), 'w')
+
+        if fcntl:
+            try:
+                fcntl.flock(self.lock_file.fileno(),
+                            fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                self.lock_file.close()
+                raise SearchError(_("The search index is already being "
+                                    "updated by another process."))
+
+        self.counter, self.segments = _read_segments(index_dir)
+
+        if create:
+            self.segments = []
+
+        self.readers = [_SegmentReader(index_dir, name, del_gen)
+                        for name, del_gen in self.segments]
+        self.deletes = {}
+        self.docs = []
+        self.postings = {}
+        self.pending_docs = {}
+        self.pending_deletes = set()
+        self.optimize_requested = False
+
+    def add_document(self, fields):
+        doc_num = len(self.docs)
+        lengths = []
+
+        for name in TOKENIZED_FIELDS:
+            words = tokenize(fields[name])
+            lengths.append(len(words))
+            counts = {}
+
+            for word in words:
+                counts[word] = counts.get(word, 0) + 1
+
+            for word, freq in counts.iteritems():
+                self.postings.setdefault(_make_key(name, word), []) \
+                             .append((doc_num, freq))
+
+        for name in KEYWORD_FIELDS:
+            values = fields[name]
+
+            if isinstance(values, basestring):
+                values = [values]
+
+            for value in set([force_unicode(value).lower()
+                              for value in values]):
+                key = _make_key(name, value)
+                self.postings.setdefault(key, []).append((doc_num, 1))
+
+        stored = {}
+
+        for name in STORED_FIELDS:
+            stored[name] = fields.get(name, '')
+
+        review_request_id = int(fields['id'])
+        self.docs.append((review_request_id, lengths, stored))
+        self.pending_docs[review_request_id] = doc_num
+
+    def delete_document(self, review_request_id):
+        for reader in self.readers:
+            doc_num = reader.get_doc_num(review_request_id)
+
+            if doc_num is not None:
+                self.deletes.setdefault(reader.name, set()).add(doc_num)
+
+        if review_request_id in self.pending_docs:
+            self.pending_deletes.add(
+                self.pending_docs.pop(review_request_id))
+
+    def optimize(self):
+        self.optimize_requested = True
+
+    def close(self):
+        try:
+            if self.docs:
+                name = self._new_segment_name()
+                _write_segment(self.index_dir, name, self.docs, self.postings)
+                self.segments.append([name, 0])
+                self.readers.append(_SegmentReader(self.index_dir, name, 0))
+
+                if self.pending_deletes:
+                    self.deletes[name] = self.pending_deletes
+
+            for segment in self.segments:
+                name, del_gen = segment
+
+                if name in self.deletes:
+                    reader = self.readers[self.segments.index(segment)]
+                    reader.deleted.update(self.deletes[name])
+                    segment[1] = del_gen + 1
+                    _write_file(_get_del_filename(self.index_dir, name,
+                                                  segment[1]),
+                                ''.join(['%d\n' % doc_num
+                                         for doc_num in reader.deleted]))
+
+            if (len(self.segments) > 1 and
+                (self.optimize_requested or
+                 len(self.segments) > MAX_SEGMENTS)):
+                self._merge_segments()
+
+            _write_segments(self.index_dir, self.counter, self.segments)
+        finally:
+            for reader in self.readers:
+                reader.close()
+
+            if fcntl:
+                fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+
+            self.lock_file.close()
+
+        self._remove_unused_files()
+
+    def _new_segment_name(self):
+        name = '_%d' % self.counter
+        self.counter += 1
+
+        return name
+
+    def _merge_segments(self):
+        docs = []
+        postings = {}
+
+        for reader in self.readers:
+            doc_map = {}
+
+            for doc_num in xrange(reader.num_docs):
+                if doc_num not in reader.deleted:
+                    doc_map[doc_num] = len(docs)
+                    docs.append((reader.ids[doc_num],
+                                 [lengths[doc_num]
+                                  for lengths in reader.lengths],
+                                 reader.get_stored_fields(doc_num)))
+
+            for i in xrange(reader.num_terms):
+                merged_postings = [(doc_map[doc_num], freq)
+                                   for doc_num, freq in reader.get_postings(i)
+                                   if doc_num in doc_map]
+
+                if merged_postings:
+                    postings.setdefault(reader.get_key(i), []) \
+                            .extend(merged_postings)
+
+            reader.close()
+
+        name = self._new_segment_name()
+        _write_segment(self.index_dir, name, docs, postings)
+        self.segments = [[name, 0]]
+        self.readers = []
+
+    def _remove_unused_files(self):
+        used = set()
+
+        for name, del_gen in self.segments:
+            used.update([name + '.doc', name + '.tis', name + '.frq',
+                         name + '.fdt',
+                         os.path.basename(_get_del_filename(self.index_dir,
+                                                            name, del_gen))])
+
+        for filename in os.listdir(self.index_dir):
+            if _segment_file_re.match(filename) and filename not in used:
+                try:
+                    os.remove(os.path.join(self.index_dir, filename))
+                except OSError:
+                    # It may still be open for a search on Windows. It'll
+                    # be removed next time.
+                    pass
+
+
+class _SegmentReader(object):
+    """
+    Reads a segment of the index.
+    """
+    def __init__(self, index_dir, name, del_gen):
+        self.name = name
+
+        data = _read_file(os.path.join(index_dir, name + '.doc'))
+        self.num_docs, num_fields = struct.unpack('<II', data[:8])
+        width = num_fields + 1
+        values = struct.unpack('<%dI' % (self.num_docs * width),
+                               data[8:8 + 4 * self.num_docs * width])
+        self.ids = values[0::width]
+        self.lengths = [values[i + 1::width] for i in xrange(num_fields)]
+
+        self.deleted = set()
+        self._doc_nums = None
+
+        if del_gen:
+            data = _read_file(_get_del_filename(index_dir, name, del_gen))
+            self.deleted.update([int(doc_num)
+                                 for doc_num in data.splitlines()])
+
+        self._files = []
+        self.terms = self._map_file(os.path.join(index_dir, name + '.tis'))
+        self.freqs = self._map_file(os.path.join(index_dir, name + '.frq'))
+        self.num_terms = struct.unpack('<I', self.terms[:4])[0]
+
+        filename = os.path.join(index_dir, name + '.fdt')
+
+        if os.path.exists(filename):
+            self.stored = self._map_file(filename)
+        else:
+            self.stored = None
+
+    def close(self):
+        for f, data in self._files:
+            if data:
+                data.close()
+
+            f.close()
+
+        self._files = []
+
+    def get_doc_num(self, review_request_id):
+        """
+        Returns the number of the live document for the review request, or
+        None if it's not in this segment.
+        """
+        if self._doc_nums is None:
+            self._doc_nums = {}
+
+            for doc_num in xrange(self.num_docs):
+                if doc_num not in self.deleted:
+                    self._doc_nums[self.ids[doc_num]] = doc_num
+
+        return self._doc_nums.get(review_request_id)
+
+    def get_stored_fields(self, doc_num):
+        """
+        Returns a dictionary of the stored fields of a document, or None
+        if they weren't stored.
+        """
+        if not self.stored:
+            return None
+
+        start, end = struct.unpack('<II', self.stored[4 + 4 * doc_num:
+                                                      12 + 4 * doc_num])
+
+        if start == end:
+            return None
+
+        base = 8 + 4 * self.num_docs
+        values = self.stored[base + start:base + end].decode('utf-8')
+
+        return dict(zip(STORED_FIELDS, values.split(u'\0')))
+
+    def get_key(self, i):
+        offset = self._get_entry_offset(i)
+        key_len = struct.unpack('<H', self.terms[offset:offset + 2])[0]
+
+        return self.terms[offset + 10:offset + 10 + key_len]
+
+    def get_doc_freq(self, i):
+        offset = self._get_entry_offset(i)
+
+        return struct.unpack('<I', self.terms[offset + 2:offset + 6])[0]
+
+    def get_postings(self, i):
+        """
+        Returns a list of (doc_num, freq) tuples for the term at index i.
+        """
+        offset = self._get_entry_offset(i)
+        doc_freq, postings_offset = \
+            struct.unpack('<II', self.terms[offset + 2:offset + 10])
+        values = struct.unpack('<%dI' % (doc_freq * 2),
+                               self.freqs[postings_offset:
+                                          postings_offset + doc_freq * 8])
+
+        return zip(values[0::2], values[1::2])
+
+    def find(self, key):
+        """
+        Returns the index of the first term that's not less than key.
+        """
+        low = 0
+        high = self.num_terms
+
+        while low < high:
+            mid = (low + high) // 2
+
+            if self.get_key(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+
+        return low
+
+    def _get_entry_offset(self, i):
+        return 4 + 4 * self.num_terms + \
+               struct.unpack('<I', self.terms[4 + 4 * i:8 + 4 * i])[0]
+
+    def _map_file(self, filename):
+        f = open(filename, 'rb')
+        size = os.path.getsize(filename)
+
+        if size:
+            data = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        else:
+            data = None
+
+        self._files.append((f, data))
+
+        return data or ''
+
+
+def _make_key(field, term):
+    return ('%s\0%s' % (field, term)).encode('utf-8')
+
+
+def _parse_query(query):
+    """
+    Parses a query into a list of clauses. Each clause is a tuple of an
+    occurrence ('+' if the clause is required, '-' if it must not match,
+    or '' otherwise), a field, and either a list of terms, all of which
+    must be in the field, a (low, high) range of terms, or a string that
+    terms must start with.
+
+    This understands a subset of the Lucene query syntax: field:term,
+    "quoted terms", field:[low TO high], +term, -term, AND, OR and NOT.
+    The path field also understands path:prefix* and path:*suffix. See
+    get_path_query.
+    """
+    clauses = []
+    next_occur = ''
+
+    for match in _clause_re.finditer(force_unicode(query)):
+        occur, field, phrase, low, high, word = match.groups()
+
+        if not occur and not field and word in ('AND', 'OR', 'NOT'):
+            if word == 'AND':
+                if clauses and not clauses[-1][0]:
+                    clauses[-1] = ('+',) + clauses[-1][1:]
+
+                next_occur = '+'
+            elif word == 'NOT':
+                next_occur = '-'
+
+            continue
+
+        occur = occur or next_occur
+        next_occur = ''
+
+        if field not in TOKENIZED_FIELDS and field not in KEYWORD_FIELDS:
+            if field:
+                # This isn't a field we know about, so it's likely part of
+                # something like a URL.
+                word = match.group(0)[len(occur):]
+
+            field = DEFAULT_FIELD
+
+        if low is not None:
+            clauses.append((occur, field, (low.lower(), high.lower())))
+            continue
+
+        if phrase is not None:
+            text = phrase
+        else:
+            text = word
+
+        if field == 'path':
+            field, term, is_prefix = get_path_query(text)
+
+            if not term:
+                continue
+            elif is_prefix:
+                clauses.append((occur, field, term))
+                continue
+
+            terms = [term]
+        elif field in KEYWORD_FIELDS:
+            terms = [text.lower()]
+        else:
+            terms = tokenize(text)
+
+        if terms:
+            clauses.append((occur, field, terms))
+
+    return clauses
+
+
+def _search(readers, clauses, num_docs, avg_lengths):
+    """
+    Finds the documents matching the clauses. Returns an unsorted list of
+    (-score, -review_request_id) tuples, so that sorting it puts the best
+    matches first, and the newest review requests first among equals.
+    """
+    scores = {}
+    required = []
+    optional = set()
+    prohibited = set()
+
+    for occur, field, terms in clauses:
+        if isinstance(terms, tuple):
+            matches = _match_range(readers, field, terms[0], terms[1])
+        elif isinstance(terms, basestring):
+            matches = _match_prefix(readers, field, terms)
+        else:
+            if field in TOKENIZED_FIELDS:
+                field_index = TOKENIZED_FIELDS.index(field)
+                avg_length = avg_lengths[field_index]
+            else:
+                field_index = None
+                avg_length = 1.0
+
+            matches = _match_terms(readers, field, terms, num_docs,
+                                   field_index, avg_length)
+
+        if occur == '-':
+            prohibited.update(matches.iterkeys())
+            continue
+        elif occur == '+':
+            required.append(set(matches.iterkeys()))
+        else:
+            optional.update(matches.iterkeys())
+
+        for review_request_id, score in matches.iteritems():
+            scores[review_request_id] = \
+                scores.get(review_request_id, 0) + score
+
+    if required:
+        results = required[0]
+
+        for matches in required[1:]:
+            results = results & matches
+    else:
+        results = optional
+
+    return [(-scores[review_request_id], -review_request_id)
+            for review_request_id in results - prohibited]
+
+
+def _match_terms(readers, field, terms, num_docs, field_index, avg_length):
+    """
+    Finds the documents containing all the terms, and scores them with
+    BM25. Returns a dictionary mapping review request IDs to scores.
+    """
+    matches = None
+
+    for term in terms:
+        key = _make_key(field, term)
+        term_postings = []
+        doc_freq = 0
+
+        for reader in readers:
+            i = reader.find(key)
+
+            if i < reader.num_terms and reader.get_key(i) == key:
+                doc_freq += reader.get_doc_freq(i)
+                term_postings.append((reader, reader.get_postings(i)))
+
+        idf = math.log(1 + (num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+        term_matches = {}
+
+        for reader, postings in term_postings:
+            for doc_num, freq in postings:
+                if doc_num in reader.deleted:
+                    continue
+
+                if field_index is None:
+                    length = 1
+                else:
+                    length = reader.lengths[field_index][doc_num]
+
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                term_matches[reader.ids[doc_num]] = \
+                    idf * freq * (BM25_K1 + 1) / (freq + norm)
+
+        if matches is None:
+            matches = term_matches
+        else:
+            for review_request_id in matches.keys():
+                if review_request_id in term_matches:
+                    matches[review_request_id] += \
+                        term_matches[review_request_id]
+                else:
+                    del matches[review_request_id]
+
+    return matches or {}
+
+
+def _match_range(readers, field, low, high):
+    """
+    Finds the documents with a term in the field between low and high,
+    inclusive. These all get the same score.
+    """
+    low_key = _make_key(field, low)
+    high_key = _make_key(field, high)
+    matches = {}
+
+    for reader in readers:
+        i = reader.find(low_key)
+
+        while i < reader.num_terms and reader.get_key(i) <= high_key:
+            for doc_num, freq in reader.get_postings(i):
+                if doc_num not in reader.deleted:
+                    matches[reader.ids[doc_num]] = 1.0
+
+            i += 1
+
+    return matches
+
+
+def _match_prefix(readers, field, prefix):
+    """
+    Finds the documents with a term in the field that starts with prefix.
+    These all get the same score.
+    """
+    prefix_key = _make_key(field, prefix)
+    matches = {}
+
+    for reader in readers:
+        i = reader.find(prefix_key)
+
+        while (i < reader.num_terms and
+               reader.get_key(i).startswith(prefix_key)):
+            for doc_num, freq in reader.get_postings(i):
+                if doc_num not in reader.deleted:
+                    matches[reader.ids[doc_num]] = 1.0
+
+            i += 1
+
+    return matches
+
+
+def _open_segment_readers(index_dir):
+    """
+    Opens readers for all the segments in the index. This returns the
+    list of segments that were opened, along with the readers.
+
+    A writer may replace the segments while they're being opened, in
+    which case this tries again with the new ones.
+    """
+    attempts = 3
+
+    while True:
+        counter, segments = _read_segments(index_dir)
+        readers = []
+
+        try:
+            for name, del_gen in segments:
+                readers.append(_SegmentReader(index_dir, name, del_gen))
+
+            return segments, readers
+        except (IOError, OSError), e:
+            for reader in readers:
+                reader.close()
+
+            attempts -= 1
+
+            if attempts == 0:
+                raise SearchError(_("The search index couldn't be read: %s")
+                                  % e)
+
+
+def _read_segments(index_dir):
+    """
+    Reads the segments file, and returns the counter used to name new
+    segments and a list of [name, del_gen] segments.
+    """
+    try:
+        lines = _read_file(os.path.join(index_dir,
+                                        SEGMENTS_FILENAME)).splitlines()
+    except IOError:
+        return 0, []
+
+    if int(lines[0]) != SEGMENTS_FORMAT:
+        raise SearchError(_("The search index is in an unknown format. "
+                            "It must be rebuilt with --full."))
+
+    segments = []
+
+    for line in lines[2:]:
+        name, del_gen = line.split()
+        segments.append([name, int(del_gen)])
+
+    return int(lines[1]), segments
+
+
+def _write_segments(index_dir, counter, segments):
+    lines = ['%d' % SEGMENTS_FORMAT, '%d' % counter]
+    lines += ['%s %d' % (name, del_gen) for name, del_gen in segments]
+    filename = os.path.join(index_dir, SEGMENTS_FILENAME)
+
+    # Searches may be reading the old file, so the new one is swapped in
+    # all at once.
+    _write_file(filename + '.new', '\n'.join(lines) + '\n')
+
+    if os.name == 'nt' and os.path.exists(filename):
+        os.remove(filename)
+
+    os.rename(filename + '.new', filename)
+
+
+def _write_segment(index_dir, name, docs, postings):
+    num_fields = len(TOKENIZED_FIELDS)
+    doc_data = [struct.pack('<II', len(docs), num_fields)]
+
+    stored_offsets = [0]
+    stored_data = []
+    stored_len = 0
+
+    for review_request_id, lengths, stored in docs:
+        doc_data.append(struct.pack('<%dI' % (num_fields + 1),
+                                    review_request_id, *lengths))
+
+        # Documents from segments without stored fields are left empty.
+        if stored:
+            data = u'\0'.join([force_unicode(stored[field]).replace(u'\0', u'')
+                               for field in STORED_FIELDS]).encode('utf-8')
+            stored_data.append(data)
+            stored_len += len(data)
+
+        stored_offsets.append(stored_len)
+
+    keys = postings.keys()
+    keys.sort()
+
+    entry_offsets = []
+    entries = []
+    entries_len = 0
+    freq_data = []
+    freqs_len = 0
+
+    for key in keys:
+        key_postings = postings[key]
+        values = []
+
+        for doc_num, freq in key_postings:
+            values += [doc_num, freq]
+
+        entry = struct.pack('<HII', len(key), len(key_postings),
+                            freqs_len) + key
+        entry_offsets.append(entries_len)
+        entries.append(entry)
+        entries_len += len(entry)
+
+        freq_data.append(struct.pack('<%dI' % len(values), *values))
+        freqs_len += len(values) * 4
+
+    term_data = [struct.pack('<I', len(keys)),
+                 struct.pack('<%dI' % len(keys), *entry_offsets)] + entries
+
+    _write_file(os.path.join(index_dir, name + '.doc'), ''.join(doc_data))
+    _write_file(os.path.join(index_dir, name + '.frq'), ''.join(freq_data))
+    _write_file(os.path.join(index_dir, name + '.tis'), ''.join(term_data))
+    _write_file(os.path.join(index_dir, name + '.fdt'),
+                struct.pack('<I', len(docs)) +
+                struct.pack('<%dI' % len(stored_offsets), *stored_offsets) +
+                ''.join(stored_data))
+
+
+def _get_del_filename(index_dir, name, del_gen):
+    return os.path.join(index_dir, '%s_%d.del' % (name, del_gen))
+
+
+def _read_file(filename):
+    f = open(filename, 'rb')
+
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+
+def _write_file(filename, data):
+    f = open(filename, 'wb')
+
+    try:
+        f.write(data)
+    finally:
+        f.close()
@@ -0,0 +1,425 @@
+import logging
+import threading
+import time
+
+
+# The fields that are split into words when indexed.
+TOKENIZED_FIELDS = ('summary', 'bug', 'author', 'file', 'review', 'text')
+
+# The fields that are only matched as a whole. The path fields hold a list
+# of terms. See get_path_terms.
+KEYWORD_FIELDS = ('username', 'added', 'updated', 'path', 'reversed_path')
+
+# The field searched when a query doesn't name one.
+DEFAULT_FIELD = 'text'
+
+# The fields stored in the index along with the review request ID, so that
+# search results can be shown without loading the review requests.
+STORED_FIELDS = ('summary', 'excerpt', 'submitter_name', 'time_added')
+
+
+class SearchBackend(object):
+    """
+    The base class for a search index of review requests.
+
+    A search backend stores its index in a directory. The index command
+    fills it in using a SearchIndexWriter, and the search view queries it.
+    The indexed documents are the dictionaries of fields returned by
+    reviewboard.reviews.search.get_search_fields.
+    """
+    name = None
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+
+    def is_available(cls):
+        """
+        Returns whether this backend can be used, as a (bool, reason)
+        tuple, where reason explains what's missing.
+        """
+        return True, None
+    is_available = classmethod(is_available)
+
+    def get_writer(self, create=False):
+        """
+        Returns a SearchIndexWriter for updating the index. If create is
+        True, the index is emptied first.
+        """
+        raise NotImplementedError
+
+    def get_generation(self):
+        """
+        Returns a value that changes whenever the index on disk is changed.
+        A SearchIndexSearcher opened for an older generation doesn't see
+        the changes.
+        """
+        raise NotImplementedError
+
+    def open_searcher(self):
+        """
+        Returns a new SearchIndexSearcher for the current index.
+        """
+        raise NotImplementedError
+
+    def search(self, query, offset=0, limit=None):
+        """
+        Searches the index, and returns a SearchResults with the matching
+        review requests, best match first. Only the ``limit`` matches
+        starting at ``offset`` are returned, or all of them if ``limit``
+        is None.
+
+        The search uses the SearchIndexSearcher shared by this process,
+        which is only reopened when the index changes.
+
+        This raises SearchError if the query can't be parsed or the index
+        can't be read.
+        """
+        return get_searcher_manager(self).search(query, offset, limit)
+
+
+class SearchResults(object):
+    """
+    A page of search results.
+
+    ``total`` is the number of review requests matching the query, and
+    ``hits`` lists the ones on the page, best match first. Each hit is a
+    dictionary with the review request's ``id`` and the STORED_FIELDS it
+    was indexed with. Indexes built by older versions don't have the
+    stored fields.
+    """
+    def __init__(self, total, hits):
+        self.total = total
+        self.hits = hits
+
+    def get_ids(self):
+        return [hit['id'] for hit in self.hits]
+
+
+class SearchIndexSearcher(object):
+    """
+    Searches an index as it was when the searcher was opened.
+
+    A searcher is shared by all the threads in a process, so searches
+    must be safe to run at the same time.
+    """
+    def __init__(self, generation):
+        self.generation = generation
+
+    def search(self, query, offset=0, limit=None):
+        """
+        Returns a SearchResults for the query. See SearchBackend.search.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Releases the files held open by the searcher."""
+        pass
+
+
+class SearchIndexWriter(object):
+    """
+    Updates a search index.
+
+    None of the changes are seen by searches until the writer is closed.
+    """
+    def add_document(self, fields):
+        """Adds the search fields of a review request to the index."""
+        raise NotImplementedError
+
+    def delete_document(self, review_request_id):
+        """Removes a review request from the index."""
+        raise NotImplementedError
+
+    def optimize(self):
+        """Rearranges the index to make searches as fast as they can be."""
+        pass
+
+    def close(self):
+        """Commits the changes to the index."""
+        raise NotImplementedError
+
+
+class SearcherManager(object):
+    """
+    Keeps a SearchIndexSearcher open for an index, to be shared by all the
+    searches in this process.
+
+    Opening a searcher loads the index from disk, so one is kept until the
+    index changes. Each search compares the generation of the index on
+    disk with that of the open searcher, and the first search to see a new
+    generation opens a new searcher. Searches still using the old one
+    finish with it, and it's closed once the last of them is done.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.opened = None
+
+        self._searcher = None
+        self._refs = {}
+        self._lock = threading.Lock()
+        self._open_lock = threading.Lock()
+
+        self.stats = {
+            'searches': 0,
+            'opens': 0,
+            'total_open_time': 0.0,
+            'max_open_time': 0.0,
+            'last_open_time': 0.0,
+        }
+
+    def search(self, query, offset=0, limit=None):
+        searcher = self.acquire()
+
+        try:
+            return searcher.search(query, offset, limit)
+        finally:
+            self.release(searcher)
+
+    def acquire(self):
+        """
+        Returns a searcher for the current index. It must be handed back
+        to release when the search is done.
+        """
+        generation = self.backend.get_generation()
+
+        self._lock.acquire()
+
+        try:
+            opens = self.stats['opens']
+
+            if (self._searcher is not None and
+                self._searcher.generation == generation):
+                return self._add_ref(self._searcher)
+        finally:
+            self._lock.release()
+
+        # Only one search opens the new searcher. The others wait for it,
+        # rather than loading the index again.
+        self._open_lock.acquire()
+
+        try:
+            self._lock.acquire()
+
+            try:
+                if self.stats['opens'] != opens:
+                    return self._add_ref(self._searcher)
+            finally:
+                self._lock.release()
+
+            start = time.time()
+            searcher = self.backend.open_searcher()
+            open_time = time.time() - start
+
+            logging.debug("Opened a searcher for the %s search index in "
+                          "%s in %.3f seconds" %
+                          (self.backend.name, self.backend.index_dir,
+                           open_time))
+
+            self._lock.acquire()
+
+            try:
+                old_searcher = self._searcher
+                self._searcher = searcher
+                self.opened = time.time()
+
+                self.stats['opens'] += 1
+                self.stats['total_open_time'] += open_time
+                self.stats['max_open_time'] = \
+                    max(self.stats['max_open_time'], open_time)
+                self.stats['last_open_time'] = open_time
+
+                if old_searcher is not None and old_searcher not in self._refs:
+                    old_searcher.close()
+
+                return self._add_ref(searcher)
+            finally:
+                self._lock.release()
+        finally:
+            self._open_lock.release()
+
+    def release(self, searcher):
+        """
+        Hands back a searcher returned by acquire. Searchers that have been
+        replaced are closed once nothing is using them.
+        """
+        self._lock.acquire()
+
+        try:
+            self._refs[searcher] -= 1
+
+            if self._refs[searcher] == 0:
+                del self._refs[searcher]
+
+                if searcher is not self._searcher:
+                    searcher.close()
+        finally:
+            self._lock.release()
+
+    def close(self):
+        """
+        Closes the open searcher. Any searches using it keep it until
+        they're done.
+        """
+        self._lock.acquire()
+
+        try:
+            searcher = self._searcher
+            self._searcher = None
+            self.opened = None
+
+            if searcher is not None and searcher not in self._refs:
+                searcher.close()
+        finally:
+            self._lock.release()
+
+    def get_stats(self):
+        """
+        Returns statistics on the searches, including how long the open
+        searcher has been in use and how long it took to open searchers.
+        """
+        self._lock.acquire()
+
+        try:
+            stats = dict(self.stats)
+            opened = self.opened
+        finally:
+            self._lock.release()
+
+        stats['is_open'] = opened is not None
+
+        if opened is None:
+            stats['searcher_age'] = None
+        else:
+            stats['searcher_age'] = time.time() - opened
+
+        if stats['opens']:
+            stats['average_open_time'] = \
+                stats['total_open_time'] / stats['opens']
+        else:
+            stats['average_open_time'] = 0.0
+
+        stats['backend'] = self.backend.name
+        stats['index_dir'] = self.backend.index_dir
+
+        return stats
+
+    def _add_ref(self, searcher):
+        self._refs[searcher] = self._refs.get(searcher, 0) + 1
+        self.stats['searches'] += 1
+
+        return searcher
+
+
+_searcher_managers = {}
+_searcher_managers_lock = threading.Lock()
+
+
+def get_searcher_manager(backend):
+    """
+    Returns the SearcherManager shared by this process for the backend's
+    index, creating it if needed.
+    """
+    key = (backend.name, backend.index_dir)
+
+    _searcher_managers_lock.acquire()
+
+    try:
+        if key not in _searcher_managers:
+            _searcher_managers[key] = SearcherManager(backend)
+
+        return _searcher_managers[key]
+    finally:
+        _searcher_managers_lock.release()
+
+
+def get_searcher_manager_stats():
+    """
+    Returns the statistics of all the SearcherManagers in this process.
+    """
+    _searcher_managers_lock.acquire()
+
+    try:
+        managers = _searcher_managers.values()
+    finally:
+        _searcher_managers_lock.release()
+
+    stats = [manager.get_stats() for manager in managers]
+    stats.sort(key=lambda s: (s['backend'], s['index_dir']))
+
+    return stats
+
+
+def get_path_terms(paths):
+    """
+    Returns the terms indexed in the path field for a list of file paths.
+
+    For player/linux/main.cc, these are the full path, each shorter path
+    made of its last components (linux/main.cc and main.cc), and each
+    component (player and linux). A search for any of these finds the
+    file, and a prefix search finds the files in a directory.
+    """
+    terms = set()
+
+    for path in paths:
+        components = _split_path(path)
+        terms.update(components)
+
+        for i in xrange(len(components)):
+            terms.add('/'.join(components[i:]))
+
+    terms = list(terms)
+    terms.sort()
+
+    return terms
+
+
+def get_reversed_path_terms(paths):
+    """
+    Returns the terms indexed in the reversed_path field for a list of file
+    paths. These are the full paths spelled backwards, so that a prefix
+    search finds the files ending with some text, such as an extension.
+    """
+    terms = set([normalize_path(path)[::-1] for path in paths])
+    terms.discard('')
+
+    terms = list(terms)
+    terms.sort()
+
+    return terms
+
+
+def get_path_query(value):
+    """
+    Returns how to look up a value given for the path field in a query, as
+    a (field, term, is_prefix) tuple.
+
+    A value ending in * matches the paths starting with the rest of it,
+    such as player/linux/*, and a value starting with * matches the paths
+    ending with the rest of it, such as *.cc. Any other value matches the
+    paths ending with the same components, so main.cc and linux/main.cc
+    both match player/linux/main.cc.
+    """
+    if value.startswith('*'):
+        suffix = value.strip('*').lower().replace('\\', '/')
+
+        return 'reversed_path', suffix[::-1], True
+    elif value.endswith('*'):
+        prefix = value.rstrip('*').lower().replace('\\', '/').lstrip('/')
+
+        return 'path', prefix, True
+    else:
+        return 'path', normalize_path(value), False
+
+
+def normalize_path(path):
+    """
+    Returns a path the way it's indexed, in lowercase, with forward slashes
+    and without leading or trailing slashes.
+    """
+    return '/'.join(_split_path(path))
+
+
+def _split_path(path):
+    return [component
+            for component in path.lower().replace('\\', '/').split('/')
+            if component]
@@ -0,0 +1,188 @@
+import re
+
+from reviewboard.admin.checks import get_can_use_lucene_search
+from reviewboard.reviews.errors import SearchError
+from reviewboard.reviews.search.core import DEFAULT_FIELD, \
+                                            KEYWORD_FIELDS, \
+                                            STORED_FIELDS, \
+                                            TOKENIZED_FIELDS, \
+                                            SearchBackend, \
+                                            SearchIndexSearcher, \
+                                            SearchIndexWriter, \
+                                            SearchResults, \
+                                            get_path_query
+
+
+_path_clause_re = re.compile(r'(^|[\s(+-])path:("[^"]*"|[^\s)]+)')
+
+
+def _get_lucene():
+    import lucene
+
+    # We may have already initialized lucene, in which case this thread
+    # still needs to be attached to the VM.
+    try:
+        lucene.initVM(lucene.CLASSPATH)
+    except ValueError:
+        lucene.getVMEnv().attachCurrentThread()
+
+    return lucene
+
+
+class LuceneSearchBackend(SearchBackend):
+    """
+    A search backend that uses PyLucene. This needs a Java VM, which is
+    started the first time the index is used in each process.
+    """
+    name = 'lucene'
+
+    def is_available(cls):
+        return get_can_use_lucene_search()
+    is_available = classmethod(is_available)
+
+    def get_writer(self, create=False):
+        return LuceneSearchIndexWriter(self.index_dir, create)
+
+    def get_generation(self):
+        lucene = _get_lucene()
+        store = lucene.FSDirectory.getDirectory(self.index_dir, False)
+
+        try:
+            try:
+                return lucene.IndexReader.getCurrentVersion(store)
+            except lucene.JavaError, e:
+                raise SearchError(unicode(e))
+        finally:
+            store.close()
+
+    def open_searcher(self):
+        return LuceneSearchIndexSearcher(self.index_dir)
+
+
+class LuceneSearchIndexSearcher(SearchIndexSearcher):
+    def __init__(self, index_dir):
+        self.lucene = _get_lucene()
+        self.store = self.lucene.FSDirectory.getDirectory(index_dir, False)
+
+        try:
+            self.searcher = self.lucene.IndexSearcher(self.store)
+        except self.lucene.JavaError, e:
+            self.store.close()
+            raise SearchError(unicode(e))
+
+        SearchIndexSearcher.__init__(
+            self, self.searcher.getIndexReader().getVersion())
+
+    def search(self, query, offset=0, limit=None):
+        lucene = _get_lucene()
+        # The path fields are matched as a whole, rather than split into
+        # words.
+        analyzer = lucene.PerFieldAnalyzerWrapper(lucene.StandardAnalyzer())
+        analyzer.addAnalyzer('path', lucene.KeywordAnalyzer())
+        analyzer.addAnalyzer('reversed_path', lucene.KeywordAnalyzer())
+
+        parser = lucene.QueryParser(DEFAULT_FIELD, analyzer)
+
+        try:
+            parsed_query = parser.parse(_rewrite_path_clauses(lucene, query))
+        except lucene.JavaError, e:
+            raise SearchError(unicode(e))
+
+        if limit is None:
+            num_hits = self.searcher.maxDoc()
+        else:
+            num_hits = offset + limit
+
+        # Lucene only collects the top matches, rather than all of them.
+        top_docs = self.searcher.search(parsed_query, None, max(num_hits, 1))
+        hits = []
+
+        for i in xrange(offset, len(top_docs.scoreDocs)):
+            doc = self.searcher.doc(top_docs.scoreDocs[i].doc)
+            hit = {}
+
+            for name in STORED_FIELDS:
+                value = doc.get(name)
+
+                if value is not None:
+                    hit[name] = value
+
+            hit['id'] = int(doc.get('id'))
+            hits.append(hit)
+
+        return SearchResults(top_docs.totalHits, hits)
+
+    def close(self):
+        self.searcher.close()
+        self.store.close()
+
+
+class LuceneSearchIndexWriter(SearchIndexWriter):
+    def __init__(self, index_dir, create):
+        self.lucene = _get_lucene()
+        store = self.lucene.FSDirectory.getDirectory(index_dir, False)
+        self.writer = self.lucene.IndexWriter(store, False,
+                                              self.lucene.StandardAnalyzer(),
+                                              create)
+
+    def add_document(self, fields):
+        lucene = self.lucene
+        doc = lucene.Document()
+        doc.add(lucene.Field('id', fields['id'],
+                             lucene.Field.Store.YES,
+                             lucene.Field.Index.NO))
+
+        for name in TOKENIZED_FIELDS:
+            if name in STORED_FIELDS:
+                store = lucene.Field.Store.YES
+            else:
+                store = lucene.Field.Store.NO
+
+            doc.add(lucene.Field(name, fields[name], store,
+                                 lucene.Field.Index.TOKENIZED))
+
+        for name in STORED_FIELDS:
+            if name not in TOKENIZED_FIELDS:
+                doc.add(lucene.Field(name, fields[name],
+                                     lucene.Field.Store.YES,
+                                     lucene.Field.Index.NO))
+
+        for name in KEYWORD_FIELDS:
+            values = fields[name]
+
+            if isinstance(values, basestring):
+                values = [values]
+
+            for value in values:
+                doc.add(lucene.Field(name, value,
+                                     lucene.Field.Store.NO,
+                                     lucene.Field.Index.UN_TOKENIZED))
+
+        self.writer.addDocument(doc)
+
+    def delete_document(self, review_request_id):
+        self.writer.deleteDocuments(self.lucene.Term('id',
+                                                     str(review_request_id)))
+
+    def optimize(self):
+        self.writer.optimize()
+
+    def close(self):
+        self.writer.close()
+
+
+def _rewrite_path_clauses(lucene, query):
+    """
+    Rewrites the path:value clauses in a query into the terms that are
+    indexed. See get_path_query.
+    """
+    def rewrite(m):
+        field, term, is_prefix = get_path_query(m.group(2).strip('"'))
+        term = lucene.QueryParser.escape(term).replace(' ', '\\ ')
+
+        if is_prefix:
+            term += '*'
+
+        return '%s%s:%s' % (m.group(1), field, term)
+
+    return _path_clause_re.sub(rewrite, query)
@@ -1,7 +1,6 @@
 from django import template
 from django.conf import settings
 from django.db.models import Q
-from django.db.models.query import QuerySet
 from django.template import NodeList, TemplateSyntaxError
 from django.template.loader import render_to_string
 from django.utils import simplejson
@@ -12,6 +11,7 @@ from djblets.util.templatetags.djblets_utils import humanize_list
 
 from reviewboard.accounts.models import Profile
 from reviewboard.diffviewer.models import DiffSet
+from reviewboard.reviews.counts import COUNTED_VIEWS, get_dashboard_count
 from reviewboard.reviews.models import Comment, Group, ReviewRequest, \
                                        ScreenshotComment
 
@@ -317,36 +317,17 @@ def dashboard_entry(context, level, text, view, group=None):
     show_count = True
     count = 0
 
-    if view == 'all':
-        review_requests = ReviewRequest.objects.public(user)
-    elif view == 'outgoing':
-        review_requests = ReviewRequest.objects.from_user(user.username, user)
-    elif view == 'mine':
-        review_requests = ReviewRequest.objects.from_user(user.username, user,
-                                                          None)
-    elif view == 'incoming':
-        review_requests = ReviewRequest.objects.to_user(user.username, user)
-    elif view == 'to-me':
-        review_requests = ReviewRequest.objects.to_user_directly(user.username,
-                                                                 user)
-    elif view == 'to-group':
-        review_requests = ReviewRequest.objects.to_group(group.name, user)
-    elif view == 'starred':
-        review_requests = \
-            user.get_profile().starred_review_requests.public(user)
+    if view == 'starred':
         starred = True
     elif view == 'watched-groups':
         starred = True
         show_count = False
-    else:
+    elif view not in COUNTED_VIEWS:
         raise template.TemplateSyntaxError, \
             "Invalid view type '%s' passed to 'dashboard_entry' tag." % view
 
     if show_count:
-        if type(review_requests) == QuerySet:
-            count = review_requests.count()
-        else:
-            count = len(review_requests)
+        count = get_dashboard_count(user, view, group)
 
     return {
         'MEDIA_URL': settings.MEDIA_URL,
@@ -484,10 +465,13 @@ def star(context, obj):
     return render_star(context.get('user', None), obj)
 
 
-def render_star(user, obj):
+def render_star(user, obj, starred=None):
     """
     Does the actual work of rendering the star. The star tag is a wrapper
     around this.
+
+    If the caller already knows whether the object is starred, it can pass
+    starred to save a query.
     """
     if user.is_anonymous():
         return ""
@@ -503,16 +487,18 @@ def render_star(user, obj):
             'id': obj.id
         }
 
-        starred = bool(get_object_or_none(profile.starred_review_requests,
-                                          pk=obj.id))
+        if starred is None:
+            starred = bool(get_object_or_none(profile.starred_review_requests,
+                                              pk=obj.id))
     elif isinstance(obj, Group):
         obj_info = {
             'type': 'groups',
             'id': obj.name
         }
 
-        starred = bool(get_object_or_none(profile.starred_groups,
-                                          pk=obj.id))
+        if starred is None:
+            starred = bool(get_object_or_none(profile.starred_groups,
+                                              pk=obj.id))
     else:
         raise template.TemplateSyntaxError, \
             "star tag received an incompatible object type (%s)" % \
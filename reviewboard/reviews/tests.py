@@ -1,4 +1,9 @@
 import logging
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
 
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
@@ -8,10 +13,22 @@ from django.test import TestCase
 
 from djblets.siteconfig.models import SiteConfiguration
 
+from reviewboard import initialize
+from reviewboard.accounts.models import ReviewRequestVisit
+from reviewboard.reviews import search, updates
+from reviewboard.reviews.counts import count_dashboard_review_requests, \
+                                       get_dashboard_count, \
+                                       invalidate_user_counts
 from reviewboard.reviews.models import DefaultReviewer, \
+                                       Group, \
                                        ReviewRequest, \
                                        ReviewRequestDraft, \
+                                       ReviewRequestRecipient, \
                                        Review
+from reviewboard.reviews.search.builtin import BuiltinSearchBackend
+from reviewboard.reviews.search.core import get_path_terms, \
+                                            get_reversed_path_terms, \
+                                            get_searcher_manager
 from reviewboard.scmtools.models import Repository, Tool
 
 
@@ -146,6 +163,94 @@ class DbQueryTests(TestCase):
             "Improved login form"
         ])
 
+    def testWithDatagridFields(self):
+        """Testing ReviewRequestQuerySet.with_datagrid_fields"""
+        user = User.objects.get(username="doc")
+        profile = user.get_profile()
+        profile.starred_review_requests.add(
+            ReviewRequest.objects.public(user)[0])
+
+        for review_request in \
+            ReviewRequest.objects.public(user, status=None) \
+                                 .with_datagrid_fields(user):
+            reviews = review_request.reviews.filter(user=user)
+
+            self.assertEqual(review_request.public_review_count,
+                             review_request.get_public_reviews().count())
+            self.assertEqual(review_request.my_review_count, reviews.count())
+            self.assertEqual(review_request.my_draft_review_count,
+                             reviews.filter(public=False).count())
+            self.assertEqual(review_request.my_ship_it_count,
+                             reviews.filter(ship_it=True).count())
+            self.assertEqual(review_request.is_starred > 0,
+                             profile.starred_review_requests.filter(
+                                 pk=review_request.pk).count() > 0)
+
+            if review_request.submitter == user:
+                drafts = review_request.draft.all()
+
+                if drafts:
+                    self.assertEqual(review_request.draft_summary,
+                                     drafts[0].summary)
+                else:
+                    self.assertEqual(review_request.draft_summary, None)
+            else:
+                self.assertEqual(review_request.draft_summary, None)
+
+    def testNewReviewCount(self):
+        """Testing ReviewRequestQuerySet.with_counts with new reviews"""
+        doc = User.objects.get(username="doc")
+        grumpy = User.objects.get(username="grumpy")
+        review_request = ReviewRequest.objects.public(doc)[0]
+
+        def get_new_review_count():
+            return ReviewRequest.objects.filter(pk=review_request.pk) \
+                                        .with_counts(doc)[0].new_review_count
+
+        visit = ReviewRequestVisit.objects.create(
+            user=doc, review_request=review_request,
+            timestamp=datetime.now() - timedelta(days=1))
+        self.assertEqual(get_new_review_count(), 0)
+
+        # Publishing our own review shouldn't count as an update.
+        Review.objects.create(review_request=review_request,
+                              user=doc).publish()
+        self.assertEqual(get_new_review_count(), 0)
+
+        Review.objects.create(review_request=review_request,
+                              user=grumpy).publish()
+        self.assertEqual(get_new_review_count(), 1)
+
+        # Visiting the review request again clears the update.
+        visit = ReviewRequestVisit.objects.get(pk=visit.pk)
+        visit.timestamp = datetime.now()
+        visit.save()
+        self.assertEqual(get_new_review_count(), 0)
+
+    def testLastActivity(self):
+        """Testing ReviewRequest.get_last_activity"""
+        grumpy = User.objects.get(username="grumpy")
+        review_request = ReviewRequest.objects.public()[0]
+
+        review = Review.objects.create(review_request=review_request,
+                                       user=grumpy)
+        review.publish()
+
+        review_request = ReviewRequest.objects.get(pk=review_request.pk)
+        self.assertEqual(review_request.get_last_activity(),
+                         (review.timestamp, ReviewRequest.ACTIVITY_REVIEW))
+        self.assertEqual(review_request.last_activity_user, grumpy)
+
+        review_request.close(ReviewRequest.SUBMITTED)
+        timestamp, activity_type = review_request.get_last_activity()
+        self.assert_(timestamp >= review.timestamp)
+        self.assertEqual(activity_type, ReviewRequest.ACTIVITY_REVIEW_REQUEST)
+
+        activity = ReviewRequest.objects.filter(pk=review_request.pk) \
+                                        .get_last_activity()
+        self.assertEqual(activity,
+                         {review_request.pk: (timestamp, activity_type)})
+
     def assertValidSummaries(self, review_requests, summaries):
         print review_requests
         r_summaries = [r.summary for r in review_requests]
@@ -645,6 +750,358 @@ class DefaultReviewerTests(TestCase):
         self.assert_(default_reviewer2 in default_reviewers)
 
 
+class RecipientTests(TestCase):
+    fixtures = ['test_users', 'test_reviewrequests', 'test_scmtools']
+
+    def testRebuild(self):
+        """Testing ReviewRequestRecipient.objects.rebuild"""
+        def get_recipients():
+            return set([(r.review_request_id, r.user_id, r.direct, r.via_group)
+                        for r in ReviewRequestRecipient.objects.all()])
+
+        user = User.objects.get(username="doc")
+        review_request = ReviewRequest.objects.get(
+            summary="Update for cleaned_data changes")
+        user.get_profile().starred_review_requests.add(review_request)
+        ReviewRequestRecipient.objects.update_for_review_request(
+            review_request)
+
+        recipients = get_recipients()
+        self.assert_((review_request.id, user.id, True, True) in recipients)
+
+        ReviewRequestRecipient.objects.rebuild()
+        self.assertEqual(get_recipients(), recipients)
+
+    def testPublishTargets(self):
+        """Testing recipients after publishing new target people"""
+        user = User.objects.get(username="grumpy")
+        review_request = ReviewRequest.objects.get(
+            summary="Made e-mail improvements")
+        self.assert_(review_request not in
+                     ReviewRequest.objects.to_user_directly("grumpy"))
+
+        draft = ReviewRequestDraft.create(review_request)
+        draft.target_people.add(user)
+        draft.publish()
+        self.assert_(review_request in
+                     ReviewRequest.objects.to_user_directly("grumpy"))
+        self.assert_(review_request in
+                     ReviewRequest.objects.to_user("grumpy"))
+
+        draft = ReviewRequestDraft.create(review_request)
+        draft.target_people.remove(user)
+        draft.publish()
+        self.assert_(review_request not in
+                     ReviewRequest.objects.to_user_directly("grumpy"))
+
+    def testPublishWithoutDraft(self):
+        """Testing recipients after publishing without a draft"""
+        user = User.objects.get(username="grumpy")
+        review_request = ReviewRequest.objects.get(
+            summary="Comments Improvements")
+        self.assertEqual(review_request.draft.count(), 0)
+
+        # Default reviewers are added to the review request directly.
+        review_request.target_people.add(user)
+        review_request.publish(review_request.submitter)
+        self.assert_(review_request in
+                     ReviewRequest.objects.to_user_directly("grumpy"))
+
+    def testDeleteGroup(self):
+        """Testing recipients after deleting a target group"""
+        initialize()
+
+        review_request = ReviewRequest.objects.get(
+            summary="Update for cleaned_data changes")
+        self.assert_(review_request in
+                     ReviewRequest.objects.to_user_groups("dopey"))
+
+        Group.objects.get(name="devgroup").delete()
+        self.assert_(review_request not in
+                     ReviewRequest.objects.to_user_groups("dopey"))
+        self.assert_(review_request not in
+                     ReviewRequest.objects.to_user("dopey"))
+
+
+class DashboardCountTests(TestCase):
+    fixtures = ['test_users', 'test_reviewrequests', 'test_scmtools']
+
+    def setUp(self):
+        initialize()
+
+    def testCountsAfterChanges(self):
+        """Testing cached dashboard counts after review request changes"""
+        user = User.objects.get(username="doc")
+        group = Group.objects.get(name="devgroup")
+        entries = [('all', None), ('outgoing', None), ('mine', None),
+                   ('incoming', None), ('to-me', None), ('starred', None),
+                   ('to-group', group)]
+
+        def assertCountsValid():
+            for view, group in entries:
+                self.assertEqual(
+                    get_dashboard_count(user, view, group),
+                    count_dashboard_review_requests(user, view, group))
+
+        assertCountsValid()
+
+        review_request = ReviewRequest.objects.to_user("doc")[0]
+        old_count = get_dashboard_count(user, 'incoming')
+        review_request.close(ReviewRequest.SUBMITTED)
+        self.assertEqual(get_dashboard_count(user, 'incoming'),
+                         old_count - 1)
+        assertCountsValid()
+
+        review_request.reopen()
+        assertCountsValid()
+
+        review_request = ReviewRequest.objects.public(user)[0]
+        user.get_profile().starred_review_requests.add(review_request)
+        ReviewRequestRecipient.objects.update_for_review_request(
+            review_request)
+        invalidate_user_counts([user.id])
+        assertCountsValid()
+
+        # Joining a group adds its review requests to the incoming list.
+        group.users.add(user)
+        ReviewRequestRecipient.objects.update_for_user(user)
+        assertCountsValid()
+
+
+class UpdateTests(TestCase):
+    fixtures = ['test_users', 'test_reviewrequests', 'test_scmtools']
+
+    def setUp(self):
+        self.review_request = ReviewRequest.objects.public()[0]
+        self.timestamp = \
+            self.review_request.get_last_activity()[0].replace(microsecond=0)
+
+        # Reset anything that earlier tests left in the cache.
+        updates.notify(self.review_request)
+
+    def testWaitForUpdate(self):
+        """Testing wait_for_update with existing updates"""
+        self.assert_(updates.wait_for_update(
+            self.review_request.id, self.timestamp - timedelta(seconds=1), 0))
+        self.assert_(not updates.wait_for_update(
+            self.review_request.id, self.timestamp, 0))
+
+    def testNotify(self):
+        """Testing wait_for_update waking up on notify"""
+        self.review_request.set_last_activity(
+            ReviewRequest.ACTIVITY_REVIEW_REQUEST,
+            timestamp=self.timestamp + timedelta(seconds=10))
+        timer = threading.Timer(0.1, updates.notify, [self.review_request])
+        timer.start()
+
+        start = time.time()
+        self.assert_(updates.wait_for_update(self.review_request.id,
+                                             self.timestamp, 30))
+        self.assert_(time.time() - start < updates.CHECK_INTERVAL)
+
+
+class SearchIndexTests(TestCase):
+    fixtures = ['test_users', 'test_reviewrequests', 'test_scmtools']
+
+    def testSearchFields(self):
+        """Testing get_search_fields with reviews and comments"""
+        review_request = ReviewRequest.objects.public()[0]
+        review = Review.objects.create(review_request=review_request,
+                                       user=User.objects.get(username="doc"),
+                                       body_top="Needs more cowbell.")
+        review.publish()
+
+        fields = search.get_search_fields(review_request)
+        self.assertEqual(fields['id'], str(review_request.id))
+        self.assert_("Needs more cowbell." in fields['review'])
+        self.assert_("Needs more cowbell." in fields['text'])
+        self.assertEqual(fields['added'],
+                         review_request.time_added.strftime('%Y%m%d'))
+
+    def testFilePaths(self):
+        """Testing get_file_paths"""
+        review_request = ReviewRequest.objects.get(
+            summary="Add permission checking for JSON API")
+        paths = search.get_file_paths(ReviewRequest.objects.all())
+
+        self.assertEqual(len(paths), ReviewRequest.objects.count())
+        self.assertEqual(len(paths[review_request.id]), 7)
+        self.assert_("/trunk/reviewboard/reviews/json.py" in
+                     paths[review_request.id])
+
+    def testPathTerms(self):
+        """Testing get_path_terms and get_reversed_path_terms"""
+        paths = ["/trunk/player/linux/main.cc"]
+        self.assertEqual(get_path_terms(paths),
+                         ["linux", "linux/main.cc", "main.cc", "player",
+                          "player/linux/main.cc", "trunk",
+                          "trunk/player/linux/main.cc"])
+        self.assertEqual(get_reversed_path_terms(paths),
+                         ["cc.niam/xunil/reyalp/knurt"])
+
+    def testPendingReviewRequests(self):
+        """Testing get_pending_review_requests with a watermark"""
+        review_requests = search.get_pending_review_requests(None, 3)
+        self.assertEqual(len(review_requests), 3)
+
+        watermark = search.advance_watermark(None, review_requests)
+        remaining = search.get_pending_review_requests(watermark, 1000)
+        self.assertEqual(len(remaining) + 3, ReviewRequest.objects.count())
+
+        for review_request in review_requests:
+            self.assert_(review_request not in remaining)
+
+        # Updating a review request puts it back in the queue.
+        review_requests[0].save()
+        remaining = search.get_pending_review_requests(watermark, 1000)
+        self.assertEqual(remaining[-1], review_requests[0])
+
+    def testWatermark(self):
+        """Testing saving and loading the search index watermark"""
+        store_dir = tempfile.mkdtemp()
+
+        try:
+            self.assertEqual(search.load_watermark(store_dir), None)
+
+            watermark = (datetime(2009, 6, 1, 12, 30, 15, 1234), [3, 7])
+            search.save_watermark(store_dir, watermark)
+            self.assertEqual(search.load_watermark(store_dir), watermark)
+        finally:
+            shutil.rmtree(store_dir)
+
+
+class BuiltinSearchBackendTests(TestCase):
+    fixtures = ['test_users', 'test_reviewrequests', 'test_scmtools']
+
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        self.backend = BuiltinSearchBackend(self.index_dir)
+
+        writer = self.backend.get_writer(create=True)
+
+        for review_request in ReviewRequest.objects.all():
+            writer.add_document(search.get_search_fields(review_request))
+
+        writer.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.index_dir)
+
+    def testSearch(self):
+        """Testing BuiltinSearchBackend.search"""
+        review_request = ReviewRequest.objects.get(
+            summary="Add permission checking for JSON API")
+        self.assertEqual(self._search_ids("permission"),
+                         [review_request.id])
+        self.assertEqual(self._search_ids("summary:permission"),
+                         [review_request.id])
+        self.assertEqual(self._search_ids("+permission -json"), [])
+        self.assertEqual(self._search_ids("username:%s" %
+                                          review_request.submitter),
+                         list(ReviewRequest.objects.filter(
+                             submitter=review_request.submitter)
+                             .order_by('-id').values_list('id', flat=True)))
+
+    def testPagination(self):
+        """Testing BuiltinSearchBackend.search with an offset and limit"""
+        review_request = ReviewRequest.objects.get(
+            summary="Add permission checking for JSON API")
+        query = "username:%s" % review_request.submitter
+        ids = list(ReviewRequest.objects.filter(
+            submitter=review_request.submitter)
+            .order_by('-id').values_list('id', flat=True))
+
+        results = self.backend.search(query, 1, 2)
+        self.assertEqual(results.total, len(ids))
+        self.assertEqual(results.get_ids(), ids[1:3])
+
+        results = self.backend.search(query, len(ids), 2)
+        self.assertEqual(results.total, len(ids))
+        self.assertEqual(results.hits, [])
+
+    def testStoredFields(self):
+        """Testing BuiltinSearchBackend.search returning stored fields"""
+        review_request = ReviewRequest.objects.get(
+            summary="Add permission checking for JSON API")
+        results = search.get_search_results(
+            self.backend.search("permission"))
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].id, review_request.id)
+        self.assertEqual(results[0].summary, review_request.summary)
+        self.assertEqual(results[0].time_added,
+                         review_request.time_added.replace(microsecond=0))
+        self.assertEqual(results[0].get_absolute_url(),
+                         review_request.get_absolute_url())
+
+    def testDeletedResults(self):
+        """Testing get_search_results leaving out deleted review requests"""
+        review_request = ReviewRequest.objects.get(
+            summary="Add permission checking for JSON API")
+        results = self.backend.search("permission")
+        self.assertEqual(results.get_ids(), [review_request.id])
+
+        review_request.delete()
+        self.assertEqual(search.get_search_results(results), [])
+
+    def testPathSearch(self):
+        """Testing BuiltinSearchBackend.search with the path field"""
+        review_request = ReviewRequest.objects.get(
+            summary="Add permission checking for JSON API")
+        self.assertEqual(self._search_ids("path:reviews/json.py"),
+                         [review_request.id])
+        self.assertEqual(
+            self._search_ids("path:/trunk/reviewboard/reviews/json.py"),
+            [review_request.id])
+        self.assertEqual(self._search_ids("path:*.svg"),
+                         [review_request.id])
+        self.assertEqual(self._search_ids("path:reviewboard/htdocs/*"),
+                         list(ReviewRequest.objects.filter(
+                             summary__in=["Add permission checking for "
+                                          "JSON API",
+                                          "Error dialog",
+                                          "Improved login form"])
+                             .order_by('-id').values_list('id', flat=True)))
+
+    def testUpdate(self):
+        """Testing BuiltinSearchBackend with updated documents"""
+        review_request = ReviewRequest.objects.get(
+            summary="Add permission checking for JSON API")
+        review_request.summary = "Add access checks"
+
+        writer = self.backend.get_writer()
+        writer.delete_document(review_request.id)
+        writer.add_document(search.get_search_fields(review_request))
+        writer.optimize()
+        writer.close()
+
+        self.assertEqual(self._search_ids("summary:permission"), [])
+        self.assertEqual(self._search_ids("summary:access"),
+                         [review_request.id])
+
+    def testSharedSearcher(self):
+        """Testing SearcherManager reopening only when the index changes"""
+        manager = get_searcher_manager(self.backend)
+
+        self.backend.search("permission")
+        self.backend.search("json")
+        self.assertEqual(manager.get_stats()['opens'], 1)
+
+        writer = self.backend.get_writer()
+        writer.delete_document(ReviewRequest.objects.all()[0].id)
+        writer.close()
+
+        self.backend.search("permission")
+        stats = manager.get_stats()
+        self.assertEqual(stats['opens'], 2)
+        self.assertEqual(stats['searches'], 3)
+
+        manager.close()
+
+    def _search_ids(self, query):
+        return self.backend.search(query).get_ids()
+
+
 class IfNeatNumberTagTests(TestCase):
     def testMilestones(self):
         """Testing the ifneatnumber tag with milestone numbers"""
@@ -0,0 +1,128 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save
+
+from reviewboard.reviews.models import ReviewRequest
+
+
+# The longest time, in seconds, that a request will wait for an update.
+WAIT_TIMEOUT = 60
+
+# How often, in seconds, a waiting request checks for updates made by other
+# server processes.
+CHECK_INTERVAL = 5
+
+
+_lock = threading.Lock()
+_waiters = {}
+
+
+def get_last_activity_time(review_request_id):
+    """
+    Returns the timestamp of the last public activity on a review request,
+    or None if the review request no longer exists.
+
+    The timestamp is shared between server processes through the cache,
+    and loaded from the database when it's not there.
+    """
+    key = _get_cache_key(review_request_id)
+    timestamp = cache.get(key)
+
+    if timestamp is None:
+        activity = ReviewRequest.objects.filter(pk=review_request_id) \
+                                        .get_last_activity()
+
+        if review_request_id not in activity:
+            return None
+
+        timestamp = activity[review_request_id][0]
+        cache.set(key, timestamp, settings.CACHE_EXPIRATION_TIME)
+
+    return timestamp
+
+
+def wait_for_update(review_request_id, since, timeout=WAIT_TIMEOUT):
+    """
+    Waits until there's public activity on the review request that's newer
+    than the ``since`` timestamp, or until ``timeout`` seconds have passed.
+    Returns True if there was an update.
+
+    Updates made in this process wake up the request right away. Updates
+    made by other processes are seen through the cache every
+    CHECK_INTERVAL seconds.
+    """
+    deadline = time.time() + timeout
+    event = threading.Event()
+
+    _lock.acquire()
+    try:
+        _waiters.setdefault(review_request_id, []).append(event)
+    finally:
+        _lock.release()
+
+    try:
+        while True:
+            timestamp = get_last_activity_time(review_request_id)
+
+            # Clients only know about timestamps to the second.
+            if (timestamp is None or
+                timestamp.replace(microsecond=0) > since):
+                return True
+
+            remaining = deadline - time.time()
+
+            if remaining <= 0:
+                return False
+
+            event.wait(min(remaining, CHECK_INTERVAL))
+            event.clear()
+    finally:
+        _lock.acquire()
+        try:
+            events = _waiters[review_request_id]
+            events.remove(event)
+
+            if not events:
+                del _waiters[review_request_id]
+        finally:
+            _lock.release()
+
+
+def notify(review_request):
+    """
+    Announces new activity on a review request. This stores the new
+    timestamp for other processes and wakes up any requests in this
+    process that are waiting on it.
+    """
+    timestamp, activity_type = review_request.get_last_activity()
+    cache.set(_get_cache_key(review_request.id), timestamp,
+              settings.CACHE_EXPIRATION_TIME)
+
+    _lock.acquire()
+    try:
+        for event in _waiters.get(review_request.id, []):
+            event.set()
+    finally:
+        _lock.release()
+
+
+def review_request_saved_cb(sender, instance, **kwargs):
+    """
+    Listens to ReviewRequest saves and announces any new activity.
+
+    Publishing a review request, a review or a reply saves the review
+    request along with its new activity, as does closing or reopening it,
+    so this covers every kind of update.
+    """
+    notify(instance)
+
+
+def connect_signals():
+    post_save.connect(review_request_saved_cb, sender=ReviewRequest)
+
+
+def _get_cache_key(review_request_id):
+    return 'review-request-last-activity-%s' % review_request_id
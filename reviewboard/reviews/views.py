@@ -18,7 +18,6 @@ from django.utils.http import http_date
 from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext as _
 from django.views.decorators.cache import cache_control
-from django.views.generic.list_detail import object_list
 
 from djblets.util.dates import get_latest_timestamp
 from djblets.util.http import set_last_modified, get_modified_since, \
@@ -29,7 +28,7 @@ from djblets.siteconfig.models import SiteConfiguration
 from reviewboard.accounts.decorators import check_login_required, \
                                             valid_prefs_required
 from reviewboard.accounts.models import ReviewRequestVisit
-from reviewboard.diffviewer.diffutils import get_file_chunks_in_range
+from reviewboard.diffviewer.diffutils import get_file_chunks_in_ranges
 from reviewboard.diffviewer.forms import UploadDiffForm
 from reviewboard.diffviewer.models import DiffSet
 from reviewboard.diffviewer.views import view_diff, view_diff_fragment, \
@@ -39,11 +38,14 @@ from reviewboard.reviews.datagrids import DashboardDataGrid, \
                                           ReviewRequestDataGrid, \
                                           SubmitterDataGrid, \
                                           WatchedGroupDataGrid
+from reviewboard.reviews.errors import SearchError
 from reviewboard.reviews.forms import NewReviewRequestForm, \
                                       UploadScreenshotForm
 from reviewboard.reviews.models import Comment, ReviewRequest, \
                                        ReviewRequestDraft, Review, Group, \
                                        Screenshot, ScreenshotComment
+from reviewboard.reviews.search import get_search_backend, \
+                                       get_search_results
 from reviewboard.scmtools.core import PRE_CREATION
 from reviewboard.scmtools.models import Repository
 
@@ -106,9 +108,6 @@ def review_detail(request, review_request_id,
     """
     review_request = get_object_or_404(ReviewRequest, pk=review_request_id)
 
-    reviews = review_request.get_public_reviews()
-    review = review_request.get_pending_review(request.user)
-
     if request.user.is_authenticated():
         # If the review request is public and pending review and if the user
         # is logged in, mark that they've visited this review request.
@@ -119,7 +118,7 @@ def review_detail(request, review_request_id,
             visited.save()
 
 
-    # Unlike review above, this covers replies as well.
+    # Unlike get_pending_review, this covers replies as well.
     review_timestamp = 0
 
     if request.user.is_authenticated():
@@ -135,20 +134,24 @@ def review_detail(request, review_request_id,
     draft = review_request.get_draft(request.user)
 
     # Find out if we can bail early. Generate an ETag for this.
-    last_activity_time, updated_object = review_request.get_last_activity()
+    last_activity_time, activity_type = review_request.get_last_activity()
 
     if draft:
         draft_timestamp = draft.last_updated
     else:
         draft_timestamp = ""
 
-    etag = "%s:%s:%s:%s:%s" % (request.user, last_activity_time,
-                               draft_timestamp, review_timestamp,
-                               settings.AJAX_SERIAL)
+    etag = "%s:%s:%s:%s:%s:%s" % (request.user, last_activity_time,
+                                  review_request.last_updated,
+                                  draft_timestamp, review_timestamp,
+                                  settings.AJAX_SERIAL)
 
     if etag_if_none_match(request, etag):
         return HttpResponseNotModified()
 
+    reviews = review_request.get_public_reviews()
+    review = review_request.get_pending_review(request.user)
+
     repository = review_request.repository
     changedescs = review_request.changedescs.filter(public=True)
 
@@ -433,7 +436,7 @@ def diff(request, review_request_id, revision=None, interdiff_revision=None,
     if draft and draft.diffset:
         num_diffs += 1
 
-    last_activity_time, updated_object = review_request.get_last_activity()
+    last_activity_time, activity_type = review_request.get_last_activity()
 
     return view_diff(request, diffset.id, interdiffset_id, {
         'review': review,
@@ -481,39 +484,83 @@ def build_diff_comment_fragments(
         comment_template_name='reviews/diff_comment_fragment.html',
         error_template_name='diffviewer/diff_fragment_error.html'):
 
-    comment_entries = []
-    had_error = False
+    """
+    Renders the diff fragment for each comment in the list.
+
+    The comments are grouped by the file (and interdiff file) they were
+    made on, so that each file's chunks are loaded only once, and all the
+    ranges of lines needed from a file are pulled from it in one pass.
+    The entries are returned in the order of the original list.
+    """
+    comments = list(comments)
+    files = {}
+    file_keys = []
 
     for comment in comments:
+        key = (comment.filediff_id, comment.interfilediff_id)
+
+        if key not in files:
+            files[key] = []
+            file_keys.append(key)
+
+        files[key].append(comment)
+
+    contents = {}
+    had_error = False
+
+    def render_error(comment, e):
+        # This must be called while handling the exception, so that the
+        # traceback shows where it was raised.
+        return exception_traceback_string(None, e, error_template_name, {
+            'comment': comment,
+            'file': {
+                'depot_filename': comment.filediff.source_file,
+                'index': None,
+                'filediff': comment.filediff,
+            },
+        })
+
+    for key in file_keys:
+        file_comments = files[key]
+        file_comments.sort(lambda a, b: cmp((a.first_line, a.num_lines),
+                                            (b.first_line, b.num_lines)))
+
+        # It's bad if we fail, and we'll return a 500, but we'll still
+        # return content for anything we have. This will prevent any
+        # caching.
         try:
-            content = render_to_string(comment_template_name, {
-                'comment': comment,
-                'chunks': list(get_file_chunks_in_range(context,
-                                                        comment.filediff,
-                                                        comment.interfilediff,
-                                                        comment.first_line,
-                                                        comment.num_lines))
-            })
+            chunks_list = get_file_chunks_in_ranges(
+                context,
+                file_comments[0].filediff,
+                file_comments[0].interfilediff,
+                [(comment.first_line, comment.num_lines)
+                 for comment in file_comments])
         except Exception, e:
-            content = exception_traceback_string(None, e,
-                                                 error_template_name, {
-                'comment': comment,
-                'file': {
-                    'depot_filename': comment.filediff.source_file,
-                    'index': None,
-                    'filediff': comment.filediff,
-                },
-            })
+            for comment in file_comments:
+                contents[comment.id] = render_error(comment, e)
 
-            # It's bad that we failed, and we'll return a 500, but we'll
-            # still return content for anything we have. This will prevent any
-            # caching.
             had_error = True
+            continue
 
-        comment_entries.append({
+        for comment, chunks in zip(file_comments, chunks_list):
+            try:
+                content = render_to_string(comment_template_name, {
+                    'comment': comment,
+                    'chunks': chunks,
+                })
+            except Exception, e:
+                content = render_error(comment, e)
+                had_error = True
+
+            contents[comment.id] = content
+
+    comment_entries = [
+        {
             'comment': comment,
-            'html': content,
-        })
+            'html': contents[comment.id],
+        }
+        for comment in comments
+    ]
 
     return had_error, comment_entries
 
@@ -557,7 +604,7 @@ def comment_diff_fragments(
         return HttpResponseServerError(page_content)
 
     response = HttpResponse(page_content)
-    set_last_modified(response, comment.timestamp)
+    set_last_modified(response, latest_timestamp)
     response['Expires'] = http_date(time.time() + 60 * 60 * 24 * 365) # 1 year
     return response
 
@@ -777,9 +824,12 @@ def view_screenshot(request, review_request_id, screenshot_id,
     }))
 
 
-def search(request, template_name='reviews/search.html'):
+def search(request, template_name='reviews/search.html', paginate_by=10):
     """
     Searches review requests on Review Board based on a query string.
+
+    Only the page of results being shown is fetched from the search index,
+    along with the fields shown for each result.
     """
     query = request.GET.get('q', '')
     siteconfig = SiteConfiguration.objects.get_current()
@@ -792,34 +842,44 @@ def search(request, template_name='reviews/search.html'):
         # FIXME: I'm not super thrilled with this
         return HttpResponseRedirect(reverse("root"))
 
-    import lucene
-
-    # We may have already initialized lucene
     try:
-        lucene.initVM(lucene.CLASSPATH)
+        page = int(request.GET.get('page', 1))
     except ValueError:
-        pass
+        raise Http404
+
+    if page < 1:
+        raise Http404
+
+    offset = (page - 1) * paginate_by
 
-    index_file = siteconfig.get("search_index_file")
-    store = lucene.FSDirectory.getDirectory(index_file, False)
     try:
-        searcher = lucene.IndexSearcher(store)
-    except lucene.JavaError, e:
-        # FIXME: show a useful error
-        raise e
-
-    parser = lucene.QueryParser('text', lucene.StandardAnalyzer())
-    result_ids = [int(lucene.Hit.cast_(hit).getDocument().get('id')) \
-                  for hit in searcher.search(parser.parse(query))]
-
-    searcher.close()
-
-    results = ReviewRequest.objects.filter(id__in=result_ids)
-
-    return object_list(request=request,
-                       queryset=results,
-                       paginate_by=10,
-                       template_name=template_name,
-                       extra_context={'query': query,
-                                      'extra_query': 'q=%s' % query,
-                                     })
+        results = get_search_backend().search(query, offset, paginate_by)
+    except SearchError, e:
+        logging.error("Search for '%s' failed: %s" % (query, e))
+        return render_to_response(template_name, RequestContext(request, {
+            'query': query,
+            'error': e,
+        }))
+
+    pages = max((results.total + paginate_by - 1) // paginate_by, 1)
+
+    if page > pages:
+        raise Http404
+
+    # This provides the same context as the object_list generic view.
+    return render_to_response(template_name, RequestContext(request, {
+        'query': query,
+        'extra_query': 'q=%s' % query,
+        'object_list': get_search_results(results),
+        'is_paginated': pages > 1,
+        'results_per_page': paginate_by,
+        'has_next': page < pages,
+        'has_previous': page > 1,
+        'page': page,
+        'next': page + 1,
+        'previous': page - 1,
+        'first_on_page': offset + 1,
+        'last_on_page': offset + len(results.hits),
+        'pages': pages,
+        'hits': results.total,
+    }))
@@ -1,4 +1,6 @@
 import os
+import sys
+import threading
 import urlparse
 
 import reviewboard.diffviewer.parser as diffparser
@@ -41,6 +43,58 @@ UNKNOWN = Revision('UNKNOWN')
 PRE_CREATION = Revision("PRE-CREATION")
 
 
+def map_concurrently(func, items, num_workers=4):
+    """
+    Calls func on each item using up to num_workers threads, returning the
+    results in the same order as the items.
+
+    If any of the calls raise an exception, the first one is re-raised once
+    all the threads have finished.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    errors = []
+    lock = threading.Lock()
+    state = {'next': 0}
+
+    def run_worker():
+        while True:
+            lock.acquire()
+
+            try:
+                i = state['next']
+                state['next'] += 1
+            finally:
+                lock.release()
+
+            if i >= len(items) or errors:
+                break
+
+            try:
+                results[i] = func(items[i])
+            except:
+                errors.append(sys.exc_info())
+
+    num_workers = min(num_workers, len(items))
+
+    if num_workers <= 1:
+        return [func(item) for item in items]
+
+    threads = [threading.Thread(target=run_worker)
+               for i in xrange(num_workers)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0][0], errors[0][1], errors[0][2]
+
+    return results
+
+
 class SCMTool(object):
     name = None
     uses_atomic_revisions = False
@@ -63,6 +117,19 @@ class SCMTool(object):
     def get_file(self, path, revision=None):
         raise NotImplementedError
 
+    def get_files(self, files):
+        """
+        Fetches several files at once.
+
+        files is a list of (path, revision) tuples. The contents of each
+        file are returned in a list in the same order. As with get_file,
+        FileNotFoundError is raised if any of the files don't exist.
+
+        Subclasses should override this if the repository can fetch many
+        files with less overhead than fetching each one separately.
+        """
+        return [self.get_file(path, revision) for path, revision in files]
+
     def file_exists(self, path, revision=HEAD):
         try:
             self.get_file(path, revision)
@@ -70,6 +137,18 @@ class SCMTool(object):
         except FileNotFoundError, e:
             return False
 
+    def files_exist(self, files):
+        """
+        Checks whether several files exist at once.
+
+        files is a list of (path, revision) tuples. A list of booleans is
+        returned in the same order.
+
+        Subclasses should override this if the repository can check many
+        files with less overhead than checking each one separately.
+        """
+        return [self.file_exists(path, revision) for path, revision in files]
+
     def parse_diff_revision(self, file_str, revision_str):
         raise NotImplementedError
 
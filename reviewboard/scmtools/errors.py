@@ -46,6 +46,37 @@ class FileNotFoundError(SCMError):
         self.detail = detail
 
 
+class FilesNotFoundError(FileNotFoundError):
+    """
+    An error indicating that one or more files could not be found in the
+    repository.
+
+    The files are stored as a list of (path, revision) tuples. The path and
+    revision of the first file are also available, so this can be handled
+    like a FileNotFoundError.
+    """
+    def __init__(self, files):
+        from reviewboard.scmtools.core import HEAD
+
+        path, revision = files[0]
+        FileNotFoundError.__init__(self, path, revision)
+
+        names = []
+
+        for file_path, file_revision in files:
+            if file_revision == None or file_revision == HEAD:
+                names.append("'%s'" % file_path)
+            else:
+                names.append("'%s' (r%s)" % (file_path, file_revision))
+
+        if len(files) > 1:
+            Exception.__init__(self,
+                "The following files could not be found in the "
+                "repository: %s" % ', '.join(names))
+
+        self.files = files
+
+
 class RepositoryNotFoundError(SCMError):
     """An error indicating that a path does not represent a valid repository."""
     def __init__(self):
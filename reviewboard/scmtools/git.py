@@ -2,6 +2,8 @@ import logging
 import os
 import re
 import subprocess
+import threading
+import time
 import urllib2
 import urlparse
 
@@ -12,10 +14,12 @@ try:
 except ImportError:
     from urllib import quote as urllib_quote
 
+from django.conf import settings
 from djblets.util.filesystem import is_exe_in_path
 
 from reviewboard.diffviewer.parser import DiffParser, DiffParserError, File
-from reviewboard.scmtools.core import SCMTool, HEAD, PRE_CREATION
+from reviewboard.scmtools.core import SCMTool, HEAD, PRE_CREATION, \
+                                      map_concurrently
 from reviewboard.scmtools.errors import FileNotFoundError, \
                                         RepositoryNotFoundError, \
                                         SCMError
@@ -47,6 +51,21 @@ class GitTool(SCMTool):
 
         return self.client.get_file(path, revision)
 
+    def get_files(self, files):
+        to_fetch = [(path, revision) for path, revision in files
+                    if revision != PRE_CREATION]
+        contents = self.client.get_files(to_fetch)
+        contents.reverse()
+        results = []
+
+        for path, revision in files:
+            if revision == PRE_CREATION:
+                results.append("")
+            else:
+                results.append(contents.pop())
+
+        return results
+
     def file_exists(self, path, revision=HEAD):
         if revision == PRE_CREATION:
             return False
@@ -56,6 +75,21 @@ class GitTool(SCMTool):
         except FileNotFoundError:
             return False
 
+    def files_exist(self, files):
+        to_check = [(path, revision) for path, revision in files
+                    if revision != PRE_CREATION]
+        exists = self.client.get_files_exist(to_check)
+        exists.reverse()
+        results = []
+
+        for path, revision in files:
+            if revision == PRE_CREATION:
+                results.append(False)
+            else:
+                results.append(exists.pop())
+
+        return results
+
     def parse_diff_revision(self, file_str, revision_str):
         revision = revision_str
         if file_str == "/dev/null":
@@ -100,18 +134,18 @@ class GitDiffParser(DiffParser):
     """
     pre_creation_regexp = re.compile("^0+$")
 
-    def parse(self):
+    def iter_files(self):
         """
-        Parses the diff, returning a list of File objects representing each
-        file in the diff.
+        Parses the diff, yielding a File object for each file in the diff.
         """
-        self.files = []
         i = 0
-        while i < len(self.lines):
+        num_lines = len(self.lines)
+
+        while i < num_lines:
             (i, file) = self._parse_diff(i)
+
             if file:
-                self.files.append(file)
-        return self.files
+                yield file
 
     def _parse_diff(self, i):
         """
@@ -136,7 +170,7 @@ class GitDiffParser(DiffParser):
 
             # Now we have a diff we are going to use so get the filenames + commits
             file = File()
-            file.data = self.lines[i] + "\n"
+            header = self.lines[i] + "\n"
             file.binary = False
             diffLine = self.lines[i].split()
             try:
@@ -167,13 +201,16 @@ class GitDiffParser(DiffParser):
                 i += 1
 
             # Get the changes
+            body_start = i
+
             while i < len(self.lines):
                 if self.lines[i].startswith("diff --git"):
-                    return i, file
+                    break
 
                 if self.lines[i].startswith("Binary files") or \
                    self.lines[i].startswith("GIT binary patch"):
                     file.binary = True
+                    file.data = header + self.lines.get_data(body_start, i)
                     return i + 1, file
 
                 if i + 1 < len(self.lines) and \
@@ -182,13 +219,310 @@ class GitDiffParser(DiffParser):
                     if self.lines[i].split()[1] == "/dev/null":
                         file.origInfo = PRE_CREATION
 
-                file.data += self.lines[i] + "\n"
                 i += 1
 
+            file.data = header + self.lines.get_data(body_start, i)
+
             return i, file
         return i + 1, None
 
 
+class GitCatFileProcess(object):
+    """
+    A long-running git-cat-file(1) process in batch mode.
+
+    Object names are written to the process one per line, and the type and
+    (unless batch_check is set) contents of each object are read back.
+    A process must only be used by one thread at a time.
+    """
+    # The number of object names written at once by request_many. This
+    # keeps the names well within the pipe's buffer, so writing them can't
+    # block while git waits for us to read its output.
+    PIPELINE_SIZE = 100
+
+    def __init__(self, git_dir, batch_check=False):
+        self.batch_check = batch_check
+
+        if batch_check:
+            option = '--batch-check'
+        else:
+            option = '--batch'
+
+        self._devnull = open(os.devnull, 'w')
+        self.p = subprocess.Popen(
+            ['git', '--git-dir=%s' % git_dir, 'cat-file', option],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=self._devnull,
+            close_fds=(os.name != 'nt')
+        )
+
+    def is_alive(self):
+        return self.p.poll() is None
+
+    def request(self, object):
+        """
+        Looks up an object, returning a tuple of its type and contents.
+        The contents are None for batch_check processes.
+
+        FileNotFoundError is raised if the object doesn't exist. IOError
+        or ValueError are raised if the process misbehaves, in which case
+        it should be closed and replaced.
+        """
+        self.p.stdin.write(object + "\n")
+        self.p.stdin.flush()
+
+        return self._read_response(object)
+
+    def request_many(self, objects):
+        """
+        Looks up several objects, returning a list of (type, contents)
+        tuples in the same order. Objects that don't exist are returned
+        as None.
+
+        Object names are written in batches of PIPELINE_SIZE, without
+        waiting for each response before sending the next request.
+        """
+        results = []
+
+        for i in xrange(0, len(objects), self.PIPELINE_SIZE):
+            batch = objects[i:i + self.PIPELINE_SIZE]
+            self.p.stdin.write("".join([object + "\n" for object in batch]))
+            self.p.stdin.flush()
+
+            for object in batch:
+                try:
+                    results.append(self._read_response(object))
+                except FileNotFoundError:
+                    results.append(None)
+
+        return results
+
+    def _read_response(self, object):
+        header = self.p.stdout.readline()
+
+        if not header.endswith("\n"):
+            raise IOError("git cat-file exited unexpectedly")
+
+        header = header[:-1]
+
+        if header.endswith(" missing") or header.endswith(" ambiguous"):
+            raise FileNotFoundError(object)
+
+        sha1, object_type, size = header.split(" ")
+
+        if self.batch_check:
+            return object_type, None
+
+        # The contents are followed by a newline.
+        size = int(size)
+        data = self.p.stdout.read(size + 1)
+
+        if len(data) != size + 1 or not data.endswith("\n"):
+            raise IOError("Short read from git cat-file")
+
+        return object_type, data[:-1]
+
+    def close(self):
+        try:
+            try:
+                self.p.stdin.close()
+                self.p.stdout.close()
+                self.p.wait()
+            except (IOError, OSError):
+                pass
+        finally:
+            self._devnull.close()
+
+
+class GitCatFilePool(object):
+    """
+    A pool of GitCatFileProcesses for a repository.
+
+    Processes are started as they're needed, up to the size of the pool,
+    and are kept around to serve later requests. Requests beyond that wait
+    for a process to free up. A process that has died or returns bad
+    output is replaced and the request is retried once.
+    """
+    def __init__(self, git_dir, batch_check=False, size=4):
+        self.git_dir = git_dir
+        self.batch_check = batch_check
+        self.size = max(size, 1)
+
+        # Idle slots. A slot is None until a process is started for it.
+        self._idle = [None] * self.size
+        self._cond = threading.Condition()
+
+        self.stats = {
+            'requests': 0,
+            'waits': 0,
+            'total_wait_time': 0.0,
+            'max_wait_time': 0.0,
+            'restarts': 0,
+        }
+
+    def request(self, object):
+        """
+        Looks up an object using a process from the pool. See
+        GitCatFileProcess.request.
+        """
+        return self._run(lambda process: process.request(object),
+                         object)
+
+    def request_many(self, objects):
+        """
+        Looks up several objects using a single process from the pool. See
+        GitCatFileProcess.request_many.
+        """
+        return self._run(lambda process: process.request_many(objects),
+                         "%d objects" % len(objects))
+
+    def _run(self, func, description):
+        process = self._checkout()
+
+        try:
+            for attempt in xrange(2):
+                if process is None or not process.is_alive():
+                    if process is not None:
+                        process.close()
+                        self._record_restart()
+
+                    process = GitCatFileProcess(self.git_dir,
+                                                self.batch_check)
+
+                try:
+                    return func(process)
+                except (IOError, OSError, ValueError), e:
+                    logging.warning("Git: cat-file process for %s failed: "
+                                    "%s" % (self.git_dir, e))
+                    process.close()
+                    process = None
+                    self._record_restart()
+
+            raise SCMError("Unable to read %s from git cat-file" %
+                           description)
+        finally:
+            self._checkin(process)
+
+    def close(self):
+        """
+        Stops all idle processes. Processes that are in use will be stopped
+        when they're returned.
+        """
+        self._cond.acquire()
+
+        try:
+            for process in self._idle:
+                if process is not None:
+                    process.close()
+
+            self._idle = [None] * len(self._idle)
+        finally:
+            self._cond.release()
+
+    def get_stats(self):
+        """
+        Returns statistics on the pool, including how long requests have
+        waited for a free process.
+        """
+        self._cond.acquire()
+
+        try:
+            stats = dict(self.stats)
+        finally:
+            self._cond.release()
+
+        if stats['requests']:
+            stats['average_wait_time'] = \
+                stats['total_wait_time'] / stats['requests']
+        else:
+            stats['average_wait_time'] = 0.0
+
+        stats['git_dir'] = self.git_dir
+        stats['batch_check'] = self.batch_check
+        stats['size'] = self.size
+
+        return stats
+
+    def _checkout(self):
+        self._cond.acquire()
+
+        try:
+            start = time.time()
+            waited = not self._idle
+
+            while not self._idle:
+                self._cond.wait()
+
+            wait_time = time.time() - start
+            self.stats['requests'] += 1
+            self.stats['total_wait_time'] += wait_time
+            self.stats['max_wait_time'] = max(self.stats['max_wait_time'],
+                                              wait_time)
+
+            if waited:
+                self.stats['waits'] += 1
+
+            return self._idle.pop()
+        finally:
+            self._cond.release()
+
+    def _checkin(self, process):
+        self._cond.acquire()
+
+        try:
+            self._idle.append(process)
+            self._cond.notify()
+        finally:
+            self._cond.release()
+
+    def _record_restart(self):
+        self._cond.acquire()
+        self.stats['restarts'] += 1
+        self._cond.release()
+
+
+_cat_file_pools = {}
+_cat_file_pools_lock = threading.Lock()
+
+
+def get_cat_file_pool(git_dir, batch_check=False):
+    """
+    Returns the shared GitCatFilePool for a repository, creating it if
+    needed. The size of new pools is set by settings.GIT_CAT_FILE_POOL_SIZE.
+    """
+    key = (git_dir, batch_check)
+
+    _cat_file_pools_lock.acquire()
+
+    try:
+        if key not in _cat_file_pools:
+            _cat_file_pools[key] = GitCatFilePool(
+                git_dir, batch_check,
+                getattr(settings, 'GIT_CAT_FILE_POOL_SIZE', 4))
+
+        return _cat_file_pools[key]
+    finally:
+        _cat_file_pools_lock.release()
+
+
+def get_cat_file_pool_stats():
+    """
+    Returns the statistics for every git-cat-file pool in this process.
+    """
+    _cat_file_pools_lock.acquire()
+
+    try:
+        pools = _cat_file_pools.values()
+    finally:
+        _cat_file_pools_lock.release()
+
+    stats = [pool.get_stats() for pool in pools]
+    stats.sort(key=lambda s: (s['git_dir'], s['batch_check']))
+
+    return stats
+
+
 class GitClient(object):
     schemeless_url_re = re.compile(
         r'^(?P<username>[A-Za-z0-9_\.-]+@)?(?P<hostname>[A-Za-z0-9_\.-]+):'
@@ -250,6 +584,59 @@ class GitClient(object):
         else:
             return self._cat_file(path, revision, "blob")
 
+    def get_files(self, files):
+        """
+        Fetches the contents of several files, given as a list of
+        (path, revision) tuples.
+
+        Local repositories are read through the shared pool of
+        git-cat-file(1) processes, with all the requests pipelined to a
+        single process.
+        """
+        if self.raw_file_url or not files:
+            return [self.get_file(path, revision) for path, revision in files]
+
+        objects = [self._resolve_head(revision, path)
+                   for path, revision in files]
+        pool = get_cat_file_pool(self.git_dir)
+        results = []
+
+        for object, result in zip(objects, pool.request_many(objects)):
+            if result is None:
+                raise FileNotFoundError(object)
+
+            object_type, contents = result
+
+            if object_type != "blob":
+                raise SCMError("fatal: git cat-file %s: bad file" % object)
+
+            results.append(contents)
+
+        return results
+
+    def get_files_exist(self, files):
+        """
+        Checks whether several files exist, given as a list of
+        (path, revision) tuples. A list of booleans is returned.
+
+        Files are checked over HTTP in parallel if there's a raw file URL.
+        Otherwise, the checks are pipelined to a single git-cat-file(1)
+        process from the shared pool.
+        """
+        if not files:
+            return []
+
+        if self.raw_file_url:
+            return map_concurrently(
+                lambda file: bool(self.get_file_exists(*file)), files)
+
+        objects = [self._resolve_head(revision, path)
+                   for path, revision in files]
+        pool = get_cat_file_pool(self.git_dir, batch_check=True)
+
+        return [result is not None and result[0] == "blob"
+                for result in pool.request_many(objects)]
+
     def get_file_exists(self, path, revision):
         if self.raw_file_url:
             # First, try to grab the file remotely.
@@ -277,7 +664,8 @@ class GitClient(object):
     def _cat_file(self, path, revision, option):
         """
         Call git-cat-file(1) to get content or type information for a
-        repository object.
+        repository object. Requests go through a shared pool of
+        long-running git-cat-file processes for the repository.
 
         If called with just "commit", gets the content of a blob (or
         raises an exception if the commit is not a blob).
@@ -286,22 +674,13 @@ class GitClient(object):
         e.g. to test or existence or get the type of "commit".
         """
         commit = self._resolve_head(revision, path)
+        pool = get_cat_file_pool(self.git_dir, batch_check=(option == "-t"))
+        object_type, contents = pool.request(commit)
 
-        p = subprocess.Popen(
-            ['git', '--git-dir=%s' % self.git_dir, 'cat-file', option, commit],
-            stderr=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            close_fds=(os.name != 'nt')
-        )
-        contents = p.stdout.read()
-        errmsg = p.stderr.read()
-        failure = p.wait()
-
-        if failure:
-            if errmsg.startswith("fatal: Not a valid object name"):
-                raise FileNotFoundError(commit)
-            else:
-                raise SCMError(errmsg)
+        if option == "-t":
+            return object_type
+        elif object_type != option:
+            raise SCMError("fatal: git cat-file %s: bad file" % commit)
 
         return contents
 
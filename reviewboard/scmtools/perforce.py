@@ -1,15 +1,201 @@
 import re
-import subprocess
+import threading
+import time
 
 try:
     from P4 import P4Error
 except ImportError:
     pass
 
+from django.conf import settings
+
 from reviewboard.diffviewer.parser import DiffParser
 from reviewboard.scmtools.core import SCMTool, ChangeSet, \
                                       HEAD, PRE_CREATION
-from reviewboard.scmtools.errors import SCMError, EmptyChangeSetError
+from reviewboard.scmtools.errors import SCMError, EmptyChangeSetError, \
+                                        FileNotFoundError
+
+
+class P4ConnectionPool(object):
+    """
+    A pool of connections to a Perforce server for a single user.
+
+    Connections are opened as they're needed, up to max_connections, and
+    are kept open to serve later operations. Requests beyond that wait for
+    a connection to be returned. Connections that have been idle for longer
+    than idle_timeout seconds are closed.
+    """
+    def __init__(self, port, user, password, max_connections=4,
+                 idle_timeout=300):
+        self.port = port
+        self.user = user
+        self.password = password
+        self.max_connections = max(max_connections, 1)
+        self.idle_timeout = idle_timeout
+
+        # Idle connections, as (p4, last_used) tuples. The most recently
+        # used connection is at the end.
+        self._idle = []
+        self._num_connections = 0
+        self._cond = threading.Condition()
+
+    def run(self, func):
+        """
+        Calls func with a connected P4 instance from the pool, returning
+        its result.
+
+        If the connection turns out to have been dropped by the server, a
+        new connection is opened and func is called once more.
+        """
+        p4 = self.checkout()
+
+        try:
+            try:
+                return func(p4)
+            except P4Error:
+                if self._is_connected(p4):
+                    raise
+
+            # The connection was dropped. Try again on a fresh one.
+            self._disconnect(p4)
+            p4 = self._connect(p4)
+
+            return func(p4)
+        finally:
+            self.checkin(p4)
+
+    def checkout(self):
+        """
+        Returns a connected P4 instance. It must be given back with
+        checkin() once the caller is done with it.
+        """
+        self._cond.acquire()
+
+        try:
+            self._reap_idle()
+
+            while not self._idle and \
+                  self._num_connections >= self.max_connections:
+                self._cond.wait()
+
+            if self._idle:
+                p4 = self._idle.pop()[0]
+            else:
+                p4 = None
+                self._num_connections += 1
+        finally:
+            self._cond.release()
+
+        try:
+            if p4 is None:
+                import P4
+                p4 = P4.P4()
+                p4.port = self.port
+                p4.user = self.user
+                p4.password = self.password
+                p4.exception_level = 1
+
+            if not self._is_connected(p4):
+                p4 = self._connect(p4)
+        except:
+            # We couldn't connect, so give up the slot.
+            self.checkin(None)
+            raise
+
+        return p4
+
+    def checkin(self, p4):
+        """
+        Returns a P4 instance to the pool. Passing None gives up the
+        slot of a connection that couldn't be made.
+        """
+        self._cond.acquire()
+
+        try:
+            if p4 is None:
+                self._num_connections -= 1
+            else:
+                self._idle.append((p4, time.time()))
+
+            self._cond.notify()
+        finally:
+            self._cond.release()
+
+    def close(self):
+        """
+        Closes all idle connections.
+        """
+        self._cond.acquire()
+
+        try:
+            for p4, last_used in self._idle:
+                self._disconnect(p4)
+
+            self._num_connections -= len(self._idle)
+            self._idle = []
+            self._cond.notifyAll()
+        finally:
+            self._cond.release()
+
+    def _reap_idle(self):
+        # This must be called with the lock held. Idle connections are
+        # ordered by when they were last used, so the oldest are first.
+        expire_time = time.time() - self.idle_timeout
+
+        while self._idle and self._idle[0][1] < expire_time:
+            p4 = self._idle.pop(0)[0]
+            self._disconnect(p4)
+            self._num_connections -= 1
+
+    def _connect(self, p4):
+        p4.connect()
+
+        return p4
+
+    def _disconnect(self, p4):
+        try:
+            if p4.connected():
+                p4.disconnect()
+        except (AttributeError, P4Error):
+            # If the connection has already gone away, disconnect() can
+            # fail. There's nothing left to clean up, so it's safe to
+            # ignore.
+            pass
+
+    def _is_connected(self, p4):
+        if not p4.connected():
+            return False
+
+        # Newer versions of P4Python can tell us if the server dropped the
+        # connection.
+        dropped = getattr(p4, 'dropped', None)
+
+        return not (dropped and dropped())
+
+
+_p4_pools = {}
+_p4_pools_lock = threading.Lock()
+
+
+def get_p4_connection_pool(port, user, password):
+    """
+    Returns the process-wide connection pool for a Perforce server and
+    user, creating it if needed. The number of connections in new pools
+    is limited by settings.P4_CONNECTION_POOL_SIZE.
+    """
+    key = (port, user, password)
+
+    _p4_pools_lock.acquire()
+
+    try:
+        if key not in _p4_pools:
+            _p4_pools[key] = P4ConnectionPool(
+                port, user, password,
+                getattr(settings, 'P4_CONNECTION_POOL_SIZE', 4))
+
+        return _p4_pools[key]
+    finally:
+        _p4_pools_lock.release()
 
 
 class PerforceTool(SCMTool):
@@ -23,47 +209,26 @@ class PerforceTool(SCMTool):
     def __init__(self, repository):
         SCMTool.__init__(self, repository)
 
+        # Connections are only opened when first needed, so this makes sure
+        # a missing P4 module is still reported when the tool is created.
         import P4
-        self.p4 = P4.P4()
-        self.p4.port = str(repository.mirror_path or repository.path)
-        self.p4.user = str(repository.username)
-        self.p4.password = str(repository.password)
-        self.p4.exception_level = 1
-
-        # We defer actually connecting until just before we do some operation
-        # that requires an active connection to the perforce depot.  This
-        # connection is then left open as long as possible.
 
-    def __del__(self):
-        try:
-            self._disconnect()
-        except P4Error:
-            # Exceptions in __del__ get ignored but spew warnings.  If there's
-            # no internet connection, we'll get a P4Error from disconnect().
-            # This is totally safe to ignore.
-            pass
-
-    def _connect(self):
-        if not self.p4.connected():
-            self.p4.connect()
-
-    def _disconnect(self):
-        try:
-            if self.p4.connected():
-                self.p4.disconnect()
-        except AttributeError:
-            pass
+        # Connections are shared between all PerforceTools for the same
+        # server and user, and are left open between operations.
+        self.pool = get_p4_connection_pool(
+            str(repository.mirror_path or repository.path),
+            str(repository.username),
+            str(repository.password))
 
     def get_pending_changesets(self, userid):
-        self._connect()
-        return map(self.get_changeset,
-                   [x.split()[1] for x in
-                       self.p4.run_changes('-s', 'pending', '-u', userid)])
+        changes = self.pool.run(
+            lambda p4: p4.run_changes('-s', 'pending', '-u', userid))
+
+        return map(self.get_changeset, [x.split()[1] for x in changes])
 
     def get_changeset(self, changesetid):
-        self._connect()
-        changeset = self.p4.run_describe('-s', str(changesetid))
-        self._disconnect()
+        changeset = self.pool.run(
+            lambda p4: p4.run_describe('-s', str(changesetid)))
 
         if changeset:
             return self.parse_change_desc(changeset[0], changesetid)
@@ -73,51 +238,118 @@ class PerforceTool(SCMTool):
         return True
 
     def get_file(self, path, revision=HEAD):
-        if revision == PRE_CREATION:
-            return ''
+        return self.get_files([(path, revision)])[0]
 
-        if revision == HEAD:
-            file = path
-        else:
-            file = '%s#%s' % (path, revision)
+    def get_files(self, files):
+        """
+        Fetches several files with a single "p4 print" over a pooled
+        connection.
+        """
+        to_fetch = [(path, revision) for path, revision in files
+                    if revision != PRE_CREATION]
+
+        if not to_fetch:
+            return [''] * len(files)
+
+        filespecs = [self._get_filespec(path, revision)
+                     for path, revision in to_fetch]
 
-        cmdline = ['p4', '-p', self.p4.port]
-        if self.p4.user:
-            cmdline.extend(['-u', self.p4.user])
-        if self.p4.password:
-            cmdline.extend(['-P', self.p4.password])
-        cmdline.extend(['print', '-q', file])
+        def print_files(p4):
+            return p4.run_print(*filespecs), p4.warnings
 
-        p = subprocess.Popen(cmdline, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            results, warnings = self.pool.run(print_files)
+        except P4Error, e:
+            raise SCMError(str(e))
+
+        # Missing files are reported as warnings rather than errors.
+        for warning in warnings:
+            if 'no such file' in warning or 'no file(s)' in warning:
+                for filespec, (path, revision) in zip(filespecs, to_fetch):
+                    if warning.startswith(filespec + ' '):
+                        raise FileNotFoundError(path, revision, warning)
+
+                raise SCMError(warning)
+
+        # Each file's results start with a dictionary describing the file,
+        # followed by its content in one or more chunks.
+        contents = []
+
+        for result in results:
+            if isinstance(result, dict):
+                contents.append([])
+            elif contents:
+                contents[-1].append(result)
+
+        if len(contents) != len(to_fetch):
+            raise SCMError('Unexpected output from p4 print: expected %d '
+                           'files, got %d' % (len(to_fetch), len(contents)))
+
+        contents.reverse()
+        data = []
+
+        for path, revision in files:
+            if revision == PRE_CREATION:
+                data.append('')
+            else:
+                data.append(''.join(contents.pop()))
+
+        return data
+
+    def files_exist(self, files):
+        """
+        Checks for several files with a single "p4 files" over a pooled
+        connection.
+        """
+        filespecs = [self._get_filespec(path, revision)
+                     for path, revision in files
+                     if revision != PRE_CREATION]
+
+        if not filespecs:
+            return [False] * len(files)
+
+        def check_files(p4):
+            return p4.run_files(*filespecs), p4.warnings
+
+        try:
+            results, warnings = self.pool.run(check_files)
+        except P4Error, e:
+            raise SCMError(str(e))
 
-        (res, errdata) = p.communicate()
-        failure = p.poll()
+        missing = {}
 
-        if failure:
-            error = errdata.splitlines()
-            # The command-line output is the same as the contents of a P4Error
-            # except they're prefixed with a line that says "Perforce client
-            # error:", and the lines of the error are indented with tabs.
-            if error[0].startswith("Perforce client error:"):
-                error = error[1:]
+        for warning in warnings:
+            if 'no such file' in warning or 'no file(s)' in warning:
+                for filespec in filespecs:
+                    if warning.startswith(filespec + ' '):
+                        missing[filespec] = True
+                        break
+                else:
+                    raise SCMError(warning)
 
-            raise SCMError('\n'.join(line.lstrip("\t") for line in error))
+        exists = []
+
+        for path, revision in files:
+            exists.append(revision != PRE_CREATION and
+                          self._get_filespec(path, revision) not in missing)
+
+        return exists
+
+    def _get_filespec(self, path, revision):
+        if revision == HEAD:
+            return path
         else:
-            return res
+            return '%s#%s' % (path, revision)
 
     def parse_diff_revision(self, file_str, revision_str):
         # Perforce has this lovely idiosyncracy that diffs show revision #1 both
         # for pre-creation and when there's an actual revision.
-        self._connect()
-
         filename, revision = revision_str.rsplit('#', 1)
-        files = self.p4.run_files(revision_str)
+        files = self.pool.run(lambda p4: p4.run_files(revision_str))
 
         if len(files) == 0:
             revision = PRE_CREATION
 
-        self._disconnect()
-
         return filename, revision
 
     def get_filenames_in_revision(self, revision):
@@ -1,4 +1,5 @@
 import re
+import threading
 import urllib
 import urlparse
 import os
@@ -13,7 +14,8 @@ from django.utils.translation import ugettext as _
 from reviewboard.diffviewer.parser import DiffParser
 from reviewboard.scmtools import sshutils
 from reviewboard.scmtools.certs import Certificate
-from reviewboard.scmtools.core import SCMTool, HEAD, PRE_CREATION, UNKNOWN
+from reviewboard.scmtools.core import SCMTool, HEAD, PRE_CREATION, UNKNOWN, \
+                                      map_concurrently
 from reviewboard.scmtools.errors import SCMError, \
                                         FileNotFoundError, \
                                         UnverifiedCertificateError, \
@@ -73,12 +75,11 @@ class SVNTool(SCMTool):
 
         SCMTool.__init__(self, repository)
 
-        import pysvn
-        self.client = pysvn.Client()
-        if repository.username:
-            self.client.set_default_username(str(repository.username))
-        if repository.password:
-            self.client.set_default_password(str(repository.password))
+        self.client = self._create_client()
+
+        # pysvn clients can't be shared between threads, so files_exist
+        # creates one for each thread it uses.
+        self._thread_clients = threading.local()
 
         # svnlook uses 'rev 0', while svn diff uses 'revision 0'
         self.revision_re = re.compile("""
@@ -102,17 +103,7 @@ class SVNTool(SCMTool):
             raise FileNotFoundError(path, revision)
 
         try:
-            normpath = self.__normalize_path(path)
-
-            # SVN expects to have URLs escaped. Take care to only
-            # escape the path part of the URL.
-            if self.client.is_url(normpath):
-                pathtuple = urlparse.urlsplit(normpath)
-                normpath = urlparse.urlunsplit((pathtuple[0],
-                                                pathtuple[1],
-                                                urllib.quote(pathtuple[2]),
-                                                '',''))
-
+            normpath = self.__normalize_url(path, self.client)
             normrev  = self.__normalize_revision(revision)
 
             data = self.client.cat(normpath, normrev)
@@ -128,19 +119,65 @@ class SVNTool(SCMTool):
 
             return data
         except ClientError, e:
-            stre = str(e)
-            if 'File not found' in stre or 'path not found' in stre:
-                raise FileNotFoundError(path, revision, str(e))
-            elif 'callback_ssl_server_trust_prompt required' in stre:
-                home = os.path.expanduser('~')
-                raise SCMError(
-                    'HTTPS certificate not accepted.  Please ensure that '
-                    'the proper certificate exists in %s/.subversion/auth '
-                    'for the user that reviewboard is running as.' % home)
-            elif 'callback_get_login required' in stre:
-                raise SCMError('Login to the SCM server failed.')
-            else:
-                raise SCMError(e)
+            self.__raise_client_error(e, path, revision)
+
+    def files_exist(self, files):
+        """
+        Checks whether several files exist, using several connections to
+        the repository at once.
+        """
+        return map_concurrently(lambda file: self.__file_exists(*file),
+                                files)
+
+    def __file_exists(self, path, revision):
+        if not path or revision == PRE_CREATION:
+            return False
+
+        client = getattr(self._thread_clients, 'client', None)
+
+        if client is None:
+            client = self._create_client()
+            self._thread_clients.client = client
+
+        try:
+            client.info2(self.__normalize_url(path, client),
+                         revision=self.__normalize_revision(revision),
+                         recurse=False)
+            return True
+        except ClientError, e:
+            try:
+                self.__raise_client_error(e, path, revision)
+            except FileNotFoundError:
+                return False
+
+    def _create_client(self):
+        import pysvn
+        client = pysvn.Client()
+        if self.repository.username:
+            client.set_default_username(str(self.repository.username))
+        if self.repository.password:
+            client.set_default_password(str(self.repository.password))
+
+        return client
+
+    def __raise_client_error(self, e, path, revision):
+        """
+        Raises the appropriate error for a ClientError from pysvn.
+        """
+        stre = str(e)
+        if 'File not found' in stre or 'path not found' in stre or \
+           'non-existent' in stre:
+            raise FileNotFoundError(path, revision, str(e))
+        elif 'callback_ssl_server_trust_prompt required' in stre:
+            home = os.path.expanduser('~')
+            raise SCMError(
+                'HTTPS certificate not accepted.  Please ensure that '
+                'the proper certificate exists in %s/.subversion/auth '
+                'for the user that reviewboard is running as.' % home)
+        elif 'callback_get_login required' in stre:
+            raise SCMError('Login to the SCM server failed.')
+        else:
+            raise SCMError(e)
 
     def collapse_keywords(self, data, keyword_str):
         """
@@ -236,6 +273,20 @@ class SVNTool(SCMTool):
 
         return r
 
+    def __normalize_url(self, path, client):
+        normpath = self.__normalize_path(path)
+
+        # SVN expects to have URLs escaped. Take care to only
+        # escape the path part of the URL.
+        if client.is_url(normpath):
+            pathtuple = urlparse.urlsplit(normpath)
+            normpath = urlparse.urlunsplit((pathtuple[0],
+                                            pathtuple[1],
+                                            urllib.quote(pathtuple[2]),
+                                            '',''))
+
+        return normpath
+
     def __normalize_path(self, path):
         if path.startswith(self.repopath):
             return path
@@ -13,7 +13,8 @@ except ImportError:
 from reviewboard.diffviewer.diffutils import patch
 from reviewboard.diffviewer.parser import DiffParserError
 from reviewboard.scmtools.core import HEAD, PRE_CREATION, ChangeSet, Revision
-from reviewboard.scmtools.errors import SCMError, FileNotFoundError
+from reviewboard.scmtools.errors import SCMError, FileNotFoundError, \
+                                      FilesNotFoundError
 from reviewboard.scmtools.models import Repository, Tool
 
 
@@ -32,6 +33,21 @@ class CoreTests(DjangoTestCase):
         self.assert_(len(cs.bugs_closed) == 0)
         self.assert_(len(cs.files) == 0)
 
+    def testFilesNotFoundError(self):
+        """Testing FilesNotFoundError messages"""
+        e = FilesNotFoundError([('/a', HEAD)])
+        self.assertEqual(e.path, '/a')
+        self.assertEqual(str(e),
+                         "The file '/a' could not be found in the repository")
+
+        e = FilesNotFoundError([('/a', '1'), ('/b', HEAD)])
+        self.assertEqual(e.path, '/a')
+        self.assertEqual(e.revision, '1')
+        self.assertEqual(e.files, [('/a', '1'), ('/b', HEAD)])
+        self.assertEqual(str(e),
+                         "The following files could not be found in the "
+                         "repository: '/a' (r1), '/b'")
+
 
 class CVSTests(DjangoTestCase):
     """Unit tests for CVS."""
@@ -870,3 +886,52 @@ class GitTests(DjangoTestCase):
                           lambda: self.tool.get_file("hello", "0000000"))
         self.assertRaises(FileNotFoundError,
                           lambda: self.tool.get_file("readme", "0000000"))
+
+    def testCatFilePoolRestart(self):
+        """Testing that the git cat-file pool replaces dead processes"""
+        from reviewboard.scmtools.git import GitCatFilePool
+
+        pool = GitCatFilePool(self.tool.client.git_dir, size=1)
+
+        try:
+            self.assertEqual(pool.request("e965047"), ('blob', 'Hello\n'))
+
+            # Stop the process behind the pool's back.
+            process = pool._idle[0]
+            process.close()
+
+            self.assertEqual(pool.request("d6613f5"),
+                             ('blob', 'Hello there\n'))
+            self.assertRaises(FileNotFoundError,
+                              lambda: pool.request("0000000"))
+
+            stats = pool.get_stats()
+            self.assertEqual(stats['requests'], 3)
+            self.assertEqual(stats['restarts'], 1)
+        finally:
+            pool.close()
+
+    def testGetFiles(self):
+        """Testing GitTool.get_files"""
+        self.assertEqual(self.tool.get_files([("readme", PRE_CREATION),
+                                              ("readme", "e965047"),
+                                              ("readme", "d6613f5"),
+                                              ("readme", HEAD)]),
+                         ['', 'Hello\n', 'Hello there\n', 'Hello there\n'])
+        self.assertEqual(self.tool.get_files([]), [])
+
+        self.assertRaises(FileNotFoundError,
+                          lambda: self.tool.get_files([("readme", "e965047"),
+                                                       ("hello", HEAD)]))
+        self.assertRaises(SCMError,
+                          lambda: self.tool.get_files([("readme", "a62df6c")]))
+
+    def testFilesExist(self):
+        """Testing GitTool.files_exist"""
+        self.assertEqual(self.tool.files_exist([("readme", "e965047"),
+                                                ("readme", PRE_CREATION),
+                                                ("hello", HEAD),
+                                                ("readme", HEAD),
+                                                ("readme", "0000000")]),
+                         [True, False, False, True, False])
+        self.assertEqual(self.tool.files_exist([]), [])
@@ -126,6 +126,14 @@ AUTH_PROFILE_MODULE = "accounts.Profile"
 # CACHE_BACKEND is specified in settings_local.py
 CACHE_EXPIRATION_TIME = 60 * 60 * 24 * 30 # 1 month
 
+# The number of long-running git-cat-file processes each server process keeps
+# per local Git repository. Requests beyond this wait for a free process.
+GIT_CAT_FILE_POOL_SIZE = 4
+
+# The number of connections each server process keeps open to a Perforce
+# server for each user. Requests beyond this wait for a free connection.
+P4_CONNECTION_POOL_SIZE = 4
+
 # Custom test runner, which uses nose to find tests and execute them.  This
 # gives us a somewhat more comprehensive test execution than django's built-in
 # runner, as well as some special features like a code coverage report.
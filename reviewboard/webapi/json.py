@@ -1,6 +1,7 @@
 from datetime import datetime
 import os.path
 import re
+import time
 
 from django.conf import settings
 from django.contrib import auth
@@ -11,7 +12,6 @@ from django.db.models import Q
 from django.http import Http404, HttpResponseForbidden
 from django.shortcuts import get_object_or_404
 from django.template.defaultfilters import timesince
-from django.utils.translation import ugettext as _
 from django.views.decorators.http import require_POST
 
 from djblets.siteconfig.models import SiteConfiguration
@@ -31,11 +31,14 @@ from reviewboard import get_version_string, get_package_version, is_release
 from reviewboard.accounts.models import Profile
 from reviewboard.diffviewer.forms import UploadDiffForm, EmptyDiffError
 from reviewboard.diffviewer.models import FileDiff, DiffSet
+from reviewboard.reviews.counts import invalidate_user_counts
 from reviewboard.reviews.forms import UploadScreenshotForm
 from reviewboard.reviews.errors import PermissionError
 from reviewboard.reviews.models import ReviewRequest, Review, Group, Comment, \
-                                       ReviewRequestDraft, Screenshot, \
+                                       ReviewRequestDraft, \
+                                       ReviewRequestRecipient, Screenshot, \
                                        ScreenshotComment
+from reviewboard.reviews.updates import wait_for_update
 from reviewboard.scmtools.core import FileNotFoundError
 from reviewboard.scmtools.errors import ChangeNumberInUseError, \
                                         EmptyChangeSetError, \
@@ -494,31 +497,50 @@ def review_request_last_update(request, review_request_id):
     if not review_request.is_accessible_by(request.user):
         return WebAPIResponseError(request, PERMISSION_DENIED)
 
-    timestamp, updated_object = review_request.get_last_activity()
-    user = None
-    summary = None
-    update_type = None
-
-    if isinstance(updated_object, ReviewRequest):
-        user = updated_object.submitter
-        summary = _("Review request updated")
-        update_type = "review-request"
-    elif isinstance(updated_object, DiffSet):
-        summary = _("Diff updated")
-        update_type = "diff"
-    elif isinstance(updated_object, Review):
-        user = updated_object.user
-
-        if updated_object.is_reply():
-            summary = _("New reply")
-            update_type = "reply"
-        else:
-            summary = _("New review")
-            update_type = "review"
+    return _get_last_update_response(request, review_request)
+
+
+@webapi_check_login_required
+def review_request_wait_for_update(request, review_request_id):
+    """
+    Waits for an update to the specified review request and returns it.
+
+    This is a long-polling version of review_request_last_update. The
+    client passes the timestamp of the last update it knows about as
+    'since', and the response is sent as soon as there's a newer one, or
+    after updates.WAIT_TIMEOUT seconds if there isn't.
+    """
+    review_request = get_object_or_404(ReviewRequest, pk=review_request_id)
+
+    if not review_request.is_accessible_by(request.user):
+        return WebAPIResponseError(request, PERMISSION_DENIED)
+
+    since = None
+
+    for date_format in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            since = datetime(*time.strptime(request.GET.get('since', ''),
+                                            date_format)[:6])
+            break
+        except ValueError:
+            pass
+
+    if since is not None and wait_for_update(review_request.id, since):
+        review_request = get_object_or_404(ReviewRequest,
+                                           pk=review_request_id)
+
+    return _get_last_update_response(request, review_request)
+
+
+def _get_last_update_response(request, review_request):
+    timestamp, update_type = review_request.get_last_activity()
+
+    if update_type == ReviewRequest.ACTIVITY_REVIEW_REQUEST:
+        user = review_request.last_activity_user or review_request.submitter
     else:
-        # Should never be able to happen. The object will always at least
-        # be a ReviewRequest.
-        assert False
+        user = review_request.last_activity_user
+
+    summary = unicode(dict(ReviewRequest.ACTIVITY_TYPES)[update_type])
 
     return WebAPIResponse(request, {
         'timestamp': timestamp,
@@ -555,6 +577,9 @@ def review_request_star(request, review_request_id):
     profile, profile_is_new = Profile.objects.get_or_create(user=request.user)
     profile.starred_review_requests.add(review_request)
     profile.save()
+    invalidate_user_counts([request.user.id])
+    ReviewRequestRecipient.objects.update_for_review_request(
+        review_request)
 
     return WebAPIResponse(request)
 
@@ -571,6 +596,9 @@ def review_request_unstar(request, review_request_id):
     if not profile_is_new:
         profile.starred_review_requests.remove(review_request)
         profile.save()
+        invalidate_user_counts([request.user.id])
+        ReviewRequestRecipient.objects.update_for_review_request(
+            review_request)
 
     return WebAPIResponse(request)
 
@@ -1280,7 +1308,15 @@ def new_diff(request, review_request_id):
     except FileNotFoundError, e:
         return WebAPIResponseError(request, REPO_FILE_NOT_FOUND, {
             'file': e.path,
-            'revision': e.revision
+            'revision': e.revision,
+            'files': [
+                {
+                    'file': path,
+                    'revision': revision,
+                }
+                for path, revision in getattr(e, 'files',
+                                              [(e.path, e.revision)])
+            ],
         })
     except EmptyDiffError, e:
         return WebAPIResponseError(request, INVALID_FORM_DATA, {